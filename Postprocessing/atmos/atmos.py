@@ -642,44 +642,73 @@ class AtmosPostProc(control.RunPostProc):
     def do_transform(self, finalcycle=False):
         '''
         Function to perform requested transformation of fieldsfiles.
+        Cutout and conversion to pp format, which run external utilities,
+        are performed on up to utils.max_subprocesses() files concurrently.
+        Extraction to netCDF uses Iris, which is not thread-safe, so each
+        file is passed for extraction in turn as its earlier stages complete.
         '''
         # Get files which are available to archive, and thus eligible
         # for transform operations.
-        for fname in self.diags_to_process(finalcycle):
-            # fname returned by diags_to_process always includes the full path
-            basename = os.path.basename(fname)
+        fnames = self.diags_to_process(finalcycle)
 
-            if not fname.endswith('.pp'):
-                if self.ff_match(self.cutout_streams, filename=basename):
-                    _ = transform.cutout_subdomain(
+        transformed = utils.map_concurrent(
+            lambda fname: self._transform_fieldsfile(fname, finalcycle), fnames
+            )
+        try:
+            for fname in transformed:
+                self._extract_fieldsfile(fname)
+        finally:
+            # Following a failure no more files are started.  Files already
+            # in progress are completed before the error is raised.
+            transformed.close()
+
+    def _transform_fieldsfile(self, fname, finalcycle):
+        '''
+        Perform the cutout and pp conversion stages of do_transform on a
+        single file, as requested for its stream.
+        Returns the filename to be used by subsequent stages.
+        '''
+        # fname returned by diags_to_process always includes the full path
+        basename = os.path.basename(fname)
+
+        if not fname.endswith('.pp'):
+            if self.ff_match(self.cutout_streams, filename=basename):
+                _ = transform.cutout_subdomain(
+                    fname,
+                    self.naml.atmospp.mule_utils,
+                    self.naml.atmospp.cutout_coords_type,
+                    self.naml.atmospp.cutout_coords
+                    )
+
+            if self.naml.atmospp.convert_pp:
+                if self.ff_match(self.convpp_streams, filename=basename):
+                    fname = transform.convert_to_pp(
                         fname,
+                        self.naml.atmospp.um_utils,
                         self.naml.atmospp.mule_utils,
-                        self.naml.atmospp.cutout_coords_type,
-                        self.naml.atmospp.cutout_coords
+                        finalcycle is True
                         )
+        return fname
 
-                if self.naml.atmospp.convert_pp:
-                    if self.ff_match(self.convpp_streams, filename=basename):
-                        fname = transform.convert_to_pp(
-                            fname,
-                            self.naml.atmospp.um_utils,
-                            self.naml.atmospp.mule_utils,
-                            finalcycle is True
-                            )
-
-            # Ensure previously created pp files are picked up from here on
-            if basename.endswith('.pp'):
-                basename = basename[:-3]
-
-            if self.ff_match(self.netcdf_streams, basename):
-                icode = transform.extract_to_netcdf(
-                    fname, self.netcdf_fields,
-                    self.naml.atmospp.netcdf_filetype,
-                    self.naml.atmospp.netcdf_compression
-                    )
-                if icode != 0:
-                    msg = 'do_transform - Field extraction to netCDF failed'
-                    utils.log_msg(msg, level='ERROR')
+    def _extract_fieldsfile(self, fname):
+        '''
+        Perform the netCDF extraction stage of do_transform on a single
+        file, as requested for its stream.
+        '''
+        basename = os.path.basename(fname)
+        # Ensure previously created pp files are picked up from here on
+        if basename.endswith('.pp'):
+            basename = basename[:-3]
+
+        if self.ff_match(self.netcdf_streams, basename):
+            icode = transform.extract_to_netcdf(
+                fname, self.netcdf_fields,
+                self.naml.atmospp.netcdf_filetype,
+                self.naml.atmospp.netcdf_compression
+                )
+            if icode != 0:
+                msg = 'do_transform - Field extraction to netCDF failed'
+                utils.log_msg(msg, level='ERROR')
 
     @timer.run_timer
     def do_archive(self, finalcycle=False):
@@ -689,9 +718,8 @@ class AtmosPostProc(control.RunPostProc):
         Optional argument: finalcycle=True when called from finalcycle_complete.
         '''
         # Open our log files
-        action = 'a' if os.path.exists(self.suite.logfile) else 'w'
         try:
-            log_file = open(self.suite.logfile, action)
+            log_file = self.suite.archive_log
         except IOError:
             utils.log_msg('Failed to open archive log file', level='FAIL')
 
@@ -713,8 +741,6 @@ class AtmosPostProc(control.RunPostProc):
             # Dumps are archived by first call to do_archive during final cycle
             files_to_archive += self.dumps_to_archive(log_file)
 
-        log_file.close()
-
         # Perform the archiving
         if files_to_archive:
             msg = 'Archiving the following files:\n'
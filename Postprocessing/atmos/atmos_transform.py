@@ -26,6 +26,8 @@ DESCRIPTION
 import os
 import re
 
+import numpy
+
 import utils
 import timer
 
@@ -77,27 +79,22 @@ if MULE_AVAIL:
             return field
 
         def transform(self, field_list, new_field):
-            ''' Perform the data manipulation '''
-            data_list = []
-            for field in field_list:
-                data_list.append(field.get_data())
-            if len(data_list) == len(self.weights):
-                data_out = sum([a * b for a, b
-                                in zip(data_list, self.weights)])
-                # Denominator must a float - we do not want integer divison
-                # rounding the data
-                data_out = data_out / float(sum(self.weights))
+            '''
+            Perform the data manipulation.  The data of each field is read
+            in turn and accumulated, so that only one component is held in
+            memory at a time: See weighted_mean.
+            '''
+            if len(field_list) == len(self.weights):
+                weights = self.weights
             else:
-                data_out = sum(data_list)/float(len(data_list))
+                weights = [1] * len(field_list)
 
             # If the first field defines MDI, reset missing points from
             # any of the original fields back to MDI in the output
-            if hasattr(field_list[0], "bmdi"):
-                mdi = field_list[0].bmdi
-                for i in range(len(field_list)):
-                    data_out[(data_list[i] == mdi)] = mdi
+            mdi = getattr(field_list[0], 'bmdi', None)
 
-            return data_out
+            return weighted_mean((field.get_data() for field in field_list),
+                                 weights, mdi=mdi)
 
 
 @timer.run_timer
@@ -284,6 +281,45 @@ def extract_to_pp(sourcefiles, fields, outstream, data_freq=None):
 
     return 0 if tmpfile else None
 
+
+# Lookup header words identifying a field extracted to PP format
+PP_MATCH_WORDS = [x for x in range(46) if x not in [15, 21, 29, 30, 40]]
+
+# Cache of lookup keys for fields of source files extracted to PP format:
+#    {filename: (modification time, {field position: key})}
+_SOURCE_LOOKUP_KEYS = {}
+
+
+def pp_lookup_key(field):
+    '''
+    Return a hashable key identifying a UM field from the integer constants
+    in its lookup header.  Reals are excluded since they may differ between
+    64bit fieldsfile source and 32bit ppfile output, as is data length and
+    address info:
+       15=LBLREC, 21=LBPACK, 29=LBEGIN, 30=LBNREC, 40=NADDR
+    '''
+    raw = field.raw
+    return tuple(raw[x] for x in PP_MATCH_WORDS)
+
+
+def _source_lookup_keys(sourcefile):
+    '''
+    Return the cache of lookup keys, by field position, for the given
+    source file.  The cache is reused by subsequent extractions from the
+    same file for as long as its size and modification time are unchanged.
+    Entries for source files which have since been removed are discarded.
+    '''
+    for fname in [f for f in _SOURCE_LOOKUP_KEYS if not os.path.exists(f)]:
+        del _SOURCE_LOOKUP_KEYS[fname]
+
+    stat = os.stat(sourcefile)
+    signature = (stat.st_size, getattr(stat, 'st_mtime_ns', stat.st_mtime))
+    if sourcefile not in _SOURCE_LOOKUP_KEYS or \
+            _SOURCE_LOOKUP_KEYS[sourcefile][0] != signature:
+        _SOURCE_LOOKUP_KEYS[sourcefile] = (signature, {})
+    return _SOURCE_LOOKUP_KEYS[sourcefile][1]
+
+
 @timer.run_timer
 def _extract_to_pp_mule(sourcefiles, fields, outfile, data_freq):
     r'''
@@ -304,15 +340,16 @@ def _extract_to_pp_mule(sourcefiles, fields, outfile, data_freq):
         output_items = fields_from_pp_file(outfile)
     except FileNotFoundError:
         output_items = []
+    output_index = {}
+    for field_id, field in enumerate(output_items):
+        output_index.setdefault(pp_lookup_key(field), field_id)
 
-    # Compare integer constants in lookup only, since reals may differ between
-    # 64bit fieldsfile source and 32bit ppfile output.
-    # Exclude data length and address info:
-    #    15=LBLREC, 21=LBPACK, 29=LBEGIN, 30=LBNREC, 40=NADDR
-    match_int_consts = [x for x in range(46) if x not in [15, 21, 29, 30, 40]]
+    duplicates = 0
     for sfile in sourcefiles:
         new_fields = []
-        for field in mule.FieldsFile.from_file(sfile).fields:
+        source_keys = _source_lookup_keys(sfile)
+        for position, field in \
+                enumerate(mule.FieldsFile.from_file(sfile).fields):
             if field.lbrel not in (2, 3) or field.lbuser4 not in stashcodes:
                 # Exclude fields not matching requested STASHcode
                 continue
@@ -338,17 +375,23 @@ def _extract_to_pp_mule(sourcefiles, fields, outfile, data_freq):
                     continue
 
             # Check we're not duplicating the field
-            for field_id, existing_field in enumerate(output_items[:]):
-                for raw_id in match_int_consts:
-                    if field.raw[raw_id] != existing_field.raw[raw_id]:
-                        break
-                else:
-                    # Replace existing field
-                    output_items[field_id] = field
-                    break
+            if position not in source_keys:
+                source_keys[position] = pp_lookup_key(field)
+            field_id = output_index.get(source_keys[position])
+            if field_id is None:
+                new_fields.append((source_keys[position], field))
             else:
-                new_fields.append(field)
-        output_items += new_fields
+                # Replace existing field
+                output_items[field_id] = field
+                duplicates += 1
+
+        for key, field in new_fields:
+            output_index.setdefault(key, len(output_items))
+            output_items.append(field)
+
+    if duplicates > 0:
+        utils.log_msg('Replaced {} duplicate field(s) in {}'.
+                      format(duplicates, outfile), level='INFO')
 
     if len(output_items) > 0:
         tmpfile = os.path.basename(outfile)
@@ -470,6 +513,138 @@ def cutout_subdomain(full_fname, mule_utils, coord_type, coords):
     return icode
 
 
+# Lookup header entries identifying corresponding fields in the component
+# files of a mean: STASH code, level, pseudo-level and time processing code
+MEAN_MATCH_KEYS = ('lbuser4', 'lblev', 'lbuser5', 'lbproc')
+
+
+def _lookup_keys(fields):
+    '''
+    Return the indices of valid fields (lbrel=2 or 3) in the given list,
+    and an integer array of their lookup header match keys.  The final
+    column of the array counts prior occurrences of the same key within
+    the list, so that repeated keys (eg. multiple validity times) are
+    matched in order.
+    '''
+    table = numpy.array(
+        [[field.lbrel] + [getattr(field, key) for key in MEAN_MATCH_KEYS]
+         for field in fields], dtype=numpy.int64
+        ).reshape(-1, len(MEAN_MATCH_KEYS) + 1)
+    valid = numpy.flatnonzero(numpy.isin(table[:, 0], (2, 3)))
+    keys = table[valid, 1:]
+
+    occurrence = numpy.zeros(len(keys), dtype=numpy.int64)
+    if len(keys) > 0:
+        _, group = numpy.unique(keys, axis=0, return_inverse=True)
+        group = group.ravel()
+        order = numpy.argsort(group, kind='mergesort')
+        starts = numpy.flatnonzero(numpy.diff(group[order])) + 1
+        first = numpy.zeros(len(keys), dtype=numpy.int64)
+        first[starts] = starts
+        occurrence[order] = numpy.arange(len(keys)) - \
+            numpy.maximum.accumulate(first)
+    return valid, numpy.column_stack((keys, occurrence))
+
+
+def match_um_fields(umfiles, filenames=None):
+    '''
+    Match the fields of each of the given UM files with those of the first
+    file, using the lookup header keys in MEAN_MATCH_KEYS.  Fields absent
+    from, or additional to, the first file are reported.
+    Arguments:
+        umfiles   <type list> Objects with a "fields" list attribute
+    Optional arguments:
+        filenames <type list> Names of the files, for reporting purposes
+    Returns a list of matched fields, one list per valid field of the first
+    file, ordered as the given files.
+    '''
+    if filenames is None:
+        filenames = ['file {}'.format(i) for i in range(len(umfiles))]
+    indices = []
+    keys = []
+    for umfile in umfiles:
+        valid, filekeys = _lookup_keys(umfile.fields)
+        indices.append(valid)
+        keys.append(filekeys)
+
+    # Index each unique key to a column of the match table, holding the
+    # position of the corresponding field in each file (-1 if absent)
+    unique_keys, key_ids = numpy.unique(numpy.concatenate(keys), axis=0,
+                                        return_inverse=True)
+    key_ids = key_ids.ravel()
+    table = numpy.full((len(umfiles), len(unique_keys)), -1, dtype=numpy.int64)
+    start = 0
+    for i, valid in enumerate(indices):
+        table[i, key_ids[start:start + len(valid)]] = valid
+        start += len(valid)
+
+    in_first = table[0] >= 0
+    for i, fname in enumerate(filenames[1:], start=1):
+        missing = in_first & (table[i] < 0)
+        extra = ~in_first & (table[i] >= 0)
+        for unmatched, msg in [
+                (missing, '{} field(s) of {} missing from {}'.format(
+                    missing.sum(), filenames[0], fname)),
+                (extra, '{} field(s) of {} not in {}'.format(
+                    extra.sum(), fname, filenames[0]))
+                ]:
+            if unmatched.any():
+                msg += ' ({}): '.format(','.join(MEAN_MATCH_KEYS))
+                msg += ' '.join('({})'.format(','.join(str(k) for k in
+                                                       key[:-1]))
+                                for key in unique_keys[unmatched])
+                utils.log_msg('match_um_fields: ' + msg, level='WARN')
+
+    matched = []
+    ref_ids = key_ids[:len(indices[0])]
+    for column in table[:, ref_ids].T:
+        matched.append([umfile.fields[index] for umfile, index in
+                        zip(umfiles, column) if index >= 0])
+    return matched
+
+
+def weighted_mean(arrays, weights, mdi=None):
+    '''
+    Return the weighted mean of a sequence of arrays.  The arrays are
+    accumulated one at a time into a float64 total and a count of valid
+    points, and each is released before the next is read.  Peak memory is
+    therefore bounded at 28 bytes per point (total 8, valid count 4, one
+    component of up to 8 and its weighted product 8), regardless of the
+    number of components.
+    Arguments:
+        arrays  <type iterable> Component arrays, one per weight.  May be a
+                                generator, reading each array as required.
+        weights <type list> Weight of each component
+    Optional arguments:
+        mdi     Missing data indicator.  Points which are missing in any
+                component are missing in the mean.
+    Returns the mean array, of the same type as the components if they are
+    floating point, otherwise float64.
+    '''
+    total = valid = dtype = None
+    count = 0
+    for data, weight in zip(arrays, weights):
+        data = numpy.asarray(data)
+        if total is None:
+            total = numpy.zeros(data.shape, dtype=numpy.float64)
+            valid = numpy.zeros(data.shape, dtype=numpy.int32)
+            dtype = data.dtype
+        total += data * weight
+        if mdi is not None:
+            valid += data != mdi
+        count += 1
+        del data
+
+    # Denominator must a float - we do not want integer divison
+    # rounding the data
+    total /= float(sum(weights[:count]))
+    if mdi is not None:
+        total[valid < count] = mdi
+    if numpy.issubdtype(dtype, numpy.floating):
+        total = total.astype(dtype, copy=False)
+    return total
+
+
 @timer.run_timer
 def create_um_mean(meanfile):
     '''
@@ -503,9 +678,13 @@ def create_um_mean(meanfile):
         mean_operator = WeightedMeanOperator(weights)
 
         # Load component files into Mule, and sort into date order
-        load_mule = [mule.load_umfile(f) for f in meanfile.component_files]
-        load_mule.sort(key=lambda x: list(x.fixed_length_header.raw[28:34]),
-                       reverse=True)
+        load_mule = [(mule.load_umfile(f), f) for f in
+                     meanfile.component_files]
+        load_mule.sort(
+            key=lambda x: list(x[0].fixed_length_header.raw[28:34]),
+            reverse=True
+            )
+        load_mule, component_files = [list(x) for x in zip(*load_mule)]
 
         ff_out = load_mule[0].copy()
 
@@ -525,26 +704,10 @@ def create_um_mean(meanfile):
         # Update t2 date (end of period) in the fixed-length header
         ff_out.fixed_length_header.raw[28:35] = fixhd
 
-        for field in load_mule[0].fields[:]:
-            if field.lbrel not in (2, 3):
-                # Ignore invalid field
-                continue
-
-            # Update field headers
-            meanfields = [field]
-            for component in load_mule[1:]:
-                for newfield in component.fields[:]:
-                    if newfield.lbrel not in (2, 3):
-                        component.fields.remove(newfield)
-                    elif ((field.lbuser4 == newfield.lbuser4) and
-                          (field.lblev == newfield.lblev)):
-                        # Update field t1 (validity time) to match 1st file
-                        meanfields[0].raw[1:7] = newfield.raw[1:7]
-                        meanfields.append(newfield)
-                        component.fields.remove(newfield)
-                        break
-
+        for meanfields in match_um_fields(load_mule, component_files):
             if len(meanfields) > 1:
+                # Update field t1 (validity time) to match earliest file
+                meanfields[0].raw[1:7] = meanfields[-1].raw[1:7]
                 # Perform the meaning
                 ff_out.fields.append(mean_operator(meanfields))
 
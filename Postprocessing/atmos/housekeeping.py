@@ -27,6 +27,7 @@ from collections import OrderedDict
 
 import timer
 import utils
+import archive_log
 
 # Constants
 FILETYPE = OrderedDict([
@@ -47,7 +48,9 @@ REGEX = 1
 def read_arch_logfile(logfile, prefix, inst, mean, ncfile):
     '''
     Read the archiving script log file, and identify the lines corresponding
-    to dumps, instantaneous pp files, and mean pp files, and separate
+    to dumps, instantaneous pp files, and mean pp files, and separate.
+    Where available, the archive log index is queried for the files of
+    interest in place of reading the text log.
     Arguments:
       logfile <type str> Full file path and name of the archive log file
       prefix  <type str> RUNID environment variable
@@ -63,26 +66,33 @@ def read_arch_logfile(logfile, prefix, inst, mean, ncfile):
             # Pre Python version 3.3
             del FILETYPE[ftype][RTN][:]
 
-    with open(logfile, 'r') as log_fh:
-        for line in log_fh.readlines():
-            if line.strip() == '':
-                continue
-            fname, tag = line.split(' ', 1)
-            tag = 'FAILED' not in tag
-            for ftype in FILETYPE:
-                if ftype == 'pp_inst_names':
-                    stream = inst
-                elif ftype == 'pp_mean_names':
-                    stream = mean
-                elif ftype == 'nc_names':
-                    # ncfile could potentially be of NoneType - cast to string
-                    stream = str(ncfile)
-                else:
-                    stream = ''
+    if archive_log.index_available(logfile):
+        # Select only those files which may match FILETYPE from the index
+        with archive_log.ArchiveLog(logfile, readonly=True) as arch_log:
+            entries = arch_log.entries(
+                prefixes=[prefix + 'a.', 'atmos_{}a_'.format(prefix.lower())]
+                )
+    else:
+        with open(logfile, 'r') as log_fh:
+            entries = [line.split(' ', 1) for line in log_fh.readlines()
+                       if line.strip() != '']
+
+    for fname, tag in entries:
+        tag = 'FAILED' not in tag
+        for ftype in FILETYPE:
+            if ftype == 'pp_inst_names':
+                stream = inst
+            elif ftype == 'pp_mean_names':
+                stream = mean
+            elif ftype == 'nc_names':
+                # ncfile could potentially be of NoneType - cast to string
+                stream = str(ncfile)
+            else:
+                stream = ''
 
-                if  FILETYPE[ftype][REGEX](prefix, stream).\
-                    search(os.path.basename(fname)):
-                    FILETYPE[ftype][RTN].append((fname, tag))
+            if  FILETYPE[ftype][REGEX](prefix, stream).\
+                search(os.path.basename(fname)):
+                FILETYPE[ftype][RTN].append((fname, tag))
 
     return tuple(FILETYPE[ftype][RTN] for ftype in FILETYPE)
 
@@ -22,6 +22,8 @@ DESCRIPTION
 import os
 import re
 
+import numpy
+
 import timer
 import utils
 
@@ -35,6 +37,16 @@ except ImportError:
     MULE_AVAIL = False
 
 VALID_STR = '[pm][a-z1-9]'
+
+# UM fixed-length header: Length, and (1-based) positions of the lookup
+# table start address and dimensions
+FIXHD_LENGTH = 256
+FIXHD_LOOKUP = 150
+LOOKUP_DIM1 = 64
+
+# Cache of fixed-length header information:
+#    {filename: ((size, modification time), (headers, empty_file))}
+_HEADER_CACHE = {}
 MONTHS = [None, 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug',
           'sep', 'oct', 'nov', 'dec']
 SEASONS = [None] + [''.join([c[0] for c in (MONTHS + MONTHS[1:])[m:m+3]])
@@ -175,7 +187,9 @@ def verify_header(atmospp, fname, logdir, logfile=None):
     Returns True/False dependent on whether the (year, month, day) of the
     filename matches the validity time in the UM fixed header
     '''
-    headers, empty_file = mule_headers(fname)
+    headers, empty_file = fixed_headers(fname)
+    if not headers:
+        headers, empty_file = mule_headers(fname)
     if not headers:
         # Mule not available, or else failed to extract the headers. Try pumf
         pumfout = logdir + '-pumfhead.out'
@@ -273,6 +287,60 @@ def genlist(ppfile, header, pumfpath):
         utils.log_msg(msg.format(ppfile), level='ERROR')
 
 
+@timer.run_timer
+def fixed_headers(filename):
+    '''
+    Generate a dictionary of key-value pairs from the fixed-length
+    header of a given UM fieldsfile, reading only the header and the first
+    word of each lookup entry up to the first entry in use.  The byte order
+    and word size of the file are determined from the lookup dimensions in
+    the header.
+    Results are cached by filename, file size and modification time.
+    Returns (None, False) where the file is not a recognisable UM file.
+    '''
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None, False
+    signature = (stat.st_size,
+                 getattr(stat, 'st_mtime_ns', stat.st_mtime))
+    cached = _HEADER_CACHE.get(filename)
+    if cached and cached[0] == signature:
+        return cached[1]
+
+    headers = None
+    empty_file = False
+    with open(filename, 'rb') as umfile:
+        buff = umfile.read(FIXHD_LENGTH * 8)
+        for dtype in [numpy.dtype(d) for d in ('>i8', '<i8', '>i4', '<i4')]:
+            if len(buff) < FIXHD_LENGTH * dtype.itemsize:
+                continue
+            fixhd = numpy.frombuffer(buff, dtype=dtype, count=FIXHD_LENGTH)
+            lookup_start, dim1, dim2 = fixhd[FIXHD_LOOKUP - 1:
+                                             FIXHD_LOOKUP + 2]
+            if dim1 == LOOKUP_DIM1 and lookup_start > FIXHD_LENGTH:
+                break
+        else:
+            return None, False
+
+        # Extract first 40 values only
+        headers = {h: int(fixhd[h - 1]) for h in range(1, 40)}
+
+        # Empty lookup entries are filled with -99
+        empty_file = True
+        for entry in range(max(dim2, 0)):
+            umfile.seek((lookup_start - 1 + entry * dim1) * dtype.itemsize)
+            buff = umfile.read(dtype.itemsize)
+            if len(buff) < dtype.itemsize:
+                break
+            if numpy.frombuffer(buff, dtype=dtype)[0] != -99:
+                empty_file = False
+                break
+
+    _HEADER_CACHE[filename] = (signature, (headers, empty_file))
+    return headers, empty_file
+
+
 @timer.run_timer
 def mule_headers(filename):
     '''
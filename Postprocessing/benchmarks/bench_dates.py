@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+'''
+*****************************COPYRIGHT******************************
+ (C) Crown copyright 2025 Met Office. All rights reserved.
+
+ Use, duplication or disclosure of this code is subject to the restrictions
+ as set forth in the licence. If no licence has been raised with this copy
+ of the code, the use, duplication or disclosure of it is strictly
+ prohibited. Permission to do so must first be obtained in writing from the
+ Met Office Information Asset Owner at the following address:
+
+ Met Office, FitzRoy Road, Exeter, Devon, EX1 3PB, United Kingdom
+*****************************COPYRIGHT******************************
+NAME
+    bench_dates.py
+
+DESCRIPTION
+    Micro-benchmark comparing the in-process calendar arithmetic of
+    utils.add_period_to_date with the external `isodatetime`/`rose date`
+    command for a series of monthly and sub-daily increments.
+
+USAGE
+    python bench_dates.py [-c CALENDAR] [-n NUMBER]
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), os.pardir, 'common'))
+
+import timer
+import utils
+
+
+def step_dates(datefunc, cal, number):
+    '''
+    Step a date forwards `number` times, alternating between a one month
+    and a 6 hourly increment.  Return the final date and the elapsed time.
+    '''
+    date = [1978, 9, 1, 0, 0]
+    start = time.time()
+    for i in range(number):
+        delta = [0, 1, 0, 0, 0] if i % 2 else [0, 0, 0, 6, 0]
+        date = datefunc(date, delta, cal)
+    return date, time.time() - start
+
+
+def main():
+    '''Main function'''
+    parser = argparse.ArgumentParser(description=__doc__.split('DESCRIPTION')
+                                     [-1].split('USAGE')[0].strip())
+    parser.add_argument('-c', '--calendar', default='gregorian',
+                        help='Calendar (default: gregorian)')
+    parser.add_argument('-n', '--number', type=int, default=200,
+                        help='Number of date increments (default: 200)')
+    args = parser.parse_args()
+
+    timer.set_nulltimer()
+    native, native_time = step_dates(utils._mod_calendar_date,
+                                     args.calendar, args.number)
+    print('In-process: {:8.4f}s {}'.format(native_time, native))
+
+    if utils.get_utility_avail('isodatetime') or \
+            utils.get_utility_avail('rose'):
+        external, external_time = step_dates(utils._mod_all_calendars_date,
+                                             args.calendar, args.number)
+        print('External:   {:8.4f}s {}'.format(external_time, external))
+        print('Speed-up:   {:8.1f}x'.format(external_time /
+                                           max(native_time, 1e-9)))
+    else:
+        print('External:   isodatetime/rose date unavailable')
+
+
+if __name__ == '__main__':
+    main()
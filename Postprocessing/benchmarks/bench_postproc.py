@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+'''
+*****************************COPYRIGHT******************************
+ (C) Crown copyright 2025 Met Office. All rights reserved.
+
+ Use, duplication or disclosure of this code is subject to the restrictions
+ as set forth in the licence. If no licence has been raised with this copy
+ of the code, the use, duplication or disclosure of it is strictly
+ prohibited. Permission to do so must first be obtained in writing from the
+ Met Office Information Asset Owner at the following address:
+
+ Met Office, FitzRoy Road, Exeter, Devon, EX1 3PB, United Kingdom
+*****************************COPYRIGHT******************************
+NAME
+    bench_postproc.py
+
+DESCRIPTION
+    Benchmark harness for the post-processing hot paths, using synthetic
+    model output generated at a configurable scale.
+    Each benchmark case is run against a fresh copy of its input data, and
+    the wall time of each repeat is recorded.  Cases requiring software
+    which is unavailable (e.g. Mule or nccopy) are reported as skipped.
+
+    Results are written as JSON:
+      {"schema": 1,
+       "config": {<command line arguments>},
+       "environment": {"host": ..., "python": ..., "time": ...},
+       "cases": {<case>: {"status": "ok"|"skipped"|"failed",
+                          "reason": <str, skipped/failed only>,
+                          "times": [<float seconds>, ...],
+                          "min": ..., "median": ..., "mean": ...,
+                          "input_files": ..., "input_bytes": ...}}}
+
+USAGE
+    python bench_postproc.py [-g GRID] [-m MONTHS] [-l LEVELS] [-r REPEAT]
+                             [-c CASE [CASE ...]] [-o OUTPUT] [-w WORKDIR]
+'''
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+BENCHDIR = os.path.dirname(os.path.abspath(__file__))
+for subdir in ['common', 'nemocice', 'atmos', 'platforms']:
+    sys.path.append(os.path.join(BENCHDIR, os.pardir, subdir))
+
+import synthetic
+
+PREFIX = 'BENCH'
+# First month of synthetic data.  Seasons and years end in November,
+# according to a mean reference date of 1st December
+START = (1995, 12)
+SCHEMA = 1
+
+
+def setup_environment(workdir, months):
+    '''
+    Set up the Cylc environment required by the post-processing app, with
+    the task cycle point at the end of the synthetic data.
+    '''
+    enddate = list(synthetic.month_dates(START, months))[-1][1]
+    cyclepoint = '{:04d}{:02d}01T0000Z'.format(*enddate)
+    os.environ.update({
+        'CYLC_SUITE_NAME': PREFIX,
+        'CYLC_CYCLING_MODE': '360day',
+        'CYLC_SUITE_SHARE_DIR': workdir,
+        'CYLC_SUITE_WORK_DIR': workdir,
+        'CYLC_TASK_WORK_DIR': workdir,
+        'CYLC_TASK_LOG_ROOT': os.path.join(workdir, 'job'),
+        'CYLC_TASK_NAME': 'postproc_bench',
+        'CYLC_SUITE_INITIAL_CYCLE_POINT':
+            '{:04d}{:02d}01T0000Z'.format(*START),
+        'CYLC_SUITE_FINAL_CYCLE_POINT': '29991201T0000Z',
+        'CYLC_TASK_CYCLE_POINT': cyclepoint,
+        'CYCLEPERIOD': 'P{}M'.format(months),
+        'RUNID': PREFIX,
+        'DATAM': workdir,
+        })
+
+
+def write_namelist(fname, share, archive_dir, means_cmd, compression):
+    '''
+    Write a NEMO post-processing namelist file.  Seasonal and annual means
+    are created from monthly means, and archived using the stand-in archive
+    command.
+    '''
+    archive_script = ' '.join([sys.executable,
+                               os.path.join(BENCHDIR, 'bin',
+                                            'stand_in_archive.py'),
+                               archive_dir])
+    namelists = {
+        'suitegen': {
+            'archive_command': "'script'",
+            'archive_toplevel': 'true',
+            'mean_reference_date': '1950,12,1',
+            'prefix': "'{}'".format(PREFIX),
+            'process_toplevel': 'true',
+            'umtask_name': "'coupled'",
+            },
+        'script_arch': {'archive_script': "'{}'".format(archive_script)},
+        'nemo_pp': {
+            'pp_run': 'true',
+            'restart_directory': "'{}'".format(share),
+            'work_directory': "'{}'".format(share),
+            },
+        'nemo_processing': {
+            'base_component': "'1m'",
+            'create_means': 'true',
+            'create_seasonal_mean': 'true',
+            'create_annual_mean': 'true',
+            'means_cmd': "'{}'".format(means_cmd),
+            'means_fieldsfiles': "'grid-T'",
+            'correct_time_variables': 'true',
+            'correct_time_bounds_variables': 'true',
+            'time_vars': "'time_counter'",
+            'compression_level': str(compression),
+            'chunking_arguments': "''",
+            },
+        'nemo_archiving': {'archive_means': 'true'},
+        }
+    with open(fname, 'w') as nlfile:
+        for name, values in namelists.items():
+            nlfile.write('&{}\n'.format(name))
+            for key, val in values.items():
+                nlfile.write('{}={},\n'.format(key, val))
+            nlfile.write('/\n')
+
+
+class Benchmark(object):
+    '''
+    Container for the synthetic input data and the benchmark cases.
+    Each case is a pair of methods:
+      setup_<case>(casedir) - Prepare a fresh copy of the input data in
+                              casedir.  Return a callable to be timed.
+                              Raise UserWarning to skip the case.
+    '''
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.sourcedir = os.path.join(workdir, 'source')
+        os.makedirs(self.sourcedir)
+        self.inputs = {}
+
+    def _generate(self, model):
+        ''' Generate synthetic data for a model, once only '''
+        if model not in self.inputs:
+            if model == 'um':
+                if not synthetic.MULE_AVAIL:
+                    raise UserWarning('Mule unavailable')
+                files = synthetic.um_month_files(
+                    self.sourcedir, PREFIX, self.args.grid, START,
+                    self.args.months
+                    )
+            else:
+                if not synthetic.NETCDF4_AVAIL:
+                    raise UserWarning('netCDF4 unavailable')
+                files = synthetic.nemo_month_files(
+                    self.sourcedir, PREFIX, self.args.grid, START,
+                    self.args.months, levels=self.args.levels
+                    )
+            self.inputs[model] = files
+        return self.inputs[model]
+
+    def _copy_inputs(self, model, casedir):
+        ''' Copy synthetic input data to casedir '''
+        if os.path.isdir(casedir):
+            shutil.rmtree(casedir)
+        os.makedirs(casedir)
+        files = []
+        for fname in self._generate(model):
+            files.append(shutil.copy(fname, casedir))
+        return [os.path.join(casedir, os.path.basename(f)) for f in files]
+
+    def input_stats(self, case):
+        ''' Return the number and total size of input files for a case '''
+        model = 'um' if case in ['create_um_mean', 'extract_to_pp_mule'] \
+            else 'nemo'
+        files = self.inputs.get(model, [])
+        return len(files), sum(os.path.getsize(f) for f in files)
+
+    def _nemo_model(self, casedir, means_cmd=None, compression=0):
+        ''' Return a NemoPostProc instance for the data in casedir '''
+        import nemo
+        import utils
+
+        if means_cmd is None:
+            if utils.get_utility_avail('ncra'):
+                means_cmd = 'ncra -O'
+            else:
+                means_cmd = ' '.join([sys.executable,
+                                      os.path.join(BENCHDIR, 'bin',
+                                                   'stand_in_mean.py')])
+        nlfile = os.path.join(casedir, 'nemocicepp.nl')
+        write_namelist(nlfile, casedir, os.path.join(casedir, 'archive'),
+                       means_cmd, compression)
+        cwd = os.getcwd()
+        os.chdir(casedir)
+        try:
+            model = nemo.NemoPostProc(input_nl=nlfile)
+        finally:
+            os.chdir(cwd)
+        return model
+
+    def setup_create_means(self, casedir):
+        ''' NEMO seasonal and annual means, including fix_times '''
+        self._copy_inputs('nemo', casedir)
+        return self._nemo_model(casedir).create_means
+
+    def setup_create_means_netcdf4(self, casedir):
+        ''' As create_means, using the in-process netCDF4 means engine '''
+        self._copy_inputs('nemo', casedir)
+        return self._nemo_model(casedir, means_cmd='netcdf4').create_means
+
+    def setup_fix_times(self, casedir):
+        ''' netcdf_utils.fix_times for each season of monthly means '''
+        import netcdf_utils
+
+        files = sorted(self._copy_inputs('nemo', casedir))
+        seasons = [files[i:i + 3] for i in range(0, len(files) - 2, 3)]
+        meanfiles = []
+        for i, season in enumerate(seasons):
+            meanfiles.append(os.path.join(casedir, 'mean{}.nc'.format(i)))
+            shutil.copy(season[0], meanfiles[-1])
+
+        def run():
+            ''' Timed function '''
+            for season, meanfile in zip(seasons, meanfiles):
+                for time_var in ['time_counter', 'time_centered']:
+                    netcdf_utils.fix_times(season, meanfile, time_var,
+                                           do_time=True, do_bounds=True)
+        return run
+
+    def setup_compress_netcdf_files(self, casedir, utility='nccopy'):
+        ''' ModelTemplate.compress_netcdf_files on all monthly means '''
+        import utils
+
+        self._copy_inputs('nemo', casedir)
+        model = self._nemo_model(casedir, compression=1)
+        model.naml.processing.compress_netcdf = utility
+        if utility == 'nccopy' and not (utils.get_utility_avail('nccopy') and
+                                        utils.get_utility_avail('ncdump')):
+            raise UserWarning('nccopy/ncdump unavailable')
+        return lambda: model.compress_netcdf_files('1m', 'grid-T',
+                                                   sourcedir=casedir)
+
+    def setup_compress_netcdf4(self, casedir):
+        ''' As compress_netcdf_files, using the netCDF4 library '''
+        return self.setup_compress_netcdf_files(casedir, utility='netcdf4')
+
+    def setup_archive(self, casedir):
+        ''' ModelTemplate.archive_means using the stand-in archive command '''
+        files = self._copy_inputs('nemo', casedir)
+        model = self._nemo_model(casedir)
+        os.makedirs(model.diagsdir)
+        for fname in files:
+            shutil.move(fname, model.diagsdir)
+        return model.archive_means
+
+    def setup_create_um_mean(self, casedir):
+        ''' atmos_transform.create_um_mean for each season '''
+        self._generate('um')
+        import atmos_transform
+        import climatemean
+
+        files = sorted(self._copy_inputs('um', casedir))
+        means = []
+        for i in range(0, len(files) - 2, 3):
+            meanfile = climatemean.MeanFile('1s', '1m')
+            meanfile.component_files = files[i:i + 3]
+            end = list(synthetic.month_dates(START, i + 3))[-1][1]
+            meanfile.periodend = [end[0], end[1], 1]
+            meanfile.set_filename('{}a.ps{}'.format(PREFIX, i), casedir)
+            means.append(meanfile)
+
+        def run():
+            ''' Timed function '''
+            for meanfile in means:
+                icode, msg = atmos_transform.create_um_mean(meanfile)
+                if icode != 0:
+                    raise RuntimeError(msg)
+        return run
+
+    def setup_extract_to_pp_mule(self, casedir):
+        ''' atmos_transform._extract_to_pp_mule of half of the fields '''
+        self._generate('um')
+        import atmos_transform
+
+        files = sorted(self._copy_inputs('um', casedir))
+        fields = [str(30201 + i) for i in range(0, 20, 2)]
+        outfile = os.path.join(casedir, PREFIX + 'a.pz1996.pp')
+
+        def run():
+            ''' Timed function '''
+            cwd = os.getcwd()
+            os.chdir(casedir)
+            try:
+                if not atmos_transform._extract_to_pp_mule(files, fields,
+                                                           outfile, None):
+                    raise RuntimeError('No fields extracted')
+            finally:
+                os.chdir(cwd)
+        return run
+
+
+CASES = ['create_means', 'create_means_netcdf4', 'fix_times',
+         'compress_netcdf_files', 'compress_netcdf4', 'archive',
+         'create_um_mean', 'extract_to_pp_mule']
+
+
+def run_case(bench, case, repeat):
+    ''' Run a single benchmark case.  Return the result dictionary '''
+    result = {'status': 'ok', 'times': []}
+    casedir = os.path.join(bench.workdir, case)
+    try:
+        for _ in range(repeat):
+            timed = getattr(bench, 'setup_' + case)(casedir)
+            start = time.time()
+            timed()
+            result['times'].append(time.time() - start)
+    except UserWarning as exc:
+        result = {'status': 'skipped', 'reason': str(exc), 'times': []}
+    except (Exception, SystemExit) as exc:
+        result = {'status': 'failed', 'reason': repr(exc), 'times': []}
+
+    times = sorted(result['times'])
+    if times:
+        result['min'] = times[0]
+        result['median'] = times[len(times) // 2]
+        result['mean'] = sum(times) / len(times)
+    result['input_files'], result['input_bytes'] = bench.input_stats(case)
+    return result
+
+
+def main():
+    '''Main function'''
+    parser = argparse.ArgumentParser(
+        description='Benchmark the post-processing app with synthetic data'
+        )
+    parser.add_argument('-g', '--grid', default='tiny',
+                        choices=sorted(synthetic.GRIDS.keys()),
+                        help='Model grid (default: tiny)')
+    parser.add_argument('-m', '--months', type=int, default=12,
+                        help='Number of months of data (default: 12)')
+    parser.add_argument('-l', '--levels', type=int, default=None,
+                        help='Number of ocean levels (default: set by grid)')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of repeats of each case (default: 3)')
+    parser.add_argument('-c', '--cases', nargs='+', default=CASES,
+                        choices=CASES, help='Cases to run (default: all)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='JSON output file (default: standard output)')
+    parser.add_argument('-w', '--workdir', default=None,
+                        help='Working directory (default: temporary '
+                        'directory, removed on completion)')
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='pp_bench_')
+    workdir = os.path.abspath(workdir)
+    setup_environment(workdir, args.months)
+
+    # Post-processing log messages are redirected to standard error,
+    # leaving standard output for the results
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    import timer
+    timer.set_nulltimer()
+
+    results = {
+        'schema': SCHEMA,
+        'config': {k: v for k, v in vars(args).items()
+                   if k not in ['output', 'workdir']},
+        'environment': {
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            },
+        'cases': {},
+        }
+    try:
+        bench = Benchmark(args, workdir)
+        for case in args.cases:
+            sys.stderr.write('[INFO] Running benchmark case: {}\n'.
+                             format(case))
+            results['cases'][case] = run_case(bench, case, args.repeat)
+    finally:
+        sys.stdout = stdout
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            outfile.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+'''
+*****************************COPYRIGHT******************************
+ (C) Crown copyright 2025 Met Office. All rights reserved.
+
+ Use, duplication or disclosure of this code is subject to the restrictions
+ as set forth in the licence. If no licence has been raised with this copy
+ of the code, the use, duplication or disclosure of it is strictly
+ prohibited. Permission to do so must first be obtained in writing from the
+ Met Office Information Asset Owner at the following address:
+
+ Met Office, FitzRoy Road, Exeter, Devon, EX1 3PB, United Kingdom
+*****************************COPYRIGHT******************************
+NAME
+    stand_in_archive.py
+
+DESCRIPTION
+    Local stand-in for an archiving system, for use with the "script"
+    archive_command of the post-processing app.
+    Copies the file to be archived to a local archive directory.
+
+USAGE
+    stand_in_archive.py ARCHIVE_DIR FILENAME SOURCEDIR
+'''
+import os
+import shutil
+import sys
+
+if len(sys.argv) != 4:
+    print('[FAIL] stand_in_archive.py - ' +
+          'Require archive directory, filename and source directory')
+    sys.exit(10)
+
+ARCHIVE_DIR, FILENAME, SOURCEDIR = sys.argv[1:]
+if not os.path.isdir(ARCHIVE_DIR):
+    os.makedirs(ARCHIVE_DIR)
+shutil.copy(os.path.join(SOURCEDIR, FILENAME), ARCHIVE_DIR)
+print('[INFO] stand_in_archive.py - Archived ' + FILENAME)
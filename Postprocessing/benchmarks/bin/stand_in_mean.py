@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+'''
+*****************************COPYRIGHT******************************
+ (C) Crown copyright 2025 Met Office. All rights reserved.
+
+ Use, duplication or disclosure of this code is subject to the restrictions
+ as set forth in the licence. If no licence has been raised with this copy
+ of the code, the use, duplication or disclosure of it is strictly
+ prohibited. Permission to do so must first be obtained in writing from the
+ Met Office Information Asset Owner at the following address:
+
+ Met Office, FitzRoy Road, Exeter, Devon, EX1 3PB, United Kingdom
+*****************************COPYRIGHT******************************
+NAME
+    stand_in_mean.py
+
+DESCRIPTION
+    Local stand-in for a netCDF meaning utility, such as `ncra` or
+    `mean_nemo.exe`, where neither is available.
+    Creates OUTFILE containing the unweighted mean of each variable with
+    an unlimited dimension over the input files.  All other variables are
+    copied from the first input file.
+
+USAGE
+    stand_in_mean.py INFILE [INFILE ...] OUTFILE
+'''
+import shutil
+import sys
+
+import netCDF4
+
+if len(sys.argv) < 3:
+    print('[FAIL] stand_in_mean.py - Require input files and output file')
+    sys.exit(10)
+
+INFILES = sys.argv[1:-1]
+OUTFILE = sys.argv[-1]
+
+shutil.copy(INFILES[0], OUTFILE)
+with netCDF4.Dataset(OUTFILE, 'r+') as outid:
+    record_vars = [name for name, var in outid.variables.items() if
+                   any(outid.dimensions[dim].isunlimited()
+                       for dim in var.dimensions)]
+    for name in record_vars:
+        total = outid.variables[name][:].astype('f8')
+        for fname in INFILES[1:]:
+            with netCDF4.Dataset(fname) as inid:
+                total += inid.variables[name][:]
+        outid.variables[name][:] = total / len(INFILES)
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+'''
+*****************************COPYRIGHT******************************
+ (C) Crown copyright 2025 Met Office. All rights reserved.
+
+ Use, duplication or disclosure of this code is subject to the restrictions
+ as set forth in the licence. If no licence has been raised with this copy
+ of the code, the use, duplication or disclosure of it is strictly
+ prohibited. Permission to do so must first be obtained in writing from the
+ Met Office Information Asset Owner at the following address:
+
+ Met Office, FitzRoy Road, Exeter, Devon, EX1 3PB, United Kingdom
+*****************************COPYRIGHT******************************
+NAME
+    synthetic.py
+
+DESCRIPTION
+    Generators of synthetic model output for benchmarking the
+    post-processing app:
+       NEMO and CICE monthly mean netCDF files, named according to the
+       Met Office netCDF filename convention
+       UM fieldsfiles (requires Mule)
+    All data is written for a 360day calendar.
+'''
+import os
+
+import numpy
+
+try:
+    import netCDF4
+    NETCDF4_AVAIL = True
+except ImportError:
+    NETCDF4_AVAIL = False
+
+try:
+    import mule
+    MULE_AVAIL = True
+except ImportError:
+    MULE_AVAIL = False
+
+# Model grids available
+#    Key = Grid name.  Value = (rows, columns, ocean levels)
+GRIDS = {
+    'tiny': (30, 36, 5),
+    'orca1': (332, 362, 75),
+    'orca025': (1207, 1442, 75),
+    }
+
+# UM grids available, matched to the ocean resolution
+#    Key = Grid name.  Value = (rows, columns, pressure levels)
+UM_GRIDS = {
+    'tiny': (19, 24, 3),
+    'orca1': (144, 192, 17),
+    'orca025': (324, 432, 17),
+    }
+
+SECONDS_PER_DAY = 86400.
+
+
+def month_dates(start, months):
+    '''
+    Generator returning the start and end dates (year, month) of each of a
+    number of consecutive months.
+    Arguments:
+        start  - <type tuple> (year, month) of the first month
+        months - <type int> Number of months
+    '''
+    year, month = start
+    for _ in range(months):
+        nyear, nmonth = (year + 1, 1) if month == 12 else (year, month + 1)
+        yield (year, month), (nyear, nmonth)
+        year, month = nyear, nmonth
+
+
+def _days_since(date, refyear):
+    ''' Return number of days since 1st January refyear - 360day calendar '''
+    return (date[0] - refyear) * 360. + (date[1] - 1) * 30.
+
+
+def _ncfilename(model, prefix, realm, start, end, custom=''):
+    ''' Return a monthly mean filename following the netCDF convention '''
+    return '{}_{}{}_1m_{:04d}{:02d}01-{:04d}{:02d}01{}.nc'.format(
+        model, prefix.lower(), realm, start[0], start[1], end[0], end[1],
+        '_' + custom if custom else ''
+        )
+
+
+def _write_time(ncid, time_var, start, end, units, refyear, scale):
+    ''' Write time, time_centered and time bounds variables '''
+    ncid.createDimension(time_var, None)
+    ncid.createDimension('bnds', 2)
+    bounds = numpy.array([[_days_since(start, refyear),
+                           _days_since(end, refyear)]]) * scale
+
+    time_vars = [time_var]
+    if time_var == 'time_counter':
+        time_vars.append('time_centered')
+    for tvar in time_vars:
+        var = ncid.createVariable(tvar, 'f8', (time_var,))
+        var.units = units
+        var.calendar = '360_day'
+        var.bounds = tvar + '_bounds'
+        var[:] = bounds.mean(axis=1)
+        var = ncid.createVariable(tvar + '_bounds', 'f8', (time_var, 'bnds'))
+        var[:] = bounds
+
+
+def _random_field(shape, mean, spread, rng):
+    ''' Return a float32 random field '''
+    return (mean + spread * rng.standard_normal(shape)).astype(numpy.float32)
+
+
+def nemo_month_files(directory, prefix, grid, start, months, levels=None,
+                     seed=0):
+    '''
+    Write NEMO monthly mean grid-T files.
+    Arguments:
+        directory - Location of output files
+        prefix    - Suite name
+        grid      - One of GRIDS.keys()
+        start     - <type tuple> (year, month) of the first month
+        months    - <type int> Number of months
+    Optional Arguments:
+        levels    - Number of vertical levels.  Default is given by GRIDS
+        seed      - Random number seed
+    Returns a list of the files created.
+    '''
+    rows, cols, nlev = GRIDS[grid]
+    nlev = levels or nlev
+    rng = numpy.random.RandomState(seed)
+    files = []
+    for start_date, end_date in month_dates(start, months):
+        fname = os.path.join(directory,
+                             _ncfilename('nemo', prefix, 'o', start_date,
+                                         end_date, custom='grid-T'))
+        with netCDF4.Dataset(fname, 'w', format='NETCDF4') as ncid:
+            _write_time(ncid, 'time_counter', start_date, end_date,
+                        'seconds since 1950-01-01 00:00:00', 1950,
+                        SECONDS_PER_DAY)
+            ncid.createDimension('deptht', nlev)
+            ncid.createDimension('y', rows)
+            ncid.createDimension('x', cols)
+            for name, (mean, spread) in [('nav_lat', (0., 50.)),
+                                         ('nav_lon', (0., 100.))]:
+                var = ncid.createVariable(name, 'f4', ('y', 'x'))
+                var[:] = _random_field((rows, cols), mean, spread, rng)
+            var = ncid.createVariable('deptht', 'f4', ('deptht',))
+            var[:] = numpy.linspace(0.5, 5500., nlev)
+            for name, mean, spread in [('thetao', 10., 5.),
+                                       ('so', 35., 1.)]:
+                var = ncid.createVariable(
+                    name, 'f4', ('time_counter', 'deptht', 'y', 'x'),
+                    fill_value=numpy.float32(1.e20)
+                    )
+                var.cell_methods = 'time: mean'
+                var[:] = _random_field((1, nlev, rows, cols), mean,
+                                       spread, rng)
+            for name, mean, spread in [('tos', 15., 8.), ('zos', 0., 1.)]:
+                var = ncid.createVariable(name, 'f4',
+                                          ('time_counter', 'y', 'x'),
+                                          fill_value=numpy.float32(1.e20))
+                var.cell_methods = 'time: mean'
+                var[:] = _random_field((1, rows, cols), mean, spread, rng)
+        files.append(fname)
+
+    return files
+
+
+def cice_month_files(directory, prefix, grid, start, months, seed=0):
+    '''
+    Write CICE monthly mean files.
+    Arguments:
+        directory - Location of output files
+        prefix    - Suite name
+        grid      - One of GRIDS.keys()
+        start     - <type tuple> (year, month) of the first month
+        months    - <type int> Number of months
+    Optional Arguments:
+        seed      - Random number seed
+    Returns a list of the files created.
+    '''
+    rows, cols, _ = GRIDS[grid]
+    rng = numpy.random.RandomState(seed)
+    files = []
+    for start_date, end_date in month_dates(start, months):
+        fname = os.path.join(directory,
+                             _ncfilename('cice', prefix, 'i', start_date,
+                                         end_date))
+        with netCDF4.Dataset(fname, 'w', format='NETCDF4') as ncid:
+            _write_time(ncid, 'time', start_date, end_date,
+                        'days since 0001-01-01 00:00:00', 1, 1.)
+            ncid.createDimension('nj', rows)
+            ncid.createDimension('ni', cols)
+            for name, mean, spread in [('aice', 0.5, 0.3), ('hi', 1., 0.5),
+                                       ('hs', 0.2, 0.1), ('uvel', 0., 0.2),
+                                       ('vvel', 0., 0.2)]:
+                var = ncid.createVariable(name, 'f4', ('time', 'nj', 'ni'),
+                                          fill_value=numpy.float32(1.e30))
+                var.cell_methods = 'time: mean'
+                var[:] = _random_field((1, rows, cols), mean, spread, rng)
+        files.append(fname)
+
+    return files
+
+
+def um_month_files(directory, prefix, grid, start, months, stream='pm',
+                   nfields=20, seed=0):
+    '''
+    Write UM monthly mean fieldsfiles.  Requires Mule.
+    Arguments:
+        directory - Location of output files
+        prefix    - Suite name
+        grid      - One of UM_GRIDS.keys()
+        start     - <type tuple> (year, month) of the first month
+        months    - <type int> Number of months
+    Optional Arguments:
+        stream    - Output stream ID
+        nfields   - Number of distinct STASHcodes in each file.  Each is
+                    written on every pressure level
+        seed      - Random number seed
+    Returns a list of the files created.
+    '''
+    rows, cols, nlev = UM_GRIDS[grid]
+    rng = numpy.random.RandomState(seed)
+    months_str = ['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+                  'jul', 'aug', 'sep', 'oct', 'nov', 'dec']
+    files = []
+    for start_date, end_date in month_dates(start, months):
+        template = {
+            'fixed_length_header': {
+                'data_set_format_version': 20,
+                'sub_model': 1,
+                'vert_coord_type': 3,
+                'horiz_grid_type': 0,
+                'dataset_type': 3,
+                'grid_staggering': 6,
+                'calendar': 2,
+                'model_version': 1300,
+                },
+            'integer_constants': {
+                'num_cols': cols,
+                'num_rows': rows,
+                'num_p_levels': nlev,
+                'num_wet_levels': nlev,
+                'num_field_types': nfields,
+                },
+            'real_constants': {
+                'col_spacing': 360. / cols,
+                'row_spacing': 180. / (rows - 1),
+                'start_lat': -90.,
+                'start_lon': 0.,
+                'north_pole_lat': 90.,
+                'north_pole_lon': 0.,
+                },
+            'level_dependent_constants': {'dims': (nlev + 1, None)},
+            }
+        umf = mule.FieldsFile.from_template(template)
+        header = umf.fixed_length_header
+        header.t1_year, header.t1_month, header.t1_day = \
+            start_date[0], start_date[1], 1
+        header.t2_year, header.t2_month, header.t2_day = \
+            end_date[0], end_date[1], 1
+        header.t3_year, header.t3_month, header.t3_day = \
+            end_date[0], end_date[1], 1
+
+        for stash in range(nfields):
+            for level in range(1, nlev + 1):
+                field = mule.Field3.empty()
+                field.lbyr, field.lbmon, field.lbdat = \
+                    start_date[0], start_date[1], 1
+                field.lbyrd, field.lbmond, field.lbdatd = \
+                    end_date[0], end_date[1], 1
+                field.lbtim = 122
+                field.lbft = 720
+                field.lbcode = 1
+                field.lbhem = 0
+                field.lbrow = rows
+                field.lbnpt = cols
+                field.lbpack = 0
+                field.lbrel = 3
+                field.lbproc = 128
+                field.lbvc = 8
+                field.lblev = level
+                field.lbuser1 = 1
+                field.lbuser4 = 30201 + stash
+                field.lbuser7 = 1
+                field.blev = 1000. - level * 50.
+                field.bplat = 90.
+                field.bplon = 0.
+                field.bgor = 0.
+                field.bzy = -90. - 180. / (rows - 1)
+                field.bdy = 180. / (rows - 1)
+                field.bzx = -360. / cols
+                field.bdx = 360. / cols
+                field.bmdi = -1073741824.0
+                field.bmks = 1.0
+                field.set_data_provider(mule.ArrayDataProvider(
+                    _random_field((rows, cols), 250., 20., rng)
+                    ))
+                umf.fields.append(field)
+
+        fname = os.path.join(directory, '{}a.{}{:04d}{}'.format(
+            prefix, stream, start_date[0], months_str[start_date[1] - 1]
+            ))
+        umf.to_file(fname)
+        files.append(fname)
+
+    return files
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+'''
+*****************************COPYRIGHT******************************
+ (C) Crown copyright 2025 Met Office. All rights reserved.
+
+ Use, duplication or disclosure of this code is subject to the restrictions
+ as set forth in the licence. If no licence has been raised with this copy
+ of the code, the use, duplication or disclosure of it is strictly
+ prohibited. Permission to do so must first be obtained in writing from the
+ Met Office Information Asset Owner at the following address:
+
+ Met Office, FitzRoy Road, Exeter, Devon, EX1 3PB, United Kingdom
+*****************************COPYRIGHT******************************
+NAME
+    archive_log.py
+
+DESCRIPTION
+    Class definition for ArchiveLog - the record of files archived.
+    Each entry is written as a line of the text archive log:
+          <filename> <status>
+    and to an SQLite index of the same name with the suffix ".db",
+    keyed by filename, from which the status of any file may be
+    retrieved without scanning the text log.
+
+    Where the sqlite3 module is unavailable the text log alone is written.
+'''
+import os
+import time
+import hashlib
+
+try:
+    import sqlite3
+    SQLITE_AVAIL = True
+except ImportError:
+    SQLITE_AVAIL = False
+
+import utils
+
+INDEX_EXT = '.db'
+CHECKSUM_BUFSIZE = 16 * 1024 * 1024
+
+
+def index_available(logfile):
+    ''' Return True if an index is available for the given archive log '''
+    return SQLITE_AVAIL and os.path.isfile(logfile + INDEX_EXT)
+
+
+def file_checksum(fname):
+    ''' Return the MD5 checksum of a file, or None if it cannot be read '''
+    md5 = hashlib.md5()
+    try:
+        with open(fname, 'rb') as fhandle:
+            for block in iter(lambda: fhandle.read(CHECKSUM_BUFSIZE), b''):
+                md5.update(block)
+    except IOError:
+        return None
+    return md5.hexdigest()
+
+
+class ArchiveLog(object):
+    '''
+    Text archive log with SQLite index.
+    The object may be used in place of a file handle open for writing to
+    the text log.
+    '''
+    def __init__(self, logfile, checksum=False, readonly=False):
+        '''
+        Arguments:
+          logfile  - <type str> Full path to the text archive log
+        Optional Arguments:
+          checksum - <type bool> Record the MD5 checksum of archived files
+          readonly - <type bool> Open an existing log for reading only.
+                     Neither the text log nor the index is created or
+                     modified.
+        '''
+        self.name = logfile
+        self.checksum = checksum
+        self.readonly = readonly
+        self._text = None
+        self._index = None
+        if readonly:
+            if index_available(logfile):
+                try:
+                    self._index = sqlite3.connect(logfile + INDEX_EXT,
+                                                  timeout=60)
+                except sqlite3.Error as exc:
+                    utils.log_msg('ArchiveLog: Unable to read archive log '
+                                  'index {} - {}'.format(logfile + INDEX_EXT,
+                                                         exc),
+                                  level='WARN')
+                    self._index = None
+            return
+
+        action = 'a' if os.path.exists(logfile) else 'w'
+        self._text = open(logfile, action)
+        if SQLITE_AVAIL:
+            new_index = not os.path.exists(logfile + INDEX_EXT)
+            try:
+                self._index = sqlite3.connect(logfile + INDEX_EXT,
+                                              timeout=60)
+                self._index.execute('PRAGMA journal_mode=WAL')
+                self._index.execute('PRAGMA synchronous=NORMAL')
+                self._index.execute(
+                    'CREATE TABLE IF NOT EXISTS archive ('
+                    'filename TEXT PRIMARY KEY, status TEXT, size INTEGER, '
+                    'checksum TEXT, timestamp REAL)'
+                    )
+                self._index.commit()
+            except sqlite3.Error as exc:
+                utils.log_msg('ArchiveLog: Unable to use archive log index '
+                              '{} - {}'.format(logfile + INDEX_EXT, exc),
+                              level='WARN')
+                self._index = None
+            else:
+                if new_index:
+                    self._import_text()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _import_text(self):
+        ''' Add entries in a pre-existing text log to a new index '''
+        with open(self.name, 'r') as log_fh:
+            for line in log_fh:
+                self._add_line(line, commit=False)
+        self._index.commit()
+
+    def _add_line(self, line, commit=True):
+        ''' Add an "<filename> <status>" log line to the index '''
+        try:
+            fname, status = line.strip().split(' ', 1)
+        except ValueError:
+            # Blank line, or no status provided
+            return
+        self._add_entry(fname, status, None, None, commit=commit)
+
+    def _add_entry(self, fname, status, size, checksum, commit=True):
+        ''' Add an entry to the index, replacing any previous entry '''
+        if self._index:
+            self._index.execute(
+                'INSERT OR REPLACE INTO archive VALUES (?, ?, ?, ?, ?)',
+                (os.path.basename(fname), status, size, checksum,
+                 time.time())
+                )
+            if commit:
+                self._index.commit()
+
+    def _check_writable(self):
+        ''' Raise IOError where the log has been opened read-only '''
+        if self.readonly:
+            raise IOError('ArchiveLog: {} is open read-only'.format(self.name))
+
+    def write(self, line):
+        '''
+        Write one or more "<filename> <status>" lines to the log, as for a
+        file handle.
+        '''
+        self._check_writable()
+        self._text.write(line)
+        self._text.flush()
+        for logline in line.splitlines():
+            self._add_line(logline)
+
+    def record(self, archfile, status):
+        '''
+        Record the archive status of a file.
+        Arguments:
+          archfile - <type str> Full path to the file archived
+          status   - <type str> Status message
+        '''
+        self._check_writable()
+        self._text.write('{} {}\n'.format(os.path.basename(archfile), status))
+        self._text.flush()
+        try:
+            size = os.path.getsize(archfile)
+        except OSError:
+            size = None
+        checksum = file_checksum(archfile) if \
+            (self.checksum and size is not None) else None
+        self._add_entry(archfile, status, size, checksum)
+
+    def status(self, fname):
+        '''
+        Return the latest recorded status of a file, or None if the file
+        has not been recorded.
+        '''
+        fname = os.path.basename(fname)
+        if self._index:
+            row = self._index.execute(
+                'SELECT status FROM archive WHERE filename = ?', (fname,)
+                ).fetchone()
+            return row[0] if row else None
+
+        # No index available.  Scan the text log
+        if self._text:
+            self._text.flush()
+        status = None
+        with open(self.name, 'r') as log_fh:
+            for line in log_fh:
+                if line.startswith(fname + ' '):
+                    status = line.strip().split(' ', 1)[1]
+        return status
+
+    def archived(self, fname):
+        '''
+        Return True if the latest recorded status of a file is not a
+        failure, False if it is, and None if the file has not been recorded.
+        '''
+        status = self.status(fname)
+        return None if status is None else 'FAILED' not in status
+
+    def entries(self, prefixes=None):
+        '''
+        Return a list of (filename, status) for all files recorded,
+        in the order of their latest entry.
+        Optional Arguments:
+          prefixes - <type list> Return only those files with names
+                     beginning with one of the given prefixes.  Files are
+                     selected by range lookup in the index.  An empty
+                     prefix matches all files.
+        '''
+        prefixes = utils.ensure_list(prefixes)
+        if '' in prefixes:
+            prefixes = []
+        if self._index:
+            query = 'SELECT filename, status FROM archive'
+            bounds = []
+            if prefixes:
+                query += ' WHERE ' + ' OR '.join(
+                    ['(filename >= ? AND filename < ?)'] * len(prefixes)
+                    )
+                for prefix in prefixes:
+                    bounds += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+            return self._index.execute(query + ' ORDER BY rowid',
+                                       bounds).fetchall()
+
+        if self._text:
+            self._text.flush()
+        entries = []
+        with open(self.name, 'r') as log_fh:
+            for line in log_fh:
+                if ' ' in line.strip() and (not prefixes or
+                                            line.startswith(tuple(prefixes))):
+                    entries.append(tuple(line.strip().split(' ', 1)))
+        return entries
+
+    def close(self):
+        ''' Close the text log and index '''
+        if self._text:
+            self._text.close()
+        if self._index:
+            self._index.close()
+            self._index = None
@@ -30,6 +30,9 @@ import timer
 MEANPERIODS = OrderedDict([('1m', 'Monthly'), ('1s', 'Seasonal'),
                            ('1y', 'Annual'), ('1x', 'Decadal')])
 
+# Suffix of running mean accumulator files: <mean filename><suffix>
+RUNNING_MEAN_EXT = '.running'
+
 MONTHS = ('December', 'January', 'February', 'March', 'April', 'May', 'June',
           'July', 'August', 'September', 'October', 'November')
 
@@ -349,6 +352,34 @@ def calc_enddate(startdate, target):
     return tuple(rtndate)
 
 
+def period_end_date(cmpt_enddate, component, period, meanref):
+    '''
+    Return a tuple of <type str> representing the end date of the period
+    mean to which a component file belongs.
+
+    Arguments:
+        cmpt_enddate - Tuple or list of <type str>: End date of the component
+                       (YYYY, MM, DD, [hh], [mm])
+        component    - Base component of the period mean
+        period       - One of MEANPERIODS.keys()
+        meanref      - list of <type str> or <type int> representing the
+                       mean reference date
+    '''
+    regex = end_date_regex(period, meanref)
+    enddate = tuple(str(d).zfill(2) for d in cmpt_enddate)
+    for _ in range(120):
+        if re.match(regex, ''.join(enddate[:3])):
+            break
+        enddate = calc_enddate(enddate, component)
+    else:
+        msg = 'climatemean: period_end_date - Unable to find end of {} ' \
+            'period for component ending {}'.format(period, cmpt_enddate)
+        utils.log_msg(msg, level='WARN')
+        enddate = None
+
+    return enddate
+
+
 def end_date_regex(period, meanref):
     '''
     Return a regular expression representing any end date (YYYYMMDD)
@@ -18,6 +18,12 @@ DESCRIPTION
     Module containing methods to fix times and tims bounds in a mean
     netcdf file created from multiple input files
 '''
+import itertools
+import os
+import time
+
+from collections import OrderedDict
+
 from netCDF4 import Dataset, num2date, date2num
 import numpy
 
@@ -80,18 +86,101 @@ def first_and_last_dates(dates, target_units, calendar):
     target_units and calendar.
     Input dates should be a list of netcdf.datetime objects
     '''
-    datevals = [date2num(date, target_units, calendar) for date in dates]
-    datevals = numpy.array(datevals)
+    datevals = numpy.asarray(date2num(list(dates), target_units, calendar))
     first_and_last = numpy.array([datevals.min(), datevals.max()])
     return first_and_last
 
 
+# Length in seconds of time units of fixed length, for which conversion
+# between reference dates within a calendar is linear
+FIXED_LENGTH_TIME_UNITS = {
+    'days': 86400., 'day': 86400., 'd': 86400.,
+    'hours': 3600., 'hour': 3600., 'hrs': 3600., 'hr': 3600., 'h': 3600.,
+    'minutes': 60., 'minute': 60., 'mins': 60., 'min': 60.,
+    'seconds': 1., 'second': 1., 'secs': 1., 'sec': 1., 's': 1.,
+    'milliseconds': 1.e-3, 'msecs': 1.e-3, 'msec': 1.e-3, 'ms': 1.e-3,
+    'microseconds': 1.e-6, 'usecs': 1.e-6, 'usec': 1.e-6, 'us': 1.e-6,
+    }
+# Cache of linear time conversions:
+#     (units, target units, calendar): (scale, offset)
+_TIME_CONVERSIONS = {}
+
+
+def convert_times(values, units, target_units, calendar,
+                  target_calendar=None):
+    '''
+    Return an array of time values converted to target_units.
+    Conversions between units of fixed length within a calendar are linear,
+    and the scale and offset are cached for reuse.  Other conversions are
+    made via datetime objects.
+    Arguments:
+      values - <type numpy.ndarray> Time values in units
+    Optional Arguments:
+      target_calendar - Calendar of the target units.  Default=calendar
+    '''
+    target_calendar = target_calendar or calendar
+    if units == target_units and calendar == target_calendar:
+        return values
+
+    key = (units, target_units, calendar)
+    unit_length, target_length = [FIXED_LENGTH_TIME_UNITS.get(
+        unit.split()[0].lower()) for unit in (units, target_units)]
+    if key not in _TIME_CONVERSIONS and calendar == target_calendar and \
+            unit_length and target_length:
+        _TIME_CONVERSIONS[key] = (
+            unit_length / target_length,
+            float(date2num(num2date(0., units, calendar), target_units,
+                           calendar))
+            )
+
+    if calendar == target_calendar and key in _TIME_CONVERSIONS:
+        scale, offset = _TIME_CONVERSIONS[key]
+        return values * scale + offset
+    return numpy.reshape(
+        date2num(num2date(numpy.ravel(values), units, calendar),
+                 target_units, target_calendar),
+        numpy.shape(values)
+        ).astype('f8')
+
+
+def component_times(meanset, time_var, units, calendar, times=True,
+                    bounds=True):
+    '''
+    Read the values of the time variable and/or its bounds from each file
+    in meanset in a single pass, converted to the given units and calendar.
+    Returns (<type numpy.ndarray> times or None,
+             <type numpy.ndarray> bounds or None)
+    '''
+    time_vals = []
+    bounds_vals = []
+    for fname in meanset:
+        with get_dataset(fname) as ncid:
+            cmpt_units = get_vardata(ncid, time_var, attribute='units')
+            cmpt_calendar = get_vardata(ncid, time_var,
+                                        attribute='calendar').lower()
+            if times:
+                values = get_vardata(ncid, time_var)[:]
+                time_vals.append(convert_times(
+                    numpy.ma.filled(values, numpy.nan).astype('f8').ravel(),
+                    cmpt_units, units, cmpt_calendar, calendar
+                    ))
+            if bounds:
+                bounds_var = get_vardata(ncid, time_var, attribute='bounds')
+                values = get_vardata(ncid, bounds_var)[:]
+                bounds_vals.append(convert_times(
+                    numpy.ma.filled(values, numpy.nan).astype('f8').ravel(),
+                    cmpt_units, units, cmpt_calendar, calendar
+                    ))
+
+    return (numpy.concatenate(time_vals) if time_vals else None,
+            numpy.concatenate(bounds_vals) if bounds_vals else None)
+
+
 def correct_bounds(meanset, time_var, units, calendar):
     '''Return correct time bounds for meanfile'''
-    dates_in = [time_bounds_var_to_date(fname, time_var) for fname in meanset]
-    # Flatten list of lists
-    dates_in = sum(dates_in, [])
-    return first_and_last_dates(dates_in, units, calendar)
+    _, bounds = component_times(meanset, time_var, units, calendar,
+                                times=False)
+    return numpy.array([numpy.nanmin(bounds), numpy.nanmax(bounds)])
 
 
 def time_var_to_date(fname, time_var):
@@ -106,10 +195,9 @@ def time_var_to_date(fname, time_var):
 
 def correct_time(meanset, time_var, target_unit, calendar):
     '''Return correct float value of time for mean file'''
-    dates_in = [time_var_to_date(fname, time_var) for fname in meanset]
-    # Convert date to float values
-    floats = [date2num(date, target_unit, calendar) for date in dates_in]
-    return numpy.array(floats).mean()
+    times, _ = component_times(meanset, time_var, target_unit, calendar,
+                               bounds=False)
+    return times.mean()
 
 
 def fix_times(meanset, meanfile, time_var, do_time=False, do_bounds=False):
@@ -118,6 +206,8 @@ def fix_times(meanset, meanfile, time_var, do_time=False, do_bounds=False):
     account of calendar
     Fix time bounds variable in meanfile to the earliest and latest
     dates in the same variable in meanset
+    Time and time bounds values are read from each file in meanset in a
+    single pass.
     Variables: meanset = A set of files that have been averaged together
                meanfile = Mean file created by averaging the files above
                time_var = name of the time variable to be used to obtain the
@@ -129,18 +219,1079 @@ def fix_times(meanset, meanfile, time_var, do_time=False, do_bounds=False):
     calendar = get_vardata(ncid, time_var, attribute='calendar').lower()
 
     rmsg = ''
+    if do_time or do_bounds:
+        times, bounds = component_times(meanset, time_var, units, calendar,
+                                        times=do_time, bounds=do_bounds)
+
     if do_time:
         mean_time_var = get_vardata(ncid, time_var)
-        mean_time_var[:] = correct_time(meanset, time_var, units, calendar)
+        mean_time_var[:] = times.mean()
         rmsg = rmsg + 'Corrected {} in file: {}\n'.format(time_var, meanfile)
 
     if do_bounds:
         bounds_var = get_vardata(ncid, time_var, attribute='bounds')
         mean_bounds_shape = get_vardata(ncid, bounds_var, attribute='shape')
         mean_bounds_var = get_vardata(ncid, bounds_var)
-        new_bounds = correct_bounds(meanset, time_var, units, calendar)
+        new_bounds = numpy.array([numpy.nanmin(bounds), numpy.nanmax(bounds)])
         mean_bounds_var[:] = numpy.reshape(new_bounds, mean_bounds_shape)
         rmsg = rmsg + 'Corrected {} in file: {}\n'.format(bounds_var, meanfile)
 
     ncid.close()
     return rmsg
+
+
+# Maximum size (bytes) of each slab of data read when copying a variable
+COPY_SLAB_BYTES = 64 * 1024 * 1024
+# Maximum number of per-processor files held open while rebuilding.
+# Files of larger sets are reopened for each variable.
+MAX_OPEN_COMPONENTS = 512
+
+
+def parse_chunking(chunking):
+    '''
+    Return the chunk sizes given by nccopy-style chunking arguments:
+        [<variable>:]<dimension>/<chunk size>
+    Arguments without a variable name apply to all variables.
+    Arguments:
+      chunking - <type str> Comma separated arguments, or <type list>
+    Returns a tuple of dictionaries:
+      ({dimension: size}, {variable: {dimension: size}})
+    '''
+    if isinstance(chunking, str):
+        chunking = chunking.split(',')
+    dim_chunks = {}
+    var_chunks = {}
+    for arg in [a.strip() for a in utils.ensure_list(chunking) if a]:
+        try:
+            dim, size = arg.split('/')
+            size = int(size)
+        except ValueError:
+            utils.log_msg('netcdf_utils - parse_chunking: Invalid chunking '
+                          'argument: ' + arg, level='ERROR')
+        if ':' in dim:
+            var, dim = dim.split(':', 1)
+            var_chunks.setdefault(var, {})[dim] = size
+        else:
+            dim_chunks[dim] = size
+    return dim_chunks, var_chunks
+
+
+def _chunk_sizes(var, dim_chunks, var_chunks, shape=None):
+    '''
+    Return chunk sizes for a variable.  Dimensions without a requested
+    chunk size are unchunked, other than unlimited dimensions which take
+    a chunk size of 1.
+    Optional Arguments:
+      shape - Shape of the output variable, where different from that of
+              the source variable
+    '''
+    requested = dict(dim_chunks)
+    requested.update(var_chunks.get(var.name, {}))
+    sizes = []
+    for dimname, length in zip(var.dimensions, shape or var.shape):
+        unlimited = var.group().dimensions[dimname].isunlimited()
+        size = requested.get(dimname, 1 if unlimited else length)
+        sizes.append(max(1, size if unlimited else min(size, length)))
+    return sizes
+
+
+def _copy_attributes(source, target, exclude=()):
+    ''' Copy netCDF attributes from source to target object '''
+    target.setncatts({attr: source.getncattr(attr)
+                      for attr in source.ncattrs() if attr not in exclude})
+
+
+def _itemsize(var):
+    ''' Return the size in bytes of each element of a netCDF variable '''
+    try:
+        return var.dtype.itemsize
+    except AttributeError:
+        # Variable length strings
+        return 64
+
+
+def _slab_indices(shape, itemsize, axes=None):
+    '''
+    Return the indices of slabs of an array of given shape, each bounded
+    by COPY_SLAB_BYTES where the array can be divided along the given axes.
+    Axes are taken in order, and iterated one index at a time until the
+    remaining axes fit within the bound, when the next is divided into
+    slabs of several indices.
+    Optional Arguments:
+      axes - Axes along which the array may be divided.  Default=All axes
+    '''
+    steps = {}
+    nbytes = itemsize * int(numpy.prod(shape))
+    for axis in range(len(shape)) if axes is None else axes:
+        if nbytes <= COPY_SLAB_BYTES:
+            break
+        nbytes //= shape[axis]
+        steps[axis] = max(1, COPY_SLAB_BYTES // max(1, nbytes))
+        nbytes *= min(steps[axis], shape[axis])
+    return itertools.product(*[
+        [slice(start, min(start + steps.get(axis, length), length))
+         for start in range(0, length, steps.get(axis, length))] or
+        [slice(0, 0)] for axis, length in enumerate(shape)
+        ])
+
+
+def _copy_variable_data(srcvar, outvar, offset=0):
+    '''
+    Copy variable data in slabs, such that the memory required is bounded
+    by COPY_SLAB_BYTES.  Slabs are taken along the first dimension, and
+    within each record where a single record exceeds the bound.
+    Optional Arguments:
+      offset - Index of the first dimension of outvar at which to write
+    '''
+    if not srcvar.dimensions:
+        outvar.assignValue(srcvar.getValue())
+        return
+    if srcvar.shape[0] == 0:
+        return
+
+    for index in _slab_indices(srcvar.shape, _itemsize(srcvar)):
+        target = (slice(index[0].start + offset, index[0].stop + offset),)
+        outvar[target + index[1:]] = srcvar[index]
+
+
+def deflate_level(fname):
+    '''
+    Return the maximum deflate level of the variables in a netCDF file,
+    or 0 if no variables are compressed.
+    RuntimeError or IOError is raised where the file cannot be read.
+    '''
+    level = 0
+    with Dataset(fname, 'r') as ncid:
+        for var in ncid.variables.values():
+            filters = var.filters() or {}
+            if filters.get('zlib'):
+                level = max(level, filters.get('complevel', 0))
+    return level
+
+
+def compress_netcdf(infile, outfile, compression, chunking=None,
+                    shuffle=True):
+    '''
+    Copy a netCDF file, applying deflation and chunking to all non-scalar
+    variables in the manner of nccopy.
+    Variables are copied one at a time, in slabs, so that memory usage is
+    bounded regardless of the file size.
+    Only the root group is copied: ValueError is raised where the file
+    contains groups.
+    Arguments:
+      infile      - Input filename
+      outfile     - Output filename
+      compression - <type int> Deflate level 0-9
+    Optional Arguments:
+      chunking    - nccopy-style chunking arguments: See parse_chunking
+      shuffle     - Apply the shuffle filter with deflation
+    '''
+    dim_chunks, var_chunks = parse_chunking(chunking)
+    with get_dataset(infile) as src:
+        if src.groups:
+            raise ValueError('netCDF groups are not supported: ' +
+                             ', '.join(src.groups))
+        src.set_auto_maskandscale(False)
+        data_model = src.data_model
+        if not data_model.startswith('NETCDF4'):
+            # Compression requires netCDF4 format
+            data_model = 'NETCDF4_CLASSIC'
+
+        with Dataset(outfile, 'w', format=data_model) as out:
+            out.set_auto_maskandscale(False)
+            _copy_attributes(src, out)
+            for name, dim in src.dimensions.items():
+                out.createDimension(name,
+                                    None if dim.isunlimited() else len(dim))
+
+            for name, srcvar in src.variables.items():
+                attrs = srcvar.ncattrs()
+                fill = srcvar.getncattr('_FillValue') if \
+                    '_FillValue' in attrs else None
+                deflate = compression > 0 and bool(srcvar.dimensions) and \
+                    srcvar.dtype != str
+                options = {}
+                if srcvar.dimensions and srcvar.dtype != str:
+                    options['chunksizes'] = _chunk_sizes(srcvar, dim_chunks,
+                                                         var_chunks)
+                outvar = out.createVariable(
+                    name, srcvar.datatype, srcvar.dimensions,
+                    zlib=deflate, complevel=compression if deflate else 4,
+                    shuffle=shuffle and deflate, fill_value=fill, **options
+                    )
+                outvar.set_auto_maskandscale(False)
+                _copy_attributes(srcvar, outvar, exclude=('_FillValue',))
+                _copy_variable_data(srcvar, outvar)
+
+
+def extract_regions(infile, regions, compression=0, chunking=None,
+                    shuffle=True):
+    '''
+    Extract a number of regions from a netCDF file in a single pass.
+    Each variable is read once, in slabs along its first dimension covering
+    the bounding box of all regions, and each regional output is written
+    from the same slab.  Deflation and chunking are applied on write.
+    Arguments:
+      infile      - Input filename
+      regions     - List of (output filename, {dimension: (first, last)})
+                    giving the index range of each dimension (inclusive)
+    Optional Arguments:
+      compression - <type int> Deflate level 0-9
+      chunking    - nccopy-style chunking arguments: See parse_chunking
+      shuffle     - Apply the shuffle filter with deflation
+    Returns (<type dict> {output filename: (bytes extracted, time taken)},
+             bytes read from infile)
+    '''
+    dim_chunks, var_chunks = parse_chunking(chunking)
+    stats = OrderedDict((outfile, [0, 0.]) for outfile, _ in regions)
+    nread = 0
+    with get_dataset(infile) as src:
+        src.set_auto_maskandscale(False)
+        data_model = src.data_model
+        if compression > 0 and not data_model.startswith('NETCDF4'):
+            # Compression requires netCDF4 format
+            data_model = 'NETCDF4_CLASSIC'
+
+        outputs = []
+        try:
+            for outfile, ranges in regions:
+                out = Dataset(outfile, 'w', format=data_model)
+                outputs.append(out)
+                _copy_attributes(src, out)
+                for name, dim in src.dimensions.items():
+                    if dim.isunlimited():
+                        out.createDimension(name, None)
+                    elif name in ranges:
+                        out.createDimension(
+                            name, ranges[name][1] - ranges[name][0] + 1
+                            )
+                    else:
+                        out.createDimension(name, len(dim))
+
+            for name, srcvar in src.variables.items():
+                dims = srcvar.dimensions
+                # Bounding box of all regions
+                box = [slice(None)] * len(dims)
+                for i, dim in enumerate(dims):
+                    limits = [r[dim] for _, r in regions if dim in r]
+                    if limits:
+                        box[i] = slice(min(l[0] for l in limits),
+                                       max(l[1] for l in limits) + 1)
+                shape = [len(range(*b.indices(length))) for b, length in
+                         zip(box, srcvar.shape)]
+
+                outvars = []
+                for out, (outfile, ranges) in zip(outputs, regions):
+                    attrs = srcvar.ncattrs()
+                    deflate = compression > 0 and bool(dims) and \
+                        srcvar.dtype != str
+                    options = {}
+                    if dims and srcvar.dtype != str:
+                        options['chunksizes'] = _chunk_sizes(
+                            srcvar, dim_chunks, var_chunks,
+                            shape=[len(out.dimensions[d]) for d in dims]
+                            )
+                    outvar = out.createVariable(
+                        name, srcvar.datatype, dims,
+                        zlib=deflate, complevel=compression if deflate else 4,
+                        shuffle=shuffle and deflate,
+                        fill_value=srcvar.getncattr('_FillValue') if
+                        '_FillValue' in attrs else None, **options
+                        )
+                    outvar.set_auto_maskandscale(False)
+                    _copy_attributes(srcvar, outvar, exclude=('_FillValue',))
+                    # Index of the region within the bounding box
+                    index = []
+                    for i, dim in enumerate(dims):
+                        if dim in ranges:
+                            first = ranges[dim][0] - box[i].start
+                            index.append(slice(first, first + ranges[dim][1] -
+                                               ranges[dim][0] + 1))
+                        else:
+                            index.append(slice(None))
+                    outvars.append((outfile, outvar, index))
+
+                if not dims:
+                    value = srcvar.getValue()
+                    for _, outvar, _ in outvars:
+                        outvar.assignValue(value)
+                    continue
+                if 0 in shape:
+                    continue
+
+                try:
+                    itemsize = srcvar.dtype.itemsize
+                except AttributeError:
+                    # Variable length strings
+                    itemsize = 64
+                if box[0] == slice(None):
+                    slab = max(1, COPY_SLAB_BYTES //
+                               max(1, itemsize * int(numpy.prod(shape[1:]))))
+                else:
+                    # First dimension is a region dimension - single slab
+                    slab = shape[0]
+                first_dim = box[0].indices(srcvar.shape[0])
+                for start in range(0, shape[0], slab):
+                    end = min(start + slab, shape[0])
+                    read_index = [slice(first_dim[0] + start,
+                                        first_dim[0] + end)] + box[1:]
+                    data = srcvar[tuple(read_index)]
+                    nread += numpy.asarray(data).nbytes
+                    for outfile, outvar, index in outvars:
+                        timer_start = time.time()
+                        regional = data[tuple([slice(None)] + index[1:])]
+                        if box[0] != slice(None):
+                            regional = regional[index[0]]
+                            outvar[:] = regional
+                        else:
+                            outvar[start:end] = regional
+                        stats[outfile][0] += numpy.asarray(regional).nbytes
+                        stats[outfile][1] += time.time() - timer_start
+        finally:
+            for out in outputs:
+                out.close()
+
+    return OrderedDict((outfile, tuple(stat)) for outfile, stat in
+                       stats.items()), nread
+
+
+def _domain_decomposition(ncid, dims=None):
+    '''
+    Return the decomposition of a NEMO per-processor file, taken from the
+    DOMAIN_* global attributes, as a dictionary:
+      dims   - Names of the decomposed (i, j) dimensions
+      global - Global size of the decomposed dimensions
+      slices - Slices of the local data to be written (excluding halos)
+      target - Corresponding slices of the global domain
+      total  - Number of processor domains output, or None if unknown
+    Optional Arguments:
+      dims   - Names of the decomposed (i, j) dimensions.
+               Default=Taken from DOMAIN_dimensions_ids, or ('x', 'y')
+    '''
+    dimnames = list(ncid.dimensions)
+    if dims:
+        dims = list(dims)
+    else:
+        try:
+            ids = ncid.getncattr('DOMAIN_dimensions_ids')
+            dims = [dimnames[int(i) - 1] for i in numpy.atleast_1d(ids)]
+        except (AttributeError, IndexError, ValueError):
+            dims = ['x', 'y']
+    globalsize = numpy.atleast_1d(ncid.getncattr('DOMAIN_size_global'))
+    first = numpy.atleast_1d(ncid.getncattr('DOMAIN_position_first'))
+    local = [len(ncid.dimensions[dim]) for dim in dims]
+    halo_start = numpy.zeros(len(dims), dtype=int)
+    halo_end = numpy.zeros(len(dims), dtype=int)
+    if 'DOMAIN_halo_size_start' in ncid.ncattrs():
+        halo_start[:] = ncid.getncattr('DOMAIN_halo_size_start')
+        halo_end[:] = ncid.getncattr('DOMAIN_halo_size_end')
+
+    slices = []
+    target = []
+    for i in range(len(dims)):
+        slices.append(slice(halo_start[i], local[i] - halo_end[i]))
+        start = int(first[i]) - 1 + halo_start[i]
+        target.append(slice(start, start + local[i] - halo_start[i] -
+                            halo_end[i]))
+    total = int(ncid.getncattr('DOMAIN_number_total')) if \
+        'DOMAIN_number_total' in ncid.ncattrs() else None
+    return {'dims': dims, 'global': [int(n) for n in globalsize[:len(dims)]],
+            'slices': slices, 'target': target, 'total': total}
+
+
+def _required_variables(ncid, variables):
+    '''
+    Return the names of the given variables, together with the coordinate
+    and bounds variables on which they depend
+    '''
+    required = []
+    pending = list(variables)
+    while pending:
+        name = pending.pop(0)
+        if name in required or name not in ncid.variables:
+            continue
+        required.append(name)
+        var = ncid.variables[name]
+        pending.extend(var.dimensions)
+        attrs = var.ncattrs()
+        if 'coordinates' in attrs:
+            pending.extend(var.getncattr('coordinates').split())
+        if 'bounds' in attrs:
+            pending.append(var.getncattr('bounds'))
+    return [v for v in ncid.variables if v in required]
+
+
+def rebuild_domains(components, outfile, compression=0, chunking=None,
+                    variables=None, shuffle=True, maskout=False, dims=None):
+    '''
+    Recombine the per-processor files of a NEMO restart or diagnostic file
+    into a single global file, in the manner of rebuild_nemo.
+    The position of each processor domain within the global domain is
+    taken from the DOMAIN_* global attributes of the component files.
+    Variables are assembled one at a time, in slabs along the dimensions
+    which are not decomposed such that the memory required is bounded by
+    COPY_SLAB_BYTES or a single global (i, j) field where larger.  Each slab
+    is initialised with zero, or with the variable's fill value where
+    maskout is requested such that any land-suppressed processor domains
+    are missing data, as rebuild_nemo with l_maskout.  Variables without
+    decomposed dimensions are copied from the first component file.
+    ValueError is raised where the number of component files differs from
+    the DOMAIN_number_total attribute.
+    Arguments:
+      components  - List of per-processor filenames
+      outfile     - Output filename
+    Optional Arguments:
+      compression - <type int> Deflate level 0-9
+      chunking    - nccopy-style chunking arguments: See parse_chunking
+      variables   - List of variables to rebuild.  Default is all variables.
+                    Coordinate and bounds variables required by those
+                    requested are also rebuilt.
+      shuffle     - Apply the shuffle filter with deflation
+      maskout     - Set land-suppressed processor domains to the fill value
+      dims        - Names of the decomposed (i, j) dimensions.
+                    Default=Taken from DOMAIN_dimensions_ids, or ('x', 'y')
+    '''
+    dim_chunks, var_chunks = parse_chunking(chunking)
+    components = sorted(components)
+    keep_open = len(components) <= MAX_OPEN_COMPONENTS
+    datasets = []
+    decomposition = []
+    for fname in components:
+        ncid = get_dataset(fname)
+        ncid.set_auto_maskandscale(False)
+        decomposition.append(_domain_decomposition(ncid, dims=dims))
+        if keep_open:
+            datasets.append(ncid)
+        else:
+            ncid.close()
+
+    first = datasets[0] if keep_open else get_dataset(components[0])
+    first.set_auto_maskandscale(False)
+    domain = decomposition[0]
+    names = _required_variables(first, variables) if variables else \
+        list(first.variables)
+    data_model = first.data_model
+    if compression > 0 and not data_model.startswith('NETCDF4'):
+        # Compression requires netCDF4 format
+        data_model = 'NETCDF4_CLASSIC'
+
+    try:
+        if domain['total'] not in (None, len(components)):
+            raise ValueError('{} component files found for {} domains'.
+                             format(len(components), domain['total']))
+        with Dataset(outfile, 'w', format=data_model) as out:
+            out.set_auto_maskandscale(False)
+            _copy_attributes(first, out, exclude=[
+                a for a in first.ncattrs() if a.startswith('DOMAIN_')
+                ])
+            for name, dim in first.dimensions.items():
+                if name in domain['dims']:
+                    size = domain['global'][domain['dims'].index(name)]
+                else:
+                    size = None if dim.isunlimited() else len(dim)
+                out.createDimension(name, size)
+
+            for name in names:
+                srcvar = first.variables[name]
+                shape = [len(out.dimensions[d]) if d in domain['dims'] else
+                         size for d, size in zip(srcvar.dimensions,
+                                                 srcvar.shape)]
+                fill = srcvar.getncattr('_FillValue') if \
+                    '_FillValue' in srcvar.ncattrs() else None
+                deflate = compression > 0 and bool(srcvar.dimensions) and \
+                    srcvar.dtype != str
+                options = {}
+                if srcvar.dimensions and srcvar.dtype != str:
+                    options['chunksizes'] = _chunk_sizes(
+                        srcvar, dim_chunks, var_chunks, shape=shape
+                        )
+                outvar = out.createVariable(
+                    name, srcvar.datatype, srcvar.dimensions,
+                    zlib=deflate, complevel=compression if deflate else 4,
+                    shuffle=shuffle and deflate, fill_value=fill, **options
+                    )
+                outvar.set_auto_maskandscale(False)
+                _copy_attributes(srcvar, outvar, exclude=('_FillValue',))
+
+                axes = [srcvar.dimensions.index(d) if d in srcvar.dimensions
+                        else None for d in domain['dims']]
+                if all(axis is None for axis in axes):
+                    _copy_variable_data(srcvar, outvar)
+                    continue
+
+                for index in _slab_indices(
+                        shape, _itemsize(srcvar),
+                        axes=[k for k in range(len(shape)) if k not in axes]
+                        ):
+                    data = numpy.full(
+                        [len(range(*sl.indices(n))) for sl, n in
+                         zip(index, shape)],
+                        fill if maskout and fill is not None else 0,
+                        dtype=srcvar.dtype
+                        )
+                    for i, fname in enumerate(components):
+                        ncid = datasets[i] if keep_open else \
+                            (first if i == 0 else get_dataset(fname))
+                        local = list(index)
+                        target = [slice(None)] * len(shape)
+                        for j, axis in enumerate(axes):
+                            if axis is not None:
+                                local[axis] = decomposition[i]['slices'][j]
+                                target[axis] = decomposition[i]['target'][j]
+                        ncid.set_auto_maskandscale(False)
+                        data[tuple(target)] = \
+                            ncid.variables[name][tuple(local)]
+                        if ncid is not first and not keep_open:
+                            ncid.close()
+                    outvar[index] = data
+                    del data
+    finally:
+        for ncid in datasets or [first]:
+            ncid.close()
+
+    return outfile
+
+
+# Suffix of the variables holding the sum of weights in a running mean
+# accumulator file
+WEIGHT_SUFFIX = '__weight'
+# cell_methods of a variable whose time mean is weighted by the cell
+# thickness, as recognised by mean_nemo
+THICKNESS_WEIGHTED_CELL_METHODS = 'time: mean (thickness weighted)'
+
+
+def _time_values(ncid, name, units, calendar):
+    '''
+    Return the values of a time variable, and of its bounds where
+    available, in the given units
+    '''
+    var = ncid.variables[name]
+    values = numpy.ma.filled(var[:], numpy.nan).astype('f8')
+    bounds = None
+    if 'bounds' in var.ncattrs() and var.bounds in ncid.variables:
+        bounds = numpy.ma.filled(ncid.variables[var.bounds][:],
+                                 numpy.nan).astype('f8')
+    if getattr(var, 'units', units) != units:
+        values = convert_times(values, var.units, units, calendar)
+        if bounds is not None:
+            bounds = convert_times(bounds, var.units, units, calendar)
+    return values, bounds
+
+
+class _TimeAccumulator(object):
+    '''
+    Running totals of the time variables of a set of files:
+    the sum and number of the time values, and the earliest and latest
+    time bounds
+    '''
+    def __init__(self, template, time_vars):
+        self.time_vars = [t for t in utils.ensure_list(time_vars) if
+                          t in template.variables]
+        timevar = get_vardata(template, utils.ensure_list(time_vars)[0])
+        self.recdim = timevar.dimensions[0]
+        self.units = timevar.units
+        self.calendar = getattr(timevar, 'calendar', 'standard').lower()
+        self.bounds_vars = {}
+        for name in self.time_vars:
+            bounds = getattr(template.variables[name], 'bounds', None)
+            if bounds in template.variables:
+                self.bounds_vars[bounds] = name
+        self.totals = {name: [0., 0, numpy.inf, -numpy.inf]
+                       for name in self.time_vars}
+
+    def add(self, ncid, weighted):
+        '''
+        Add the times of a file to the totals.
+        Return the weights of each record in the file.
+        '''
+        weights = None
+        for name in self.time_vars:
+            values, bounds = _time_values(ncid, name, self.units,
+                                          self.calendar)
+            total = self.totals[name]
+            total[0] += numpy.sum(values)
+            total[1] += len(values)
+            if bounds is not None:
+                total[2] = min(total[2], numpy.nanmin(bounds))
+                total[3] = max(total[3], numpy.nanmax(bounds))
+                if weights is None and weighted:
+                    weights = numpy.diff(bounds, axis=-1).ravel()
+            if weights is None:
+                weights = numpy.ones(len(values))
+        return weights
+
+    def attributes(self):
+        ''' Return the totals as a dictionary of netCDF attributes '''
+        return {'running_' + name: numpy.array(total) for name, total in
+                self.totals.items()}
+
+    def load(self, ncid):
+        ''' Load totals saved in netCDF attributes '''
+        for name in self.time_vars:
+            self.totals[name] = [float(v) for v in
+                                 ncid.getncattr('running_' + name)]
+
+    def mean(self, name):
+        ''' Return the mean value of a time variable '''
+        return self.totals[name][0] / self.totals[name][1]
+
+    def bounds(self, name):
+        ''' Return the earliest and latest bounds of a time variable '''
+        return self.totals[self.bounds_vars[name]][2:]
+
+
+def _record_variables(ncid, times):
+    '''
+    Return the names of variables to be meaned: non-string variables
+    dependent on the record dimension, other than time variables
+    '''
+    return [name for name, var in ncid.variables.items() if
+            var.dimensions[:1] == (times.recdim,) and var.dtype != str and
+            name not in times.time_vars and name not in times.bounds_vars]
+
+
+def _thickness_variables(ncid, names):
+    '''
+    Return a dictionary {variable: cell thickness variable} for those of
+    the given variables whose time mean is weighted by the cell thickness,
+    as given by their cell_methods.
+    The cell thickness is the variable with standard_name "cell_thickness"
+    of the same dimensions.  ValueError is raised where none is available.
+    '''
+    thickness = [name for name, var in ncid.variables.items() if
+                 getattr(var, 'standard_name', None) == 'cell_thickness']
+    weighted = {}
+    for name in names:
+        var = ncid.variables[name]
+        if getattr(var, 'cell_methods', None) != \
+                THICKNESS_WEIGHTED_CELL_METHODS:
+            continue
+        available = [thk for thk in thickness if thk != name and
+                     ncid.variables[thk].dimensions == var.dimensions]
+        if not available:
+            raise ValueError('No cell thickness available for thickness '
+                             'weighted variable ' + name)
+        weighted[name] = available[0]
+    return weighted
+
+
+def _slabs(shape):
+    '''
+    Return a list of indices of slabs, along the first dimension, of an
+    array of given shape, each bounded by COPY_SLAB_BYTES of float64 data
+    '''
+    if not shape:
+        return [()]
+    slab = max(1, COPY_SLAB_BYTES // max(1, 8 * int(numpy.prod(shape[1:]))))
+    return [(slice(start, min(start + slab, shape[0])),)
+            for start in range(0, shape[0], slab)]
+
+
+def _slab_shape(shape, index):
+    ''' Return the shape of a slab of an array, as given by _slabs '''
+    if not index:
+        return tuple(shape)
+    return (len(range(*index[0].indices(shape[0]))),) + tuple(shape[1:])
+
+
+def _accumulate(srcvars, weights, index, total, weightsum, thkvars=None):
+    '''
+    Add the weighted data of all records of a slab of each of the
+    given variables to the running totals.
+    Where cell thickness variables are given, one per source variable, the
+    data is additionally weighted by the cell thickness of each record.
+    Points with missing thickness are excluded.
+    '''
+    for num, (srcvar, recweights) in enumerate(zip(srcvars, weights)):
+        for rec, weight in enumerate(recweights):
+            data = numpy.ma.masked_invalid(
+                srcvar[(rec,) + index].astype('f8')
+                )
+            if thkvars:
+                weight = numpy.ma.filled(weight * numpy.ma.masked_invalid(
+                    thkvars[num][(rec,) + index].astype('f8')
+                    ), 0.)
+            total += weight * numpy.ma.filled(data, 0.)
+            weightsum += weight * ~numpy.ma.getmaskarray(data)
+
+
+def _filter_options(srcvar):
+    '''
+    Return the createVariable arguments required to match the compression
+    and chunking of a compressed source variable
+    '''
+    options = {}
+    filters = srcvar.filters() or {}
+    if filters.get('zlib'):
+        options = {'zlib': True, 'shuffle': filters['shuffle'],
+                   'complevel': filters['complevel']}
+        chunks = srcvar.chunking()
+        if chunks and chunks != 'contiguous':
+            options['chunksizes'] = chunks
+    return options
+
+
+def _write_mean(template, outfile, times, mean_slab):
+    '''
+    Write a mean file, using a template file for the file structure and
+    all variables not dependent on the record dimension.
+    Arguments:
+      template  - Open netCDF Dataset
+      outfile   - Output filename
+      times     - <type _TimeAccumulator> Totals of the time variables
+      mean_slab - Function returning the total and sum of weights of a
+                  slab of a variable: mean_slab(name, index)
+    '''
+    with Dataset(outfile, 'w', format=template.data_model) as out:
+        _copy_attributes(template, out)
+        for name, dim in template.dimensions.items():
+            out.createDimension(name, None if dim.isunlimited() else len(dim))
+
+        meaned = _record_variables(template, times)
+        for name, srcvar in template.variables.items():
+            attrs = srcvar.ncattrs()
+            outvar = out.createVariable(
+                name, srcvar.datatype, srcvar.dimensions,
+                fill_value=srcvar.getncattr('_FillValue') if
+                '_FillValue' in attrs else None, **_filter_options(srcvar)
+                )
+            _copy_attributes(srcvar, outvar, exclude=('_FillValue',))
+
+            record = (0,) if srcvar.dimensions[:1] == (times.recdim,) else ()
+            if name in times.time_vars:
+                outvar[record] = times.mean(name)
+            elif name in times.bounds_vars:
+                outvar[record] = times.bounds(name)
+            elif name in meaned:
+                for index in _slabs(srcvar.shape[1:]):
+                    total, weightsum = mean_slab(name, index)
+                    mean = numpy.ma.masked_where(weightsum == 0, total) / \
+                        numpy.where(weightsum == 0, 1., weightsum)
+                    if numpy.issubdtype(outvar.dtype, numpy.integer):
+                        mean = numpy.ma.round(mean)
+                    outvar[record + index] = mean.astype(outvar.dtype)
+            else:
+                srcvar.set_auto_maskandscale(False)
+                outvar.set_auto_maskandscale(False)
+                _copy_variable_data(srcvar, outvar)
+
+
+def mean_netcdf(infiles, outfile, time_vars=('time',), weighted=False):
+    '''
+    Create the time mean of a set of netCDF files.
+    Variables dependent on the record (time) dimension are meaned over all
+    records in all input files, accumulating the data in slabs such that
+    memory usage is bounded by COPY_SLAB_BYTES per input file regardless of
+    the variable size.  Missing data is excluded from the mean, and points
+    with no valid data in any record are set to missing.
+    By default records are equally weighted, as by ncra and mean_nemo.
+    Variables with cell_methods THICKNESS_WEIGHTED_CELL_METHODS are
+    weighted by the cell thickness, as by mean_nemo.
+    Time variables are set to the mean of the input times, and their bounds
+    to the earliest and latest bounds of the input files.
+    Other variables are copied from the first input file.
+    Arguments:
+      infiles   - List of input filenames
+      outfile   - Output filename
+    Optional Arguments:
+      time_vars - Names of time variables.  The first determines the
+                  record dimension, calendar and units of the mean.
+      weighted  - Weight records by the duration of their time bounds.
+                  Records are equally weighted where bounds are unavailable.
+                  Default=False
+    '''
+    datasets = [get_dataset(fname) for fname in infiles]
+    try:
+        times = _TimeAccumulator(datasets[0], time_vars)
+        weights = [times.add(ncid, weighted) for ncid in datasets]
+        thickness = _thickness_variables(
+            datasets[0], _record_variables(datasets[0], times)
+            )
+
+        def mean_slab(name, index):
+            ''' Return the total and sum of weights of a slab '''
+            shape = _slab_shape(datasets[0].variables[name].shape[1:], index)
+            total = numpy.zeros(shape)
+            weightsum = numpy.zeros(shape)
+            thkvars = [ncid.variables[thickness[name]] for ncid in
+                       datasets] if name in thickness else None
+            _accumulate([ncid.variables[name] for ncid in datasets],
+                        weights, index, total, weightsum, thkvars=thkvars)
+            return total, weightsum
+
+        _write_mean(datasets[0], outfile, times, mean_slab)
+    finally:
+        for ncid in datasets:
+            ncid.close()
+
+    return outfile
+
+
+def running_mean_components(accumfile):
+    '''
+    Return the list of files (basenames) added to a running mean
+    accumulator file, or an empty list if the file does not exist
+    '''
+    try:
+        with Dataset(accumfile) as accum:
+            return [f for f in accum.getncattr('components').split('\n') if f]
+    except (IOError, OSError, RuntimeError, AttributeError):
+        return []
+
+
+def accumulate_netcdf(infiles, accumfile, time_vars=('time',),
+                      weighted=False):
+    '''
+    Add a number of netCDF files to a running mean accumulator file,
+    holding the weighted sum and sum of weights of each variable to be
+    meaned, and running totals of the time variables.  The accumulator is
+    created if it does not exist.
+    The updated accumulator is written to a temporary file and renamed on
+    completion, so that the accumulator is never left part-updated.
+    Files already added to the accumulator are ignored.
+    Arguments:
+      infiles   - List of input filenames
+      accumfile - Accumulator filename
+    Optional Arguments:
+      time_vars - As mean_netcdf
+      weighted  - As mean_netcdf
+    Returns the list of files (basenames) added to the accumulator.
+    '''
+    components = running_mean_components(accumfile)
+    infiles = [f for f in infiles if os.path.basename(f) not in components]
+    if not infiles:
+        return components
+
+    datasets = [get_dataset(fname) for fname in infiles]
+    previous = get_dataset(accumfile) if components else None
+    tmpfile = accumfile + '.tmp'
+    try:
+        template = datasets[0]
+        times = _TimeAccumulator(template, time_vars)
+        if previous:
+            times.load(previous)
+        weights = [times.add(ncid, weighted) for ncid in datasets]
+        meaned = _record_variables(template, times)
+        thickness = _thickness_variables(template, meaned)
+        components += [os.path.basename(f) for f in infiles]
+
+        with Dataset(tmpfile, 'w', format='NETCDF4') as accum:
+            for name, dim in template.dimensions.items():
+                if name != times.recdim:
+                    accum.createDimension(name, len(dim))
+            for name in meaned:
+                srcvar = template.variables[name]
+                shape = srcvar.shape[1:]
+                accvars = [accum.createVariable(varname, 'f8',
+                                                srcvar.dimensions[1:])
+                           for varname in [name, name + WEIGHT_SUFFIX]]
+                for index in _slabs(shape):
+                    if previous:
+                        total = numpy.ma.filled(
+                            previous.variables[name][index], 0.
+                            )
+                        weightsum = numpy.ma.filled(
+                            previous.variables[name + WEIGHT_SUFFIX][index], 0.
+                            )
+                    else:
+                        total = numpy.zeros(_slab_shape(shape, index))
+                        weightsum = numpy.zeros(total.shape)
+                    thkvars = [ncid.variables[thickness[name]] for ncid in
+                               datasets] if name in thickness else None
+                    _accumulate([ncid.variables[name] for ncid in datasets],
+                                weights, index, total, weightsum,
+                                thkvars=thkvars)
+                    accvars[0][index] = total
+                    accvars[1][index] = weightsum
+            accum.setncatts(times.attributes())
+            accum.components = '\n'.join(components)
+        os.rename(tmpfile, accumfile)
+    finally:
+        for ncid in datasets + ([previous] if previous else []):
+            ncid.close()
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+
+    return components
+
+
+def finalise_netcdf(accumfile, template, outfile, time_vars=('time',)):
+    '''
+    Write the mean held by a running mean accumulator file.
+    Arguments:
+      accumfile - Accumulator filename, as written by accumulate_netcdf
+      template  - Filename of any of the files added to the accumulator,
+                  providing the file structure, metadata and variables not
+                  dependent on the record dimension
+      outfile   - Output filename
+    Optional Arguments:
+      time_vars - As mean_netcdf
+    '''
+    with get_dataset(template) as tmpl, get_dataset(accumfile) as accum:
+        times = _TimeAccumulator(tmpl, time_vars)
+        times.load(accum)
+
+        def mean_slab(name, index):
+            ''' Return the total and sum of weights of a slab '''
+            return (numpy.ma.filled(accum.variables[name][index], 0.),
+                    numpy.ma.filled(
+                        accum.variables[name + WEIGHT_SUFFIX][index], 0.
+                        ))
+
+        _write_mean(tmpl, outfile, times, mean_slab)
+
+    return outfile
+
+
+# Global attribute of a partial concatenation holding the number of records
+# completely written
+CONCAT_RECORDS_ATTR = 'concatenated_records'
+
+
+def _record_dimension(ncid):
+    ''' Return the name of the unlimited (record) dimension of a dataset '''
+    for name, dim in ncid.dimensions.items():
+        if dim.isunlimited():
+            return name
+    raise ValueError('No record dimension in file: ' + ncid.filepath())
+
+
+def _create_concatenation(template, outfile):
+    '''
+    Create an empty concatenation file with the structure of a template
+    dataset, with compression and chunking matching that of the template.
+    Variables not dependent on the record dimension are copied.
+    '''
+    recdim = _record_dimension(template)
+    with Dataset(outfile, 'w', format=template.data_model) as out:
+        _copy_attributes(template, out)
+        for name, dim in template.dimensions.items():
+            out.createDimension(name, None if dim.isunlimited() else len(dim))
+
+        for name, srcvar in template.variables.items():
+            attrs = srcvar.ncattrs()
+            outvar = out.createVariable(
+                name, srcvar.datatype, srcvar.dimensions,
+                fill_value=srcvar.getncattr('_FillValue') if
+                '_FillValue' in attrs else None, **_filter_options(srcvar)
+                )
+            _copy_attributes(srcvar, outvar, exclude=('_FillValue',))
+            if srcvar.dimensions[:1] != (recdim,):
+                srcvar.set_auto_maskandscale(False)
+                outvar.set_auto_maskandscale(False)
+                _copy_variable_data(srcvar, outvar)
+        out.setncattr(CONCAT_RECORDS_ATTR, 0)
+
+
+def concatenate_netcdf(infiles, outfile, partial=False):
+    '''
+    Concatenate a number of netCDF files along the record dimension in the
+    manner of ncrcat, appending to outfile if it exists.  The output file
+    is created with the structure, compression and chunking of the first
+    input file.
+    The record coordinate and its bounds are converted to the units of the
+    output file and written for all new records at once, sizing the
+    record dimension.  Other record variables are copied one file at a
+    time, in slabs.
+    Input files with records no later than the last record of outfile are
+    assumed to have been appended already, and are ignored.
+    Arguments:
+      infiles - List of input filenames, in time order
+      outfile - Output filename
+    Optional Arguments:
+      partial - Further files are to be appended to outfile later.
+                The number of records completely written is held in the
+                global attribute CONCAT_RECORDS_ATTR, such that an append
+                interrupted by failure is repeated.  Default=False
+    Returns the list of input files appended.
+    '''
+    if not os.path.exists(outfile):
+        with get_dataset(infiles[0]) as template:
+            _create_concatenation(template, outfile)
+
+    datasets = []
+    appended = []
+    with get_dataset(outfile, action='a') as out:
+        recdim = _record_dimension(out)
+        nrec = len(out.dimensions[recdim])
+        if CONCAT_RECORDS_ATTR in out.ncattrs():
+            nrec = int(out.getncattr(CONCAT_RECORDS_ATTR))
+        coord = out.variables.get(recdim)
+        units = getattr(coord, 'units', None)
+        calendar = getattr(coord, 'calendar', 'standard').lower()
+        bounds_var = getattr(coord, 'bounds', None)
+        if bounds_var not in out.variables:
+            bounds_var = None
+        last = numpy.ma.filled(coord[nrec - 1], numpy.nan) if \
+            (coord is not None and nrec > 0) else None
+
+        try:
+            times = []
+            bounds = []
+            for fname in infiles:
+                ncid = get_dataset(fname)
+                srccoord = ncid.variables.get(recdim)
+                if coord is None or srccoord is None:
+                    values = None
+                else:
+                    values = numpy.ma.filled(srccoord[:], numpy.nan)
+                    src_units = getattr(srccoord, 'units', units)
+                    if units and src_units:
+                        values = convert_times(values.astype('f8'), src_units,
+                                               units, calendar)
+                if last is not None and values is not None and \
+                        values.size and numpy.nanmax(values) <= last:
+                    ncid.close()
+                    continue
+
+                datasets.append(ncid)
+                appended.append(fname)
+                if values is not None:
+                    times.append(values)
+                    if bounds_var:
+                        srcbounds = ncid.variables[
+                            getattr(srccoord, 'bounds', bounds_var)
+                            ]
+                        bvalues = numpy.ma.filled(srcbounds[:], numpy.nan)
+                        if units and src_units:
+                            bvalues = convert_times(bvalues.astype('f8'),
+                                                    src_units, units, calendar)
+                        bounds.append(bvalues)
+
+            if times:
+                # Size the record dimension for all new records
+                end = nrec + sum(len(t) for t in times)
+                coord[nrec:end] = numpy.concatenate(times)
+                if bounds_var:
+                    out.variables[bounds_var][nrec:end] = \
+                        numpy.concatenate(bounds)
+
+            for ncid in datasets:
+                records = len(ncid.dimensions[recdim])
+                for name, outvar in out.variables.items():
+                    if name in (recdim, bounds_var) or \
+                            outvar.dimensions[:1] != (recdim,):
+                        continue
+                    srcvar = ncid.variables[name]
+                    srcvar.set_auto_maskandscale(False)
+                    outvar.set_auto_maskandscale(False)
+                    _copy_variable_data(srcvar, outvar, offset=nrec)
+                nrec += records
+                if partial:
+                    out.setncattr(CONCAT_RECORDS_ATTR, nrec)
+
+            if not partial:
+                if len(out.dimensions[recdim]) != nrec:
+                    raise ValueError(
+                        'Concatenation {} contains {} records, of which {} '
+                        'are complete'.format(outfile,
+                                              len(out.dimensions[recdim]),
+                                              nrec)
+                        )
+                if CONCAT_RECORDS_ATTR in out.ncattrs():
+                    out.delncattr(CONCAT_RECORDS_ATTR)
+        finally:
+            for ncid in datasets:
+                ncid.close()
+
+    return appended
@@ -20,15 +20,29 @@ DESCRIPTION
 '''
 import os
 import re
+import hashlib
+import pickle
 
 import control
 import utils
 
+# In-memory cache of parsed namelist files
+#    Key = Absolute path to namelist file.
+#    Value = (file key, [(namelist name, [(variable, value), ...]), ...])
+NAMELIST_CACHE = {}
+SHELL_CMD = re.compile(r'^\$\(.*\)$')
+
 
 class ReadNamelist(object):
     '''Methods required to parse Fortran Namelists'''
 
-    def __init__(self, nl_name, nl_linearray, uppercase_vars=False):
+    def __init__(self, nl_name, nl_linearray, uppercase_vars=False,
+                 parsed=None):
+        '''
+        Optional Arguments:
+          parsed - List of (variable, value) tuples, as returned by
+                   _parse_variables, to be used in place of nl_linearray
+        '''
         try:
             # Attempt to set default values for namelist
             baseclass = control.NL[nl_name]
@@ -40,18 +54,36 @@ class ReadNamelist(object):
             utils.log_msg(msg, level='WARN')
 
         self._uppercase_vars = uppercase_vars
-        self._read_variables(nl_linearray)
+        if parsed is None:
+            self._read_variables(nl_linearray)
+        else:
+            for key, val in parsed:
+                # Copy lists, which may be modified by the caller
+                setattr(self, key, list(val) if isinstance(val, list) else val)
 
     def _read_variables(self, line_array):
         '''
         Read key-value pairs from an input array of lines of a namelist.
         Initialise the key attribute of the ReadNamelist object with the value.
         '''
+        for key, val in ReadNamelist._parse_variables(line_array,
+                                                      self._uppercase_vars):
+            setattr(self, key, val)
+
+    @staticmethod
+    def _parse_variables(line_array, uppercase_vars=False):
+        '''
+        Read key-value pairs from an input array of lines of a namelist.
+        Return a list of (key, value) tuples in the order of their first
+        assignment.
+        '''
+        variables = {}
+        order = []
         for line in utils.ensure_list(line_array):
             # Remove whitespace, newlines, and preceding/trailing comma
             try:
                 key, val = line.split('=')
-                key = key.upper() if self._uppercase_vars else key
+                key = key.upper() if uppercase_vars else key
                 concat_key = False
             except ValueError:
                 # Multiline item
@@ -60,29 +92,34 @@ class ReadNamelist(object):
 
             val = val.strip(',')
             if ',' in val:
-                val = [self._test_val(val) for val in val.split(',')]
+                val = [ReadNamelist._test_val(val) for val in val.split(',')]
             else:
-                val = self._test_val(val)
+                val = ReadNamelist._test_val(val)
 
             if concat_key:
                 # Concatenate with any existing value(s).
                 # Return value MUST be a list.
-                previous = getattr(self, key)
+                previous = variables[key]
                 val = (utils.ensure_list(previous) if previous else []) + \
                     (utils.ensure_list(val) if val else [])
 
-            setattr(self, key, val)
+            if key not in variables:
+                order.append(key)
+            variables[key] = val
+
+        return [(key, variables[key]) for key in order]
 
     @staticmethod
     def _test_val(valstring):
         ''' Returns appropriate Python variable type '''
-        if valstring.lower().strip('\'"') == 'true':
+        lowval = valstring.lower().strip('\'"')
+        if lowval == 'true':
             return True
-        elif valstring.lower().strip('\'"') == 'false':
+        elif lowval == 'false':
             return False
-        elif valstring.lower().strip('\'"') == 'none':
+        elif lowval == 'none':
             return None
-        elif re.match(r'^\$\(.*\)$', valstring):
+        elif '$(' in valstring and SHELL_CMD.match(valstring):
             # Attempt to execute implied shell command
             rcode, output = utils.exec_subproc(valstring.strip(r'$()\'"'))
             return output.strip() if rcode == 0 else valstring
@@ -99,35 +136,115 @@ class ReadNamelist(object):
 
 
 def load_namelist(*nl_files):
-    '''Load namelist(s) from given file(s)'''
+    '''
+    Load namelist(s) from given file(s).
+    Parsed namelist files are cached for the lifetime of the process, and
+    optionally on disk in the directory given by environment variable
+    NAMELIST_CACHE_DIR.  Files containing environment variables or shell
+    commands ("$") are always parsed afresh.
+    '''
     namelists = utils.Variables()
     for nl_file in nl_files:
         if not os.path.exists(nl_file):
             create_example_nl(nl_file)
-        inside_namelist = False
-        nl_linelist = []
-        try:
-            infile = open(nl_file, 'r')
-        except IOError:
-            msg = 'load_namelist: Failed to open namelist file for reading: '
-            utils.log_msg(msg + nl_file, level='FAIL')
-
-        for line in infile.readlines():
-            if line[0] == '&':
-                inside_namelist = True
-                working_name = line.strip().strip('&')
-            elif line[0] == '/':
-                inside_namelist = False
-                setattr(namelists, working_name,
-                        ReadNamelist(working_name, nl_linelist))
-                nl_linelist = []
-            elif inside_namelist:
-                nl_linelist.append(line.strip().strip(','))
-        infile.close()
+        for working_name, parsed in _parse_namelist_file(nl_file):
+            setattr(namelists, working_name,
+                    ReadNamelist(working_name, None, parsed=parsed))
 
     return namelists
 
 
+def _file_key(nl_file):
+    ''' Return a key identifying the current version of a file '''
+    stat = os.stat(nl_file)
+    return (stat.st_ino, stat.st_size,
+            getattr(stat, 'st_mtime_ns', stat.st_mtime))
+
+
+def _disk_cache_file(nl_file):
+    '''
+    Return the name of the on-disk cache for a namelist file, or None if
+    no cache directory is provided
+    '''
+    cachedir = utils.load_env('NAMELIST_CACHE_DIR')
+    if not cachedir:
+        return None
+    pathkey = hashlib.md5(nl_file.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(cachedir, '{}.{}.pickle'.format(
+        os.path.basename(nl_file), pathkey
+        ))
+
+
+def _parse_namelist_file(nl_file):
+    '''
+    Return a list of (namelist name, [(variable, value), ...]) tuples for
+    each namelist in the given file, using cached values where available.
+    '''
+    nl_file = os.path.abspath(nl_file)
+    try:
+        filekey = _file_key(nl_file)
+    except OSError:
+        filekey = None
+
+    try:
+        cachekey, parsed = NAMELIST_CACHE[nl_file]
+        if filekey and cachekey == filekey:
+            return parsed
+    except KeyError:
+        pass
+
+    cachefile = _disk_cache_file(nl_file) if filekey else None
+    if cachefile:
+        try:
+            with open(cachefile, 'rb') as cache:
+                cachekey, parsed = pickle.load(cache)
+            if cachekey == filekey:
+                NAMELIST_CACHE[nl_file] = (filekey, parsed)
+                return parsed
+        except (IOError, EOFError, ValueError, TypeError,
+                pickle.UnpicklingError):
+            pass
+
+    try:
+        infile = open(nl_file, 'r')
+    except IOError:
+        msg = 'load_namelist: Failed to open namelist file for reading: '
+        utils.log_msg(msg + nl_file, level='FAIL')
+
+    inside_namelist = False
+    nl_linelist = []
+    parsed = []
+    cacheable = filekey is not None
+    for line in infile.readlines():
+        if line[0] == '&':
+            inside_namelist = True
+            working_name = line.strip().strip('&')
+        elif line[0] == '/':
+            inside_namelist = False
+            parsed.append((working_name,
+                           ReadNamelist._parse_variables(nl_linelist)))
+            nl_linelist = []
+        elif inside_namelist:
+            nl_linelist.append(line.strip().strip(','))
+            if '$' in line:
+                # Values are dependent on the environment
+                cacheable = False
+    infile.close()
+
+    if cacheable:
+        NAMELIST_CACHE[nl_file] = (filekey, parsed)
+        if cachefile:
+            try:
+                with open(cachefile + '.tmp', 'wb') as cache:
+                    pickle.dump((filekey, parsed), cache, protocol=2)
+                os.rename(cachefile + '.tmp', cachefile)
+            except (IOError, OSError):
+                utils.log_msg('load_namelist: Unable to write namelist cache '
+                              'file: ' + cachefile, level='WARN')
+
+    return parsed
+
+
 def create_example_nl(nl_file):
     '''
     If no input namelist exist, provide an example using the
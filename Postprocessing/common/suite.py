@@ -30,6 +30,7 @@ import os
 
 import timer
 import utils
+import archive_log
 
 import moo
 import archer
@@ -94,6 +95,7 @@ class SuiteEnvironment(object):
 
         # Monitoring attributes
         self.archive_ok = True
+        self._archive_log = None
 
     @property
     def umtask(self):
@@ -113,6 +115,25 @@ class SuiteEnvironment(object):
         '''Archiving log will be sent to the suite log directory'''
         return self.envars['CYLC_TASK_LOG_ROOT'] + '-archive.log'
 
+    @property
+    def archive_log(self):
+        '''
+        Archiving log, with index.  Opened on first use, and remains open
+        for the lifetime of the SuiteEnvironment.
+        '''
+        if self._archive_log is None:
+            self._archive_log = archive_log.ArchiveLog(
+                self.logfile, checksum=self.naml.archive_log_checksum
+                )
+        return self._archive_log
+
+    def archive_status(self, filename):
+        '''
+        Return the latest status of the given file in the archive log:
+        True if archived, False if archiving failed, None if not recorded.
+        '''
+        return self.archive_log.archived(filename)
+
     @property
     def meanref(self):
         '''Return mean reference date for creation of means'''
@@ -165,33 +186,43 @@ class SuiteEnvironment(object):
         return rcode
 
     def archive_file(self, archfile, logfile=None, preproc=False):
-        '''Archive file and write to logfile'''
-        log_line = os.path.basename(archfile)
+        '''
+        Archive file and write to logfile.
+        Optional Arguments:
+          logfile - Archive log: the filename of a text log, an open file
+                    handle or an archive_log.ArchiveLog object.
+                    Default=self.archive_log
+        '''
         if utils.get_debugmode():
             utils.log_msg('Archiving: ' + archfile, level='DEBUG')
-            log_line += ' WOULD BE ARCHIVED\n'
+            status = 'WOULD BE ARCHIVED'
             arch_rcode = 0
         else:
             arch_rcode = self._archive_command(archfile, preproc)
             if arch_rcode == 0:
-                log_line += ' ARCHIVE OK\n'
+                status = 'ARCHIVE OK'
             elif self.archive_system == 'moose' and arch_rcode == 11:
-                log_line += ' FILE NOT ARCHIVED. File contains no fields\n'
+                status = 'FILE NOT ARCHIVED. File contains no fields'
                 arch_rcode = 0
             else:
-                log_line += ' ARCHIVE FAILED. Archive process error\n'
+                status = 'ARCHIVE FAILED. Archive process error'
                 self.archive_ok = False
 
-        if not logfile:
-            logfile = self.logfile
+        if not logfile or logfile == self.logfile:
+            logfile = self.archive_log
 
         try:
-            logfile.write(log_line)
-        except AttributeError:  # String, not file handle given.  Open new file
-            action = 'a' if os.path.exists(logfile) else 'w'
-            logfile = open(logfile, action)
-            logfile.write(log_line)
-            logfile.close()
+            logfile.record(archfile, status)
+        except AttributeError:
+            log_line = '{} {}\n'.format(os.path.basename(archfile), status)
+            try:
+                logfile.write(log_line)
+            except AttributeError:
+                # String, not file handle given.  Open new file
+                action = 'a' if os.path.exists(logfile) else 'w'
+                logfile = open(logfile, action)
+                logfile.write(log_line)
+                logfile.close()
 
         return arch_rcode
 
@@ -243,6 +274,46 @@ class SuiteEnvironment(object):
         utils.log_msg(msg, level=level)
         return ret_code
 
+    @timer.run_timer
+    def preproc_netcdf4(self, filename, compression=0, chunking=None):
+        '''
+        Compression of standard netCDF file output prior to archive,
+        in-process using the netCDF4 library.
+        Chunking arguments are as for nccopy, with the addition of
+        variable specific chunk sizes: <variable>:<dimension>/<size>
+        '''
+        import netcdf_utils
+
+        tmpfile = filename + '.tmp'
+        utils.log_msg('Compressing file using netCDF4 library: deflation={}, '
+                      'chunking={}'.format(compression, chunking))
+        ret_code = 0
+        level = 'OK'
+        try:
+            netcdf_utils.compress_netcdf(filename, tmpfile, compression,
+                                         chunking=chunking)
+        except (RuntimeError, IOError, OSError, ValueError,
+                KeyError) as exc:
+            msg = 'netcdf4: Compression failed of file {}\n{}'.\
+                format(filename, exc)
+            level = 'ERROR'
+            ret_code = 99
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+        else:
+            msg = 'netcdf4: Compression successful of file {}'.\
+                format(filename)
+            # Move the compressed file so it overwrites the original
+            try:
+                os.rename(tmpfile, filename)
+            except OSError:
+                msg = msg + '\n -> Failed to rename compressed file'
+                level = 'ERROR'
+                ret_code = 99
+
+        utils.log_msg(msg, level=level)
+        return ret_code
+
     @timer.run_timer
     def preproc_ncdump(self, fname, **kwargs):
         '''
@@ -351,6 +422,7 @@ class SuitePostProc(object):
     mean_reference_date = 0, 12, 1
     process_toplevel = False
     archive_toplevel = False
+    archive_log_checksum = False
 
 class ScriptArch(object):
     ''' Default namelist for the generic archiving script '''
@@ -359,6 +431,8 @@ class ScriptArch(object):
 class TimerInfo(object):
     '''Default namelist for timer'''
     ltimer = False
+    timer_format = 'none'
+    timer_dir = '$CYLC_SUITE_SHARE_DIR/timer'
 
 
 NAMELISTS = {'suitegen': SuitePostProc,
@@ -17,12 +17,34 @@ NAME
 DESCRIPTION
     Timing routines for performance analysis of the post-processing code
 
+ENVIRONMENT VARIABLES
+    Required only where namelist:monitoring/timer_format is set:
+      CYLC_TASK_NAME
+      CYLC_TASK_CYCLE_POINT
 '''
 import time
 import operator
 import re
 import sys
+import os
 import inspect
+import json
+import csv
+import threading
+
+try:
+    import resource
+except ImportError:
+    # resource is only available on Unix platforms
+    resource = None
+
+# Fields recorded for each timed function
+#    total, min, max and calls refer to elapsed time in seconds
+#    cpu       - CPU time (s), including that of completed child processes
+#    maxrss    - Increase in peak resident set size of the process (kB)
+#    read      - Bytes read by the process
+#    write     - Bytes written by the process
+FIELDS = ['total', 'min', 'max', 'calls', 'cpu', 'maxrss', 'read', 'write']
 
 
 def initialise_timer():
@@ -36,7 +58,9 @@ def initialise_timer():
     namelist = load_namelist('monitorpp.nl')
     try:
         if namelist.monitoring.ltimer:
-            timer_instance = PostProcTimer()
+            timer_instance = PostProcTimer(
+                outfile=_output_file(namelist.monitoring)
+                )
         else:
             timer_instance = PostProcTimerNull()
     except AttributeError:
@@ -44,6 +68,51 @@ def initialise_timer():
     globals()['tim'] = timer_instance
 
 
+def _output_file(monitoring):
+    '''
+    Return the name of the file to which the timings are written for the
+    current cycle, or None where no machine-readable output is requested.
+    Arguments:
+        monitoring - <type TimerInfo> namelist:monitoring
+    '''
+    fmt = getattr(monitoring, 'timer_format', None)
+    if fmt not in ['json', 'csv']:
+        return None
+
+    outdir = os.path.expandvars(getattr(monitoring, 'timer_dir', None) or
+                                os.getcwd())
+    fname = '{}.{}.{}'.format(os.environ.get('CYLC_TASK_NAME', 'postproc'),
+                              os.environ.get('CYLC_TASK_CYCLE_POINT', 'cycle'),
+                              fmt)
+    return os.path.join(outdir, fname)
+
+
+def _resource_usage():
+    '''
+    Return the resources used by the process so far:
+        [CPU time (s), peak resident set size (kB), bytes read, bytes written]
+    CPU time includes that of any child processes which have completed.
+    Bytes read and written are taken from /proc/self/io where available, and
+    include reads from and writes to network filesystems.
+    '''
+    cpu = sum(os.times()[:4])
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss \
+        if resource else 0
+    read_bytes = write_bytes = 0
+    try:
+        with open('/proc/self/io') as procio:
+            for line in procio:
+                key, _, val = line.partition(':')
+                if key == 'rchar':
+                    read_bytes = int(val)
+                elif key == 'wchar':
+                    write_bytes = int(val)
+    except (IOError, OSError):
+        pass
+
+    return [cpu, maxrss, read_bytes, write_bytes]
+
+
 def set_nulltimer():
     '''
     Set method for the PostProcTimerNull to allow the decorated functions
@@ -68,6 +137,21 @@ def finalise_timer():
     tim.finalise()
 
 
+def collect_timings():
+    '''
+    Return the timings gathered so far by the active timer, and reset them.
+    Used to pass timings from a child process back to the parent process.
+    '''
+    return tim.collect()
+
+
+def merge_timings(timings):
+    '''
+    Merge timings collected in a separate process into the active timer
+    '''
+    tim.merge(timings)
+
+
 def start_custom(label):
     '''
     Start a custom timer at arbitary points within a function
@@ -144,6 +228,18 @@ class PostProcTimerNull(object):
         '''
         pass
 
+    def collect(self):
+        '''
+        Dummy collect method
+        '''
+        return {}
+
+    def merge(self, _):
+        '''
+        Dummy merge method
+        '''
+        pass
+
     def finalise(self):
         '''
         Dummy finalise method
@@ -157,22 +253,47 @@ class PostProcTimer(PostProcTimerNull):
     the end of the model run when finalise is called
     '''
 
-    def __init__(self):
+    def __init__(self, outfile=None):
 
         PostProcTimerNull.__init__(self, msg='Timer is running')
         # The dictionary will contain a list of the total time, min time
-        # max time and total number of calls to a particular routine
+        # max time and total number of calls to a particular routine,
+        # followed by the resources used - see FIELDS
         self.timings = {}
         self.run_start = time.time()
+        # File to which the timings are written by finalise: .json or .csv
+        self.outfile = outfile
 
-        # Cache start times to allow for repeated calling of the module
+        # Cache start times and resource usage to allow for repeated
+        # calling of the module
         self.timing_cache = {}
+        # Timed functions may be called concurrently from worker threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(fnname):
+        '''
+        Return the timing_cache key for a function called from the
+        current thread.  Calls from worker threads are distinguished by
+        the thread identifier.
+        '''
+        thread = threading.current_thread()
+        try:
+            main_thread = threading.main_thread()
+        except AttributeError:
+            # Python 2: threading.main_thread is not available
+            main_thread = thread if thread.name == 'MainThread' else None
+        if thread is main_thread:
+            return fnname
+        return '{}@{}'.format(fnname, thread.ident)
 
     def start_timer(self, fnname):
         '''
         Initialise the timer for a given function
         '''
-        self.timing_cache[fnname] = time.time()
+        start = (time.time(), _resource_usage())
+        with self._lock:
+            self.timing_cache[PostProcTimer._cache_key(fnname)] = start
 
     def end_timer(self, function_name):
         '''
@@ -180,18 +301,59 @@ class PostProcTimer(PostProcTimerNull):
         a function is called more than once
         '''
         end_time = time.time()
-        total_time = end_time - self.timing_cache[function_name]
-        self.timing_cache.pop(function_name)
+        end_usage = _resource_usage()
+        with self._lock:
+            start_time, start_usage = self.timing_cache.pop(
+                PostProcTimer._cache_key(function_name)
+                )
+            self._update(function_name, end_time - start_time,
+                         zip(start_usage, end_usage))
+
+    def _update(self, function_name, total_time, usage):
+        '''
+        Add a single call of a function to the timings.
+        Arguments:
+            function_name - Timer label
+            total_time    - Elapsed time of the call
+            usage         - List of (start, end) resource usage values
+        '''
         try:
             time_list = self.timings[function_name]
         except KeyError:
-            time_list = [0, 1e10, 0, 0]
+            time_list = [0, 1e10, 0, 0, 0, 0, 0, 0]
         time_list[0] += total_time
         time_list[1] = min(total_time, time_list[1])
         time_list[2] = max(total_time, time_list[2])
         time_list[3] += 1
+        for i, (start, end) in enumerate(usage):
+            time_list[4 + i] += end - start
         self.timings[function_name] = time_list
 
+    def collect(self):
+        '''
+        Return the timings dictionary and reset it, ready for further timing
+        '''
+        timings = self.timings
+        self.timings = {}
+        return timings
+
+    def merge(self, timings):
+        '''
+        Merge a timings dictionary, as returned by collect, with the
+        timings held by this timer
+        '''
+        for function_name, new_list in timings.items():
+            try:
+                time_list = self.timings[function_name]
+            except KeyError:
+                time_list = [0, 1e10, 0, 0, 0, 0, 0, 0]
+            time_list[0] += new_list[0]
+            time_list[1] = min(new_list[1], time_list[1])
+            time_list[2] = max(new_list[2], time_list[2])
+            for i in range(3, len(FIELDS)):
+                time_list[i] += new_list[i]
+            self.timings[function_name] = time_list
+
     def _check_timer_end(self):
         '''
         Ensure that all routines that have started a timer have also ended
@@ -234,3 +396,45 @@ class PostProcTimer(PostProcTimerNull):
                        self.timings[func[0]][0] / self.timings[func[0]][3],
                        self.timings[func[0]][3])
         sys.stdout.write(summary)
+
+        if self.outfile:
+            self._write_output(run_length)
+
+    def _write_output(self, run_length):
+        '''
+        Write the timings to self.outfile in JSON or CSV format, as
+        determined by the file extension.
+        Arguments:
+            run_length - <type float> Time between the timer initialise
+                         and finalise
+        '''
+        try:
+            os.makedirs(os.path.dirname(self.outfile))
+        except OSError:
+            # Directory already exists, or is not writable - caught below
+            pass
+
+        try:
+            with open(self.outfile, 'w') as outfile:
+                if self.outfile.endswith('.json'):
+                    json.dump({
+                        'task': os.environ.get('CYLC_TASK_NAME'),
+                        'cycle': os.environ.get('CYLC_TASK_CYCLE_POINT'),
+                        'run_length': run_length,
+                        'functions': {
+                            fn: dict(zip(FIELDS, vals))
+                            for fn, vals in self.timings.items()
+                            },
+                        }, outfile, indent=2, sort_keys=True)
+                else:
+                    writer = csv.writer(outfile)
+                    writer.writerow(['function'] + FIELDS)
+                    for function_name in sorted(self.timings):
+                        writer.writerow([function_name] +
+                                        self.timings[function_name])
+        except (IOError, OSError) as exc:
+            msg = '[WARN] Unable to write timings to {}: {}\n'
+            sys.stderr.write(msg.format(self.outfile, exc))
+        else:
+            msg = '[INFO] Timings written to {}\n'
+            sys.stdout.write(msg.format(self.outfile))
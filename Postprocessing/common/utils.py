@@ -20,16 +20,49 @@ DESCRIPTION
 '''
 import sys
 import re
+import collections
 import os
 import errno
 import shutil
 import subprocess
+import threading
+import time
 import timer
 
 
 globals()['debug_mode'] = None
 globals()['debug_ok'] = True
 
+# Calendars available to the in-process date arithmetic: _mod_calendar_date
+#    Key = Calendar name.  Value = Equivalent calendar
+CALENDARS = {
+    '360day': '360day',
+    '365day': '365day',
+    'noleap': '365day',
+    '366day': '366day',
+    'all_leap': '366day',
+    'gregorian': 'gregorian',
+    'standard': 'gregorian',
+    'proleptic_gregorian': 'gregorian',
+    }
+DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+# Per-process directory index used by get_subset
+#    Key = Absolute directory path.  Value = Dictionary of:
+#      stat     - (device, inode, mtime) of the directory when listed
+#      listed   - Time at which the directory was listed
+#      files    - Sorted list of directory contents
+#      matches  - Cache of get_subset results: {pattern: [files]}
+DIR_INDEX = {}
+DIR_INDEX_STATS = {'hits': 0, 'misses': 0, 'rescans': 0}
+# A directory modified within DIR_INDEX_MARGIN seconds of being listed is
+# always re-listed, allowing for coarse filesystem timestamps and clock skew
+DIR_INDEX_MARGIN = 2.0
+# Compiled regular expressions used by get_subset
+#    Key = Pattern string.  Value = Compiled pattern
+PATTERNS = {}
+
+
 class Variables(object):
     '''Object to hold a group of variables'''
 
@@ -166,14 +199,7 @@ def exec_subproc(cmd, verbose=True, cwd=os.getcwd()):
                 True: reproduce std.out regardless of outcome
       cwd     = Directory in which to execute the command
     '''
-    import shlex
-
-    cmd_array = [cmd]
-    if not isinstance(cmd, list):
-        cmd_array = cmd.split(';')
-        for i, cmd in enumerate(cmd_array):
-            # Use shlex.split to cope with arguments that contain whitespace
-            cmd_array[i] = shlex.split(cmd)
+    cmd_array = _split_command(cmd)
 
     # Initialise rcode, in the event there is no command
     rcode = 99
@@ -201,6 +227,243 @@ def exec_subproc(cmd, verbose=True, cwd=os.getcwd()):
     return rcode, output
 
 
+def _split_command(cmd):
+    '''
+    Return a list of commands, each as a list of words, for a command
+    given in either of the forms accepted by exec_subproc.
+    '''
+    import shlex
+
+    cmd_array = [cmd]
+    if not isinstance(cmd, list):
+        cmd_array = cmd.split(';')
+        for i, cmd in enumerate(cmd_array):
+            # Use shlex.split to cope with arguments that contain whitespace
+            cmd_array[i] = shlex.split(cmd)
+    return cmd_array
+
+
+# Result of a single command run by exec_subproc_batch
+#    cmd     - Command as provided
+#    rcode   - Return code.  None if the command was not run
+#    stdout  - Standard output
+#    stderr  - Standard error
+#    elapsed - Wall time taken to run the command (seconds)
+CommandResult = collections.namedtuple(
+    'CommandResult', ['cmd', 'rcode', 'stdout', 'stderr', 'elapsed']
+    )
+
+
+def max_subprocesses():
+    '''
+    Return the maximum number of commands which may be run concurrently,
+    taken from environment variable MAX_SUBPROCESSES.  Default=4
+    '''
+    try:
+        nproc = int(load_env('MAX_SUBPROCESSES', default_value=4))
+    except ValueError:
+        log_msg('MAX_SUBPROCESSES should be an integer', level='FAIL')
+    return max(nproc, 1)
+
+
+def map_concurrent(func, items, max_workers=None, footprints=None,
+                   footprint_limit=0):
+    '''
+    Generator applying func to each of a list of items, concurrently using
+    a bounded pool of worker threads.  This is the common means of running
+    independent tasks concurrently: Tasks are expected to spend most of
+    their time in external commands or I/O.
+    Yields the result for each item in the order given, as soon as it is
+    available.
+    Optional arguments:
+      max_workers     - Maximum number of items to process at any one time.
+                        Default=max_subprocesses()
+      footprints      - <type list> Resource requirement of each item, for
+                        example estimated memory
+      footprint_limit - Maximum total footprint of the items in progress at
+                        any one time.  An item is always started where no
+                        others are in progress.  Default=0 (unlimited)
+    Items are started in the order given, except that an item which would
+    exceed footprint_limit is passed over in favour of a later item which
+    fits.
+    Where func raises an exception (including SystemExit following an
+    ERROR message), or the caller stops iterating, no further items are
+    started.  Items already in progress are completed before the exception
+    is re-raised to the caller once the failed item is reached.
+    '''
+    items = list(items)
+    workers = min(max_workers or max_subprocesses(), len(items))
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    footprints = footprints or [0] * len(items)
+    pending = list(range(len(items)))
+    results = {}
+    state = {'running': 0, 'footprint': 0, 'failure': None, 'stop': False}
+    condition = threading.Condition()
+
+    def next_item():
+        '''
+        Return the index of the first pending item which fits within the
+        footprint limit.  Must be called with the condition lock held.
+        '''
+        for pos, index in enumerate(pending):
+            if state['running'] == 0 or footprint_limit <= 0 or \
+                    state['footprint'] + footprints[index] <= footprint_limit:
+                return pending.pop(pos)
+        return None
+
+    def worker():
+        ''' Process items until none remain, or processing is stopped '''
+        while True:
+            with condition:
+                index = None
+                while pending and not state['stop']:
+                    index = next_item()
+                    if index is not None:
+                        break
+                    condition.wait()
+                if index is None:
+                    return
+                state['running'] += 1
+                state['footprint'] += footprints[index]
+
+            outcome = None
+            try:
+                outcome = (True, func(items[index]))
+            except (Exception, SystemExit) as exc:
+                outcome = (False, exc)
+            finally:
+                # Always release the worker slot, whatever the outcome
+                with condition:
+                    if outcome is None:
+                        outcome = (False, RuntimeError('map_concurrent: '
+                                                       'Processing aborted'))
+                    results[index] = outcome
+                    state['running'] -= 1
+                    state['footprint'] -= footprints[index]
+                    if not outcome[0]:
+                        state['stop'] = True
+                        state['failure'] = state['failure'] or outcome[1]
+                    condition.notify_all()
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for index in range(len(items)):
+            with condition:
+                while index not in results and \
+                        not (state['stop'] and index in pending):
+                    condition.wait()
+                outcome = results.pop(index, None)
+            if outcome is None:
+                # Not started following failure of another item
+                break
+            if not outcome[0]:
+                raise outcome[1]
+            yield outcome[1]
+    finally:
+        with condition:
+            state['stop'] = True
+            condition.notify_all()
+        for thread in threads:
+            thread.join()
+
+    if state['failure'] is not None:
+        raise state['failure']
+
+
+@timer.run_timer
+def exec_subproc_batch(cmds, max_workers=None, verbose=True,
+                       cwd=os.getcwd(), on_error='continue'):
+    '''
+    Execute a batch of independent shell commands concurrently, using a
+    bounded pool of worker threads.
+    Arguments:
+      cmds        - <type list> Commands, each in either of the forms
+                    accepted by exec_subproc
+    Optional arguments:
+      max_workers - Maximum number of commands to run at any one time.
+                    Default=max_subprocesses()
+      verbose     - As exec_subproc
+      cwd         - Directory in which to execute the commands
+      on_error    - Policy on failure of a command:
+                    'continue' - Run all commands regardless.  Default
+                    'cancel'   - Start no further commands.  Commands not
+                                 run are returned with rcode=None
+                    'fail'     - As 'cancel', and raise an ERROR once the
+                                 running commands have completed
+    Returns a list of CommandResult in the order the commands were given.
+    Output is logged, as for exec_subproc, once all commands are complete.
+    '''
+    cmds = ensure_list(cmds)
+    if not cmds:
+        return []
+    workers = min(max_workers or max_subprocesses(), len(cmds))
+    cancelled = threading.Event()
+
+    def run_command(cmd):
+        ''' Run a single command in a worker thread '''
+        if cancelled.is_set():
+            return CommandResult(cmd, None, '', 'Command not run', 0.0)
+        result = _exec_command(cmd, cwd)
+        if result.rcode != 0 and on_error != 'continue':
+            cancelled.set()
+        return result
+
+    results = list(map_concurrent(run_command, cmds, max_workers=workers))
+
+    for result in results:
+        if result.rcode == 0:
+            if verbose:
+                log_msg('[SUBPROCESS]: ' + str(result.stdout))
+        elif result.rcode is not None:
+            msg = '[SUBPROCESS]: Command: {}\n[SUBPROCESS]: Error = {}:\n\t{}'
+            log_msg(msg.format(result.cmd, result.rcode,
+                               result.stdout + result.stderr), level='WARN')
+
+    failed = [r for r in results if r.rcode != 0]
+    if failed and on_error == 'fail':
+        log_msg('exec_subproc_batch: {} of {} commands failed or were not '
+                'run'.format(len(failed), len(results)), level='ERROR')
+
+    return results
+
+
+def _exec_command(cmd, cwd):
+    '''
+    Execute a shell command, in either of the forms accepted by exec_subproc,
+    retaining standard output and error separately.
+    Returns a CommandResult.
+    '''
+    start = time.time()
+    rcode = 99
+    stdout = ''
+    stderr = 'No command provided'
+    for i, subcmd in enumerate(_split_command(cmd)):
+        if i == 0:
+            stderr = ''
+        try:
+            proc = subprocess.Popen(subcmd, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE,
+                                    universal_newlines=True, cwd=cwd)
+            out, err = proc.communicate()
+            rcode = proc.returncode
+        except OSError as exc:
+            out = ''
+            err = exc.strerror
+            rcode = exc.errno
+        stdout += out
+        stderr += err
+        if rcode != 0:
+            break
+
+    return CommandResult(cmd, rcode, stdout, stderr, time.time() - start)
+
+
 def get_utility_avail(utility):
     '''Return True/False if shell command is available'''
     try:
@@ -213,16 +476,82 @@ def get_utility_avail(utility):
 
 
 def get_subset(datadir, pattern):
-    '''Returns a list of files matching a given regex'''
+    '''
+    Returns a list of files matching a given regex.
+    The directory listing is held in a per-process index which is refreshed
+    when the directory modification time changes, or when the directory is
+    modified by copy_files, remove_files or move_files.
+    '''
     datadir = check_directory(datadir)
     try:
-        patt = re.compile(pattern)
+        patt = PATTERNS.get(pattern) or re.compile(pattern)
     except TypeError:
         log_msg('get_subset: Incompatible pattern supplied.', level='WARN')
-        files = []
+        return []
+    PATTERNS[pattern] = patt
+
+    index = _directory_index(datadir)
+    try:
+        files = index['matches'][pattern]
+    except KeyError:
+        files = index['matches'][pattern] = \
+            [fn for fn in index['files'] if patt.search(fn)]
+    return list(files)
+
+
+def _directory_index(datadir):
+    '''
+    Return the DIR_INDEX entry for a directory, listing the directory
+    contents with os.scandir if the entry is missing or out of date.
+    '''
+    datadir = os.path.abspath(datadir)
+    dstat = os.stat(datadir)
+    dirstat = (dstat.st_dev, dstat.st_ino, dstat.st_mtime)
+    index = DIR_INDEX.get(datadir)
+    if index is None:
+        DIR_INDEX_STATS['misses'] += 1
+    elif index['stat'] == dirstat and \
+            index['listed'] - dstat.st_mtime > DIR_INDEX_MARGIN:
+        DIR_INDEX_STATS['hits'] += 1
+        return index
     else:
-        files = [fn for fn in sorted(os.listdir(datadir)) if patt.search(fn)]
-    return files
+        DIR_INDEX_STATS['rescans'] += 1
+
+    listed = time.time()
+    try:
+        files = [entry.name for entry in os.scandir(datadir)]
+    except AttributeError:
+        # os.scandir is not available at Python2.7
+        files = os.listdir(datadir)
+    index = {'stat': dirstat, 'listed': listed,
+             'files': sorted(files), 'matches': {}}
+    DIR_INDEX[datadir] = index
+    return index
+
+
+def invalidate_dir_index(paths):
+    '''
+    Remove the directories containing the given path(s) from the
+    get_subset directory index.
+    '''
+    for path in ensure_list(paths):
+        DIR_INDEX.pop(os.path.dirname(os.path.abspath(path)), None)
+
+
+def dir_index_stats(reset=False):
+    '''
+    Return a copy of the get_subset directory index counters:
+      hits    - Listings served from the index
+      misses  - Directories listed for the first time
+      rescans - Directories re-listed following a modification
+    Optional Arguments:
+      reset   - Reset the counters to zero
+    '''
+    stats = dict(DIR_INDEX_STATS)
+    if reset:
+        for key in DIR_INDEX_STATS:
+            DIR_INDEX_STATS[key] = 0
+    return stats
 
 
 def check_directory(datadir):
@@ -297,6 +626,7 @@ def create_dir(dirname, path=None):
         dirname = os.path.join(path, dirname)
     try:
         os.makedirs(dirname)
+        invalidate_dir_index(dirname)
     except OSError as exc:
         if exc.errno == errno.EEXIST and os.path.isdir(dirname):
             pass
@@ -305,10 +635,96 @@ def create_dir(dirname, path=None):
                     level='FAIL')
 
 
+# Buffer size for file copies where os.sendfile is unavailable
+COPY_BUFSIZE = 16 * 1024 * 1024
+
+
+def _map_files(func, args, max_workers=None):
+    '''
+    Apply func to each of a list of argument tuples, concurrently using a
+    bounded pool of worker threads.  Return a list of the results in the
+    order the arguments were given.
+    Optional arguments:
+      max_workers - Maximum number of files to process at any one time.
+                    Default=max_subprocesses()
+    '''
+    return list(map_concurrent(lambda arg: func(*arg), args,
+                               max_workers=max_workers))
+
+
+def _same_device(srcfile, destination):
+    ''' Return True if srcfile and destination share a filesystem '''
+    try:
+        return os.stat(srcfile).st_dev == os.stat(destination).st_dev
+    except OSError:
+        return False
+
+
+def _copy_file(srcfile, output, link=False):
+    '''
+    Copy a single file, for use in a worker thread.
+    Where link=True and the output shares a filesystem with the source file
+    a hardlink is created in place of a copy.
+    Returns an error message, or None on success.
+    '''
+    if link and _same_device(srcfile, os.path.dirname(output) or os.curdir):
+        tmpfile = output + '.link'
+        try:
+            os.link(srcfile, tmpfile)
+            # Replace any existing target
+            os.rename(tmpfile, output)
+            return None
+        except OSError:
+            # Fall back to a copy - for example where hardlinks are not
+            # supported by the filesystem
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+    try:
+        src = open(srcfile, 'rb')
+    except IOError as exc:
+        msg = 'copy_files: Failed to read from source file: ' + srcfile
+        return ' - '.join([msg, exc.strerror])
+
+    with src:
+        try:
+            out = open(output, 'wb')
+        except IOError as exc:
+            msg = 'copy_files: Failed to write to target file: ' + output
+            return ' - '.join([msg, exc.strerror])
+
+        with out:
+            try:
+                _sendfile(src, out)
+            except (AttributeError, OSError):
+                # os.sendfile is not available at Python2.7, nor for all
+                # combinations of platform and filesystem
+                src.seek(0)
+                out.seek(0)
+                out.truncate()
+                shutil.copyfileobj(src, out, COPY_BUFSIZE)
+    return None
+
+
+def _sendfile(src, out):
+    ''' Copy between open files within the kernel using os.sendfile '''
+    infd = src.fileno()
+    outfd = out.fileno()
+    size = os.fstat(infd).st_size
+    offset = 0
+    while offset < size:
+        sent = os.sendfile(outfd, infd, offset, min(size - offset,
+                                                    COPY_BUFSIZE))
+        if sent == 0:
+            break
+        offset += sent
+
+
 @timer.run_timer
-def copy_files(cpfiles, destination=None, tmp_ext='.tmp'):
+def copy_files(cpfiles, destination=None, tmp_ext='.tmp', link=False,
+               max_workers=None):
     '''
-    Copy file(s).
+    Copy file(s).  Lists of files are copied concurrently.
     Optional arguments:
         destination  - Where provided destination must be a writable
                        directory location
@@ -316,6 +732,12 @@ def copy_files(cpfiles, destination=None, tmp_ext='.tmp'):
                        copied to the  original directory
                        (os.path.dirname(filename)) with a "tmp_ext" extension
         tmp_ext      - Extension used when copying to the same directory
+        link         - Create hardlinks in place of copies where the source
+                       and target share a filesystem.  Only appropriate
+                       where neither file will subsequently be modified
+                       in place.  Default=False
+        max_workers  - Maximum number of files to copy at any one time.
+                       Default=max_subprocesses()
     '''
     if destination:
         destination = check_directory(destination)
@@ -324,26 +746,18 @@ def copy_files(cpfiles, destination=None, tmp_ext='.tmp'):
     outputfiles = []
     for srcfile in cpfiles:
         if destination:
-            output = os.path.join(destination, os.path.basename(srcfile))
+            outputfiles.append(os.path.join(destination,
+                                            os.path.basename(srcfile)))
         else:
-            output = srcfile + tmp_ext
+            outputfiles.append(srcfile + tmp_ext)
 
-        try:
-            src = open(srcfile, 'rb')
-        except IOError as exc:
-            msg = 'copy_files: Failed to read from source file: ' + srcfile
-            log_msg(' - '.join([msg, exc.strerror]), level='ERROR')
-
-        try:
-            out = open(output, 'wb')
-        except IOError as exc:
-            msg = 'copy_files: Failed to write to target file: ' + output
-            log_msg(' - '.join([msg, exc.strerror]), level='ERROR')
-
-        shutil.copyfileobj(src, out)
-        src.close()
-        out.close()
-        outputfiles.append(output)
+    errors = _map_files(_copy_file,
+                        [(src, out, link) for src, out in
+                         zip(cpfiles, outputfiles)],
+                        max_workers=max_workers)
+    invalidate_dir_index(outputfiles)
+    for msg in [e for e in errors if e]:
+        log_msg(msg, level='ERROR')
 
     return outputfiles
 
@@ -370,11 +784,52 @@ def remove_files(delfiles, path=None, ignore_non_exist=False):
                 log_msg('remove_files: File does not exist: ' + fname,
                         level='WARN')
 
+    invalidate_dir_index(delfiles)
+
+
+def _move_file(fname, destination):
+    '''
+    Move a single file to a given directory, for use in a worker thread.
+    The file is renamed where the destination shares a filesystem with the
+    file, otherwise it is copied and the original deleted.
+    Returns a list of (message, level) tuples to be logged.
+    '''
+    msgs = []
+    dest_file = os.path.join(destination, os.path.basename(fname))
+    if not os.path.exists(fname):
+        return [('move_files: File does not exist: ' + fname, None)]
+    if os.path.exists(dest_file):
+        if os.path.samefile(fname, dest_file):
+            return [('move_files: Attempted to overwrite original file: ' +
+                     fname, None)]
+        os.remove(dest_file)
+        msgs.append(('move_files: Deleted pre-existing file with same name '
+                     'prior to move: ' + dest_file, 'WARN'))
+
+    try:
+        os.rename(fname, dest_file)
+    except OSError as exc:
+        if exc.errno != errno.EXDEV:
+            msgs.append(('move_files: Failed to move file: {} - {}'.
+                         format(fname, exc.strerror), None))
+        elif os.path.isdir(fname):
+            shutil.move(fname, dest_file)
+        else:
+            # Different filesystems
+            err = _copy_file(fname, dest_file)
+            if err:
+                msgs.append((err.replace('copy_files', 'move_files'), None))
+            else:
+                os.remove(fname)
+    return msgs
+
 
 @timer.run_timer
-def move_files(mvfiles, destination, originpath=None, fail_on_err=False):
+def move_files(mvfiles, destination, originpath=None, fail_on_err=False,
+               max_workers=None):
     '''
     Move a single file or list of files to a given directory.
+    Lists of files are moved concurrently.
     Optionally a directory of origin may be specified.
     Arguments:
       mvfiles     - filename or list of filenames to be moved
@@ -385,6 +840,8 @@ def move_files(mvfiles, destination, originpath=None, fail_on_err=False):
       fail_on_err - Failure to move the file results in app failure.
                     Primary cause of failure is a non-existent target file.
                     Default=False
+      max_workers - Maximum number of files to move at any one time.
+                    Default=max_subprocesses()
     '''
     msglevel = 'ERROR' if fail_on_err else 'WARN'
     destination = check_directory(destination)
@@ -393,26 +850,13 @@ def move_files(mvfiles, destination, originpath=None, fail_on_err=False):
         mvfiles = add_path(mvfiles, originpath)
     mvfiles = ensure_list(mvfiles)
 
-    for fname in mvfiles:
-        try:
-            shutil.move(fname, destination)
-        except shutil.Error:
-            if os.path.dirname(fname) == destination:
-                msg = 'move_files: Attempted to overwrite original file: '
-                log_msg(msg + fname, level=msglevel)
-            else:
-                dest_file = os.path.join(destination, os.path.basename(fname))
-                remove_files(dest_file)
-                msg = 'move_files: Deleted pre-existing file with same name ' \
-                    'prior to move: ' + dest_file
-                log_msg(msg, level='WARN')
-                shutil.move(fname, destination)
-        except IOError:
-            # Exception changes in Python 3:
-            #   IOError has been merged into OSError
-            #   shutil.Error is now a child of IOError, therefore exception
-            #   order is important here for compatibility with both 2.7 and 3+
-            log_msg('move_files: File does not exist: ' + fname, level=msglevel)
+    msgs = _map_files(_move_file, [(f, destination) for f in mvfiles],
+                      max_workers=max_workers)
+    invalidate_dir_index(mvfiles + [os.path.join(destination,
+                                                 os.path.basename(fname))
+                                    for fname in mvfiles])
+    for msg, level in [m for filemsgs in msgs for m in filemsgs]:
+        log_msg(msg, level=level or msglevel)
 
 
 def calendar():
@@ -446,12 +890,14 @@ def monthlength(month, year):
 def add_period_to_date(indate, delta):
     '''
     Add a delta (list of integers) to a given date (list of integers).
+        The calendar is taken from environment variable CYLC_CYCLING_MODE.
         For 360day calendar, add period with simple arithmetic for speed
-        For other calendars, call one of
+        For other calendars listed in CALENDARS, use the in-process
+        calendar arithmetic of _mod_calendar_date
+        For any other calendar, call one of
          *`isodatetime` (Cylc 8)
          * `rose date` (Cylc7 and Rose 2019)
-        with calendar argument - taken from environment
-        variable CYLC_CYCLING_MODE.
+        with the calendar argument.
         If no indate is provided ([0,0,0,0,0]) then delta is returned.
     '''
     if isinstance(delta, str):
@@ -463,12 +909,105 @@ def add_period_to_date(indate, delta):
         cal = calendar()
         if cal == '360day':
             outdate = _mod_360day_calendar_date(indate, delta)
+        elif cal.lower() in CALENDARS:
+            outdate = _mod_calendar_date(indate, delta, cal)
         else:
             outdate = _mod_all_calendars_date(indate, delta, cal)
 
     return outdate
 
 
+def _calendar_monthlength(year, month, cal):
+    '''
+    Return the length of a month in days for the given calendar.
+    Arguments:
+        year  - <type int>
+        month - <type int> 1-12
+        cal   - <type str> One of CALENDARS.keys()
+    '''
+    cal = CALENDARS[cal.lower()]
+    if cal == '360day':
+        days = 30
+    elif month == 2 and (cal == '366day' or (
+            cal == 'gregorian' and
+            year % 4 == 0 and (year % 100 != 0 or year % 400 == 0))):
+        days = 29
+    else:
+        days = DAYS_IN_MONTH[month - 1]
+
+    return days
+
+
+@timer.run_timer
+def _mod_calendar_date(indate, delta, cal):
+    '''
+    Pure Python date arithmetic for the calendars listed in CALENDARS.
+    Returns the same date as `isodatetime --calendar <cal> --offset <delta>`:
+      * Each non-zero element of the delta is applied in turn,
+        in the order years, months, days, hours, minutes.
+      * Years and months are added to the calendar date, one month at a
+        time.  Where the day of the month does not exist in a month passed
+        through, the last day of that month is used.
+      * Days, hours and minutes are added as an elapsed time.
+    The date returned is a list of 5 <type int>: [Y,M,D,hh,mm]
+    '''
+    try:
+        outdate = [int(x) for x in indate]
+    except ValueError:
+        log_msg('add_period_to_date: Invalid date representation: ' +
+                str(indate), level='FAIL')
+    while len(outdate) < 5:
+        outdate.append(1 if len(outdate) in [1, 2] else 0)
+    year, month, day, hour, minute = outdate[:5]
+
+    if not (0 <= year <= 9999 and 1 <= month <= 12 and
+            1 <= day <= _calendar_monthlength(year, month, cal) and
+            0 <= hour < 24 and 0 <= minute < 60):
+        log_msg('add_period_to_date: Invalid date for {} calendar: {}'.
+                format(cal, outdate), level='ERROR')
+        return None
+
+    for i, elem in enumerate(delta[:5]):
+        if elem == 0:
+            continue
+        if i == 0:
+            year += elem
+            day = min(day, _calendar_monthlength(year, month, cal))
+        elif i == 1:
+            # Step one month at a time, as isodatetime does, so that the
+            # day is clipped by every month passed through
+            step = 1 if elem > 0 else -1
+            for _ in range(abs(elem)):
+                month += step
+                if month > 12:
+                    month = 1
+                    year += 1
+                elif month < 1:
+                    month = 12
+                    year -= 1
+                day = min(day, _calendar_monthlength(year, month, cal))
+        else:
+            # Days, hours and minutes - elapsed time
+            minute += elem * [24 * 60, 60, 1][i - 2]
+            hour, minute = divmod(hour * 60 + minute, 60)
+            days, hour = divmod(hour, 24)
+            day += days
+            while day < 1:
+                month -= 1
+                if month < 1:
+                    month = 12
+                    year -= 1
+                day += _calendar_monthlength(year, month, cal)
+            while day > _calendar_monthlength(year, month, cal):
+                day -= _calendar_monthlength(year, month, cal)
+                month += 1
+                if month > 12:
+                    month = 1
+                    year += 1
+
+    return [year, month, day, hour, minute]
+
+
 @timer.run_timer
 def _mod_all_calendars_date(indate, delta, cal):
     ''' Call `isodatetime` or `rose date` to return a date '''
@@ -23,11 +23,27 @@ DESCRIPTION
 ARGUMENTS
     The models to run.
         Default: atmos nemo cice
+
+ENVIRONMENT VARIABLES
+  Optional:
+    PARALLEL_MODELS - Maximum number of models to post-process concurrently,
+                      each in a separate process.  Default=1 (serial)
+    MAX_SUBPROCESSES - Maximum number of external commands run concurrently
+                       by each model.  Default=4
+    NAMELIST_CACHE_DIR - Directory in which to cache parsed namelist files
+                         between instances of the app.  Default=None
 '''
 
 import os
 import sys
 import importlib
+import traceback
+import multiprocessing
+try:
+    from StringIO import StringIO
+except ImportError:
+    # Python 3: StringIO module is replaced by io.StringIO
+    from io import StringIO
 
 import timer
 import utils
@@ -72,17 +88,18 @@ def run_postproc():
                 format(name.upper(), err)
             utils.log_msg(msg, level='FAIL')
 
+    try:
+        processes = int(utils.load_env('PARALLEL_MODELS', default_value=1))
+    except ValueError:
+        utils.log_msg('main_pp.py - PARALLEL_MODELS should be an integer',
+                      level='FAIL')
+
     exit_check = {}
-    for name in models:
-        nlfile, mclass = models[name]
-        model = mclass(nlfile)
-        if model.runpp:
-            for meth in model.methods:
-                if model.methods[meth]:
-                    utils.log_msg('Running {} for {}...'.format(meth, name))
-                    getattr(model, meth)()
-            exit_check[name + '_archive'] = model.suite.archive_ok
-            exit_check[name + '_debug'] = model.debug_ok
+    if processes > 1 and len(models) > 1:
+        exit_check = run_models_parallel(models, processes)
+    else:
+        for name in models:
+            exit_check.update(run_model(name, *models[name]))
 
     timer.finalise_timer()
     if not all(exit_check.values()):
@@ -91,6 +108,99 @@ def run_postproc():
         utils.log_msg(msg + ', '.join(fails), level='FAIL')
 
 
+def run_model(name, nlfile, mclass):
+    '''
+    Instantiate a model and run the post-processing methods requested.
+    Return a dictionary of exit checks for the model.
+    '''
+    exit_check = {}
+    model = mclass(nlfile)
+    if model.runpp:
+        _ = utils.dir_index_stats(reset=True)
+        for meth in model.methods:
+            if model.methods[meth]:
+                utils.log_msg('Running {} for {}...'.format(meth, name))
+                getattr(model, meth)()
+        utils.log_msg('Directory index for {}: {hits} hits, {misses} misses, '
+                      '{rescans} rescans'.format(name,
+                                                 **utils.dir_index_stats()))
+        exit_check[name + '_archive'] = model.suite.archive_ok
+        exit_check[name + '_debug'] = model.debug_ok
+
+    return exit_check
+
+
+def _model_worker(task):
+    '''
+    Run a single model in a pool worker process.
+    Standard output and error are captured so that the output of each model
+    can be written to the log in one piece, rather than interleaved with the
+    output of other models.
+    Returns a tuple: (name, exit_check, stdout, stderr, timings)
+    '''
+    name, nlfile, mclass = task
+    sys_out, sys_err = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = StringIO(), StringIO()
+    # Discard any timings inherited from the parent process
+    _ = timer.collect_timings()
+    try:
+        exit_check = run_model(name, nlfile, mclass)
+    except SystemExit:
+        # Failure already reported via utils.log_msg
+        exit_check = {name + '_run': False}
+    except Exception:
+        traceback.print_exc(file=sys.stderr)
+        exit_check = {name + '_run': False}
+    finally:
+        out, err = sys.stdout.getvalue(), sys.stderr.getvalue()
+        sys.stdout, sys.stderr = sys_out, sys_err
+
+    return name, exit_check, out, err, timer.collect_timings()
+
+
+def run_models_parallel(models, processes):
+    '''
+    Post-process the given models concurrently using a pool of processes.
+    The output of each model is written out as the model completes.
+    Should any model fail outright, the remaining models are terminated.
+    Return a dictionary of exit checks for all models.
+    '''
+    processes = min(processes, len(models))
+    utils.log_msg('Post-processing models {} using {} processes'.format(
+        ', '.join(models), processes))
+
+    try:
+        # Child processes must inherit the module search path and the
+        # imported models, so the "fork" start method is required
+        context = multiprocessing.get_context('fork')
+    except AttributeError:
+        # Python 2.7: "fork" is the only method available on POSIX systems
+        context = multiprocessing
+
+    exit_check = {name + '_run': False for name in models}
+    pool = context.Pool(processes=processes)
+    try:
+        tasks = [(name, ) + tuple(models[name]) for name in models]
+        for name, model_check, out, err, timings in \
+                pool.imap_unordered(_model_worker, tasks):
+            sys.stdout.write(out)
+            sys.stderr.write(err)
+            timer.merge_timings(timings)
+            utils.log_msg('Post-processing complete for ' + name)
+            del exit_check[name + '_run']
+            exit_check.update(model_check)
+            if name + '_run' in model_check:
+                utils.log_msg('main_pp.py - Failed to post-process {}. '
+                              'Terminating remaining models.'.format(name),
+                              level='WARN')
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return exit_check
+
+
 def run_archive_integrity():
     '''Main function for Archive Verification App'''
     try:
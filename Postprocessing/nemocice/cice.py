@@ -25,6 +25,7 @@ import modeltemplate as mt
 import timer
 import utils
 import netcdf_filenames
+import netcdf_utils
 
 
 class CicePostProc(mt.ModelTemplate):
@@ -202,8 +203,13 @@ class CicePostProc(mt.ModelTemplate):
             if len(catfiles) == self.suite.monthlength(ncf.start_date[1]):
                 catfiles = utils.add_path(catfiles, self.share)
                 outfile = os.path.join(self.share, 'cicecat')
-                icode = self.suite.preprocess_file('ncrcat', sorted(catfiles),
-                                                   outfile=outfile)
+                if self.naml.processing.cat_daily_means_cmd == 'netcdf4':
+                    icode = self.concat_netcdf4(sorted(catfiles), outfile,
+                                                ncf.start_date)
+                else:
+                    icode = self.suite.preprocess_file('ncrcat',
+                                                       sorted(catfiles),
+                                                       outfile=outfile)
                 if icode == 0:
                     utils.remove_files(catfiles)
                     # Rename file according to netCDF convention
@@ -215,6 +221,97 @@ class CicePostProc(mt.ModelTemplate):
                                                           catfiles)
                 utils.log_msg(msg, level='ERROR')
 
+        if self.naml.processing.cat_daily_means_cmd == 'netcdf4':
+            self.update_partial_concat()
+
+    def partial_concat_file(self, start_date):
+        '''
+        Return the name of the partial concatenation of daily means for the
+        month starting start_date
+        '''
+        return os.path.join(self.share, 'cicecat_{}{}.partial'.
+                            format(*start_date[:2]))
+
+    @timer.run_timer
+    def concat_netcdf4(self, catfiles, outfile, start_date):
+        '''
+        Complete the concatenation of a month of daily means in-process
+        using the netCDF4 library, appending the remaining files to the
+        partial concatenation for the month.
+        Arguments:
+          catfiles   - List of daily means files, in time order
+          outfile    - Output filename
+          start_date - Start date of the month
+        Returns 0 on success
+        '''
+        partial = self.partial_concat_file(start_date)
+        utils.log_msg('concat_daily_means: Concatenating {} files using the '
+                      'netCDF4 library'.format(len(catfiles)), level='INFO')
+        try:
+            appended = netcdf_utils.concatenate_netcdf(catfiles, partial)
+            os.rename(partial, outfile)
+        except (RuntimeError, IOError, OSError, ValueError, KeyError) as exc:
+            # Remove the partial file - the month is concatenated in full
+            # on the next attempt
+            utils.remove_files(partial, ignore_non_exist=True)
+            utils.log_msg('concat_daily_means: Concatenation failed:\n{}'.
+                          format(exc), level='ERROR')
+            return 99
+
+        utils.log_msg('concat_daily_means: {} files appended to {} files '
+                      'previously concatenated'.
+                      format(len(appended), len(catfiles) - len(appended)),
+                      level='OK')
+        return 0
+
+    @timer.run_timer
+    def update_partial_concat(self):
+        '''
+        Append the daily means files available for months not yet complete
+        to the partial concatenation for the month, such that the
+        concatenation grows each cycle.  Daily means files are retained
+        until the month is complete.
+        '''
+        patt = r'^{}i\.[0-9hdm]*_?24h\.\d{{4}}-\d{{2}}-(0[2-9]|[1-3][0-9])' \
+            r'(-\d{{5}})?\.nc$'.format(self.suite.prefix)
+        dailyfiles = utils.get_subset(self.share, patt)
+        if dailyfiles:
+            # Raw output - the month is that of the datestamp
+            months = [re.search(r'\.(\d{4})-(\d{2})-', fname).groups()
+                      for fname in dailyfiles]
+        else:
+            # Daily mean files - netCDF filename convention files
+            ncf = netcdf_filenames.NCFilename('cice', self.suite.prefix,
+                                              self.model_realm(None),
+                                              base='1d')
+            ncf.start_date = (r'\d{4}', r'\d{2}', r'\d{2}')
+            dailyfiles = [f for f in utils.get_subset(
+                self.share, self.mean_stencil(ncf) + '$'
+                ) if self.datestamp_period(f) == '2d']
+            months = [self.get_date(fname)[:2] for fname in dailyfiles]
+
+        monthfiles = {}
+        for month, fname in zip(months, dailyfiles):
+            monthfiles.setdefault(tuple(month), []).append(fname)
+
+        for month in sorted(monthfiles):
+            partial = self.partial_concat_file(month)
+            try:
+                appended = netcdf_utils.concatenate_netcdf(
+                    utils.add_path(sorted(monthfiles[month]), self.share),
+                    partial, partial=True
+                    )
+            except (RuntimeError, IOError, OSError, ValueError,
+                    KeyError) as exc:
+                utils.remove_files(partial, ignore_non_exist=True)
+                utils.log_msg('concat_daily_means: Failed to update {}: {}'.
+                              format(os.path.basename(partial), exc),
+                              level='WARN')
+            else:
+                utils.log_msg('concat_daily_means: {} files appended to {}'.
+                              format(len(appended), os.path.basename(partial)),
+                              level='INFO')
+
     @timer.run_timer
     def archive_concat_daily_means(self):
         ''' Archive concatenated daily mean data '''
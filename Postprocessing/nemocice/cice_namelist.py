@@ -31,6 +31,7 @@ class Processing(template_namelist.Processing):
         '/projects/ocean/hadgem3/nco/nco-3.9.5_clean/bin/ncra --64bit -O'
     chunking_arguments = 'time/1,nc/1,ni/288,nj/204'
     cat_daily_means = False
+    cat_daily_means_cmd = 'ncrcat'
 
 
 class Archiving(template_namelist.Archiving):
@@ -24,6 +24,7 @@ import os
 import re
 import copy
 import shutil
+import time
 
 from collections import OrderedDict
 
@@ -566,7 +567,7 @@ class ModelTemplate(control.RunPostProc):
     def means_cmd(self):
         '''
         Command: Executable + Arguments upto but not including
-        the filename(s)
+        the filename(s), or "netcdf4" to create means in-process
         '''
         try:
             return self.naml.processing.means_cmd
@@ -600,13 +601,18 @@ class ModelTemplate(control.RunPostProc):
                 if inputs.custom:
                     pmean.set_title(prefix=inputs.custom)
 
-                cmd = ' '.join([self.means_cmd,
-                                ' '.join(meanset),
-                                pmean.fname['file']])
+                if self.means_cmd == 'netcdf4':
+                    # Time variables are correct on output
+                    cmd = self.mean_netcdf4
+                else:
+                    cmd = ' '.join([self.means_cmd,
+                                    ' '.join(meanset),
+                                    pmean.fname['file']])
                 rcode = climatemean.create_mean(pmean, cmd,
                                                 self.suite.initpoint)
                 if rcode == 0:
-                    if os.path.exists(pmean.fname['full']):
+                    if os.path.exists(pmean.fname['full']) and \
+                            not callable(cmd):
                         # Meaning gets the time_bounds variables wrong
                         # so correct them here
                         self.fix_mean_time(utils.add_path(meanset, self.share),
@@ -624,6 +630,130 @@ class ModelTemplate(control.RunPostProc):
                             utils.move_files(meanset, self.diagsdir,
                                              originpath=self.share)
 
+                    if self.running_means:
+                        utils.remove_files(
+                            pmean.fname['full'] + climatemean.RUNNING_MEAN_EXT,
+                            ignore_non_exist=True
+                            )
+
+            if self.running_means:
+                # Add components of incomplete periods to running means
+                self.accumulate_means(inputs)
+
+    @property
+    def running_means(self):
+        '''
+        Return True if running means are to be accumulated for incomplete
+        periods.  Available only with the netCDF4 means engine.
+        '''
+        return self.means_cmd == 'netcdf4' and \
+            getattr(self.naml.processing, 'running_means', False) is True
+
+    @property
+    def time_weighted_means(self):
+        '''
+        Return True if means created by the netCDF4 means engine are to be
+        weighted by the duration of each component.  By default components
+        are equally weighted, as by the external means utilities.
+        '''
+        return getattr(self.naml.processing, 'time_weighted_means',
+                       False) is True
+
+    @timer.run_timer
+    def accumulate_means(self, inputs):
+        '''
+        Add the available components of incomplete period means to the
+        running mean accumulator for each period, <mean file>.running
+        in the share directory.  Components already added are skipped, such
+        that the accumulator is resumed following failure of a previous task.
+        Arguments:
+            inputs - <type NCFilename> Field and period (inputs.base)
+        '''
+        period = inputs.base
+        pmean = self.requested_means[period]
+        cmpt_inputs = copy.copy(inputs)
+        cmpt_inputs.base = pmean.component
+        cmpt_inputs.start_date = (r'\d{4}', r'\d{2}', r'\d{2}')
+        available = utils.get_subset(self.share,
+                                     self.mean_stencil(cmpt_inputs) + '$')
+
+        running = OrderedDict()
+        mean_inputs = copy.copy(inputs)
+        for fname in sorted(available):
+            periodend = climatemean.period_end_date(
+                self.get_date(fname, enddate=True), pmean.component, period,
+                self.suite.meanref
+                )
+            if periodend:
+                mean_inputs.start_date = climatemean.calc_enddate(
+                    periodend, '-' + period
+                    )
+                meanfile = os.path.join(self.share,
+                                        self.mean_stencil(mean_inputs))
+                running.setdefault(meanfile, []).append(fname)
+
+        for meanfile, cmpts in running.items():
+            if os.path.exists(meanfile):
+                continue
+            accumfile = meanfile + climatemean.RUNNING_MEAN_EXT
+            try:
+                added = netcdf_utils.accumulate_netcdf(
+                    utils.add_path(cmpts, self.share), accumfile,
+                    time_vars=self.naml.processing.time_vars,
+                    weighted=self.time_weighted_means
+                    )
+            except (RuntimeError, IOError, OSError, ValueError, KeyError,
+                    AttributeError) as exc:
+                msg = 'Failed to update running mean {}: {}\n\t-> Mean ' \
+                    'will be created from all components'.format(accumfile,
+                                                                 exc)
+                utils.log_msg(msg, level='WARN')
+                utils.remove_files(accumfile, ignore_non_exist=True)
+            else:
+                utils.log_msg('Running mean {} - {} component(s) added'.
+                              format(os.path.basename(accumfile),
+                                     len(added)))
+
+    @timer.run_timer
+    def mean_netcdf4(self, meanfile):
+        '''
+        Create a mean file in-process using the netCDF4 library, with
+        time and time bounds variables set from the component files.
+        Called by climatemean.create_mean, the mean is written to a
+        temporary file in the means directory.
+        Returns (return code, output)
+        '''
+        infiles = utils.add_path(meanfile.component_files, self.share)
+        tmpfile = meanfile.fname['full'] + '.tmp'
+        accumfile = meanfile.fname['full'] + climatemean.RUNNING_MEAN_EXT
+        time_vars = self.naml.processing.time_vars
+        added = netcdf_utils.running_mean_components(accumfile)
+        if added and not set(added).issubset(
+                [os.path.basename(f) for f in infiles]
+                ):
+            msg = 'Running mean {} contains files outside the mean period' \
+                ' - Mean will be created from all components'
+            utils.log_msg(msg.format(accumfile), level='WARN')
+            added = []
+
+        try:
+            if added:
+                netcdf_utils.accumulate_netcdf(
+                    infiles, accumfile, time_vars=time_vars,
+                    weighted=self.time_weighted_means
+                    )
+                netcdf_utils.finalise_netcdf(accumfile, infiles[0], tmpfile,
+                                             time_vars=time_vars)
+            else:
+                netcdf_utils.mean_netcdf(infiles, tmpfile,
+                                         time_vars=time_vars,
+                                         weighted=self.time_weighted_means)
+        except (RuntimeError, IOError, OSError, ValueError, KeyError,
+                AttributeError) as exc:
+            return 99, str(exc)
+        return 0, 'Mean created using the netCDF4 library{}: {}'.format(
+            ' from running mean' if added else '', tmpfile
+            )
 
     @timer.run_timer
     def prepare_archive(self):
@@ -666,8 +796,9 @@ class ModelTemplate(control.RunPostProc):
             if len(additional) > 0:
                 match_bases = '({})'.format('|'.join(list(additional)))
                 ncf.base = match_bases
-                additional_means = utils.get_subset(self.share,
-                                                    self.mean_stencil(ncf))
+                additional_means = utils.get_subset(
+                    self.share, self.mean_stencil(ncf) + '$'
+                    )
                 utils.move_files(additional_means, self.diagsdir,
                                  originpath=self.share)
 
@@ -679,8 +810,9 @@ class ModelTemplate(control.RunPostProc):
                 ncf.base = match_bases
                 # Account for models sending files to multiple realms
                 ncf.prefix = ncf.prefix[:-1] + '[a-z]+'
-                final_means = utils.get_subset(self.share,
-                                               self.mean_stencil(ncf))
+                final_means = utils.get_subset(
+                    self.share, self.mean_stencil(ncf) + '$'
+                    )
                 for fname in utils.add_path(final_means, self.share):
                     try:
                         shutil.copy2(fname, self.diagsdir)
@@ -720,22 +852,84 @@ class ModelTemplate(control.RunPostProc):
         pattern = '{}({})?$'.format(self.mean_stencil(ncf), fail_tag)
 
         compress_files = utils.get_subset(source, pattern)
+        utility = self.naml.processing.compress_netcdf
+        comp_level = self.naml.processing.compression_level
+        pending = []
         for fname in utils.add_path(compress_files, source):
             if fname.endswith(fail_tag):
                 # Previous debug mode error during compression - repeat
                 os.rename(fname, fname[:-len(fail_tag)])
                 fname = fname[:-len(fail_tag)]
 
-            rcode = self.compress_file(
-                fname,
-                self.naml.processing.compress_netcdf,
-                compression=self.naml.processing.compression_level,
+            if comp_level > 0 and self.is_compressed(fname, comp_level):
+                continue
+            pending.append(fname)
+
+        if utility == 'netcdf4':
+            # The netCDF-C library is not thread-safe: compress in series
+            workers = 1
+        else:
+            workers = utils.max_subprocesses()
+
+        for fname, rcode in self.compress_concurrent(
+                pending, utility, workers,
+                compression=comp_level,
                 chunking=self.naml.processing.chunking_arguments
-                )
+            ):
             if rcode != 0:
                 # Prevent archive - tag file as failed to compress (debug mode)
                 os.rename(fname, fname + fail_tag)
 
+    def compress_concurrent(self, fnames, utility, workers, **kwargs):
+        '''
+        Compress a list of netCDF files using up to the given number of
+        concurrent worker threads, each invoking compress_file.
+        The time taken and reduction in size achieved is reported for
+        each file.
+        Arguments:
+          fnames  - List of filenames to include full path
+          utility - Compression utility
+          workers - Maximum number of files to compress at any one time
+          kwargs  - Dictionary containing command line arguments
+        Returns a list of (filename, return code) in the order given.
+        Following a failure no further files are started, and the error
+        is raised once those already in progress are complete.
+        '''
+        def compress(fname):
+            ''' Compress a single file in a worker thread '''
+            try:
+                size_in = os.path.getsize(fname)
+            except OSError:
+                size_in = None
+            start = time.time()
+            rcode = self.compress_file(fname, utility,
+                                       check_compressed=False,
+                                       **copy.copy(kwargs))
+            elapsed = time.time() - start
+            try:
+                size_out = os.path.getsize(fname)
+            except OSError:
+                size_out = None
+            return fname, rcode, elapsed, size_in, size_out
+
+        results = []
+        for fname, rcode, elapsed, size_in, size_out in \
+                utils.map_concurrent(compress, fnames,
+                                     max_workers=max(workers, 1)):
+            if rcode == 0 and size_in and size_out is not None:
+                utils.log_msg(
+                    'compress_file: {} compressed in {:.1f}s: {:.1f}MiB -> '
+                    '{:.1f}MiB ({:.1f}% reduction)'.format(
+                        os.path.basename(fname), elapsed,
+                        size_in / 1048576., size_out / 1048576.,
+                        100. * (size_in - size_out) / size_in
+                        ),
+                    level='INFO'
+                    )
+            results.append((fname, rcode))
+
+        return results
+
     def means_spinup(self, description, mean_enddate):
         '''
         A mean cannot be created if the date of the mean is too close the the
@@ -940,28 +1134,43 @@ class ModelTemplate(control.RunPostProc):
                 utils.remove_files(del_files,
                                    path=dirname if dirname else self.share)
 
+    @staticmethod
+    def is_compressed(fname, comp_level):
+        '''
+        Return True if the netCDF file fname has previously been compressed
+        with the given deflate level, as given by the variable filters
+        in the file header
+        '''
+        try:
+            compressed = netcdf_utils.deflate_level(fname) == comp_level
+        except (RuntimeError, IOError):
+            # Unreadable file - leave the compression utility to fail it
+            compressed = False
+        if compressed:
+            utils.log_msg(
+                'compress_file: {} already compressed '.format(fname) +
+                'with deflation = {}.'.format(comp_level),
+                level='INFO')
+        return compressed
+
     @timer.run_timer
-    def compress_file(self, fname, utility, **kwargs):
+    def compress_file(self, fname, utility, check_compressed=True, **kwargs):
         '''
         Create command to compress netCDF file
         Arguments:
           fname - Filename to include full path
           utiilty - Compression utility
           kwargs - Dictionary containing command line arguments
+        Optional argument:
+          check_compressed - Check for previous compression.  Default=True
         '''
-        if utility == 'nccopy':
+        if utility in ['nccopy', 'netcdf4']:
             rcode = 0
             comp_level = kwargs.pop('compression', 0)
             if comp_level > 0:
-                # Check for previous compression with ncdump - do not repeat
-                header = self.suite.preprocess_file('ncdump', fname,
-                                                    hs='', printout=False)
-                if '_DeflateLevel = {}'.format(comp_level) in header:
-                    utils.log_msg(
-                        'compress_file: {} already compressed '.format(fname) +
-                        'with deflation = {}.'.format(comp_level),
-                        level='INFO')
-                else:
+                # Check for previous compression - do not repeat
+                if not (check_compressed and
+                        self.is_compressed(fname, comp_level)):
                     rcode = self.suite.preprocess_file(
                         utility, fname,
                         compression=comp_level,
@@ -21,6 +21,11 @@ DESCRIPTION
 import os
 import re
 import shutil
+import time
+
+from collections import OrderedDict
+
+import numpy
 
 import timer
 import utils
@@ -44,6 +49,9 @@ THICKNESS_WEIGHTED_VARIABLES = [
 VOLUME_WEIGHTED_VARIABLES = ['temptot', 'saltot']
 THICK_WEIGHT_CELL_METHODS = 'time: mean (thickness weighted)'
 VOL_WEIGHT_CELL_METHODS = 'time: mean (volume weighted)'
+# Global attribute of a global means file recording the named regions
+# extracted from it: "<filename>:<region>,<region>,..."
+EXTRACTED_REGIONS_ATTR = 'extracted_regions'
 
 
 class NemoPostProc(mt.ModelTemplate):
@@ -278,6 +286,8 @@ class NemoPostProc(mt.ModelTemplate):
 
         buff = self.buffer_rebuild('restart') if \
             'restart' in filetype else self.buffer_rebuild('mean')
+        rebuild_jobs = []
+        zonal_files = []
         while len(bldfiles) > buff:
             rebuild = True
             keep_components = False
@@ -290,7 +300,7 @@ class NemoPostProc(mt.ModelTemplate):
                 )
 
             if 'diaptr' in filetype:
-                self.global_attr_to_zonal(datadir, bldset)
+                zonal_files += bldset
 
             elif 'restart' in filetype:
                 if self.suite.finalcycle is True and len(bldfiles) == 0:
@@ -307,36 +317,133 @@ class NemoPostProc(mt.ModelTemplate):
                         )
 
             if rebuild:
-                utils.log_msg('Rebuilding: ' + corename, level='INFO')
-                icode = self.rebuild_namelist(
-                    datadir, corename, bldset,
-                    omp=self.naml.processing.rebuild_omp_numthreads,
-                    rebu_cache=self.naml.processing.rebu_cache,
-                    deflate_lev=(self.naml.processing.compression_level if
-                                 self.naml.processing.rebuild_compress else 0),
-                    xchunk=self.naml.processing.xchunk,
-                    ychunk=self.naml.processing.ychunk,
-                    zchunk=self.naml.processing.zchunk,
-                    tchunk=self.naml.processing.tchunk,
-                    msk=self.naml.processing.msk_rebuild
-                    )
+                rebuild_jobs.append((corename, bldset, keep_components))
             else:
                 msg = 'Only rebuilding periodic files: ' + \
                     str(self.naml.processing.rebuild_restart_timestamps)
                 utils.log_msg(msg, level='INFO')
-                icode = 0
+                self._rebuild_complete(datadir, corename, bldset, False, 0)
 
-            if icode == 0:
-                if not keep_components:
-                    utils.log_msg('Deleting component files for: ' + corename,
-                                  level='INFO')
-                    utils.remove_files(bldset, path=datadir)
+        if zonal_files:
+            self.global_attr_to_zonal(datadir, zonal_files)
+        if rebuild_jobs:
+            self.rebuild_concurrent(datadir, rebuild_jobs)
 
         if len(bldfiles) > 0:
             msg = 'Nothing to rebuild - {} {} files available ' \
                 '({} retained).'.format(len(bldfiles), filetype, buff)
             utils.log_msg(msg, level='INFO')
 
+    @property
+    def rebuild_sets_concurrent(self):
+        '''
+        Return the maximum number of filesets which may be rebuilt
+        concurrently.  Concurrent rebuilding requires each fileset to have
+        its own rebuild namelist file, so is not available where a fixed
+        namelist filename is provided with the rebuild command, nor where
+        filesets are rebuilt in-process.
+        '''
+        cmd = self.rebuild_cmd.split()
+        if (len(cmd) > 1 and '%F' not in cmd[1]) or self.rebuild_in_process:
+            # The netCDF4 library is not thread-safe
+            return 1
+        try:
+            return max(int(self.naml.processing.rebuild_concurrent_sets), 1)
+        except (AttributeError, TypeError, ValueError):
+            return 1
+
+    @staticmethod
+    def rebuild_footprint(datadir, bldset):
+        '''
+        Return an estimate of the memory (MiB) required to rebuild a fileset,
+        taken as the total size of the component files
+        '''
+        size = 0
+        for fname in bldset:
+            try:
+                size += os.path.getsize(os.path.join(datadir, fname))
+            except OSError:
+                pass
+        return size / (1024. * 1024.)
+
+    def _rebuild_complete(self, datadir, corename, bldset,
+                          keep_components, icode):
+        ''' Delete the component files of a successfully rebuilt fileset '''
+        if icode == 0 and not keep_components:
+            utils.log_msg('Deleting component files for: ' + corename,
+                          level='INFO')
+            utils.remove_files(bldset, path=datadir)
+
+    @timer.run_timer
+    def rebuild_concurrent(self, datadir, rebuild_jobs):
+        '''
+        Rebuild a number of filesets, deleting the component files of
+        each set successfully rebuilt.
+        Filesets are rebuilt concurrently, up to a maximum given by
+        namelist:nemo_processing/rebuild_concurrent_sets, provided the total
+        estimated memory footprint of the sets being rebuilt remains within
+        namelist:nemo_processing/rebuild_memory_limit (MiB).  A set is always
+        started when no other set is being rebuilt, regardless of its
+        footprint.  The rebuild_omp_numthreads OpenMP threads are shared
+        between the concurrent rebuilds.
+        Following a failure no further sets are started.  Sets already in
+        progress are completed before the error is raised, and components
+        are deleted only for those sets preceding the failed set.
+        Arguments:
+            datadir      - Location of the component files
+            rebuild_jobs - List of (filebase, component files,
+                                    keep_components) tuples
+        '''
+        rebuild_args = dict(
+            omp=self.naml.processing.rebuild_omp_numthreads,
+            rebu_cache=self.naml.processing.rebu_cache,
+            deflate_lev=(self.naml.processing.compression_level if
+                         self.naml.processing.rebuild_compress else 0),
+            xchunk=self.naml.processing.xchunk,
+            ychunk=self.naml.processing.ychunk,
+            zchunk=self.naml.processing.zchunk,
+            tchunk=self.naml.processing.tchunk,
+            msk=self.naml.processing.msk_rebuild
+            )
+
+        nworkers = min(self.rebuild_sets_concurrent, len(rebuild_jobs))
+        footprints = None
+        memory_limit = 0.
+        if nworkers > 1:
+            # Share the OpenMP threads between the concurrent rebuilds
+            rebuild_args['omp'] = max(int(rebuild_args['omp']) // nworkers, 1)
+            try:
+                memory_limit = float(self.naml.processing.rebuild_memory_limit
+                                     or 0)
+            except (AttributeError, TypeError, ValueError):
+                memory_limit = 0.
+            footprints = [self.rebuild_footprint(datadir, job[1])
+                          for job in rebuild_jobs]
+
+        def rebuild(index):
+            ''' Rebuild a single fileset '''
+            corename, bldset, _ = rebuild_jobs[index]
+            msg = 'Rebuilding: ' + corename
+            if footprints:
+                msg += ' (estimated footprint {:.0f}MiB)'.format(
+                    footprints[index]
+                    )
+            utils.log_msg(msg, level='INFO')
+            return self.rebuild_namelist(datadir, corename, bldset,
+                                         **rebuild_args)
+
+        rebuilt = utils.map_concurrent(rebuild, range(len(rebuild_jobs)),
+                                       max_workers=nworkers,
+                                       footprints=footprints,
+                                       footprint_limit=memory_limit)
+        try:
+            for (corename, bldset, keep_components), icode in \
+                    zip(rebuild_jobs, rebuilt):
+                self._rebuild_complete(datadir, corename, bldset,
+                                       keep_components, icode)
+        finally:
+            rebuilt.close()
+
     @timer.run_timer
     def global_attr_to_zonal(self, datadir, fileset):
         '''
@@ -348,6 +455,9 @@ class NemoPostProc(mt.ModelTemplate):
         printtag = 'global_attr_to_zonal -'
         if not isinstance(fileset, list):
             fileset = [fileset]
+        if self.ncatted_cmd == 'netcdf4':
+            self.zonal_attrs_netcdf4(datadir, fileset)
+            return
 
         for filename in fileset:
             full_file = os.path.join(datadir, filename)
@@ -409,12 +519,86 @@ class NemoPostProc(mt.ModelTemplate):
                                   format(printtag),
                               level='OK')
 
+    @staticmethod
+    def _zonal_attr_updates(ncid):
+        '''
+        Return the global attribute updates required for the given open
+        netCDF dataset to represent zonal mean data, omitting any
+        attributes which are already correct.
+        Returns (<type dict> {attribute: new value} or None for 1D data,
+                 <type list> DOMAIN attributes not found)
+        '''
+        attrs = ncid.__dict__
+        size_global = numpy.atleast_1d(attrs.get('DOMAIN_size_global', []))
+        if len(size_global) < 2:
+            # No x dimension to the data - GC2 data requires no correction
+            return None, []
+
+        targets = {'DOMAIN_size_global': size_global[-1]}
+        missing = []
+        for attr in ['DOMAIN_position_first', 'DOMAIN_position_last']:
+            if attr in attrs:
+                targets[attr] = numpy.atleast_1d(attrs[attr])[-1]
+            else:
+                missing.append(attr)
+
+        updates = {}
+        for attr, value in targets.items():
+            new = numpy.array([1, value], dtype='i4')
+            if not numpy.array_equal(numpy.atleast_1d(attrs[attr]), new):
+                updates[attr] = new
+        if 'ibegin' in attrs and \
+                not numpy.array_equal(numpy.atleast_1d(attrs['ibegin']), [1]):
+            updates['ibegin'] = numpy.int32(1)
+        return updates, missing
+
+    def zonal_attrs_netcdf4(self, datadir, fileset):
+        '''
+        Fix netCDF global attributes in-process so that the given files
+        represent zonal rather than global mean data.
+        Files whose attributes are already correct are not modified.
+        '''
+        printtag = 'global_attr_to_zonal -'
+        start = time.time()
+        changed = 0
+        for filename in fileset:
+            full_file = os.path.join(datadir, filename)
+            with netcdf_utils.get_dataset(full_file, action='r+') as ncid:
+                updates, missing = self._zonal_attr_updates(ncid)
+                if missing:
+                    msg = '{} attribute(s) {} not found in: '.\
+                        format(printtag, ','.join(missing))
+                    utils.log_msg(msg + full_file, level='ERROR')
+                if updates:
+                    for attr in sorted(updates):
+                        ncid.setncattr(attr, updates[attr])
+                    changed += 1
+                    utils.log_msg('{} Updated attribute(s) {} in file {}'.
+                                  format(printtag, ','.join(sorted(updates)),
+                                         full_file), level='DEBUG')
+
+        utils.log_msg('{} {} of {} file(s) updated in {:.2f}s'.
+                      format(printtag, changed, len(fileset),
+                             time.time() - start), level='OK')
+
     @timer.run_timer
     def rebuild_namelist(self, datadir, filebase, bldset,
                          omp=16, deflate_lev=0, rebu_cache=None,
                          xchunk=None, ychunk=None, zchunk=None, tchunk=None,
                          chunk=None, dims=None, msk=False):
-        '''Create the namelist file required by the rebuild_nemo executable'''
+        '''
+        Create the namelist file required by the rebuild_nemo executable.
+        Files other than iceberg restarts are rebuilt in-process where
+        namelist:nemo_processing/rebuild_netcdf4=True.
+        '''
+        if self.rebuild_in_process and not \
+                ('icebergs' in filebase or 'icb' in filebase):
+            return self.rebuild_netcdf4(
+                datadir, filebase, bldset, deflate_lev=deflate_lev,
+                xchunk=xchunk, ychunk=ychunk, zchunk=zchunk, tchunk=tchunk,
+                rebu_cache=rebu_cache, chunk=chunk, dims=dims, msk=msk
+                )
+
         cmd = self.rebuild_cmd.replace('%F', 'rebuild_' + filebase.upper())
         try:
             namelist = cmd.split()[1]
@@ -493,6 +677,67 @@ class NemoPostProc(mt.ModelTemplate):
 
         return icode
 
+    @property
+    def rebuild_in_process(self):
+        '''
+        Return True if files are to be rebuilt in-process using the netCDF4
+        library, rather than the rebuild_nemo executable
+        '''
+        return getattr(self.naml.processing, 'rebuild_netcdf4', False) is True
+
+    @timer.run_timer
+    def rebuild_netcdf4(self, datadir, filebase, bldset, deflate_lev=0,
+                        xchunk=None, ychunk=None, zchunk=None, tchunk=None,
+                        rebu_cache=None, chunk=None, dims=None, msk=False):
+        '''
+        Rebuild a fileset in-process using the netCDF4 library.
+        The rebuilt file is written to a temporary file in datadir, and
+        renamed on successful completion.
+        Chunk sizes apply only with compression: deflate_lev > 0.
+        Masking (msk) and dimension names (dims) are as for rebuild_nemo.
+        The rebuild_nemo read and cache sizes (chunk, rebu_cache) do not
+        apply, memory being bounded by netcdf_utils.COPY_SLAB_BYTES.
+        '''
+        ignored = []
+        if chunk:
+            ignored.append('nchunksize')
+        if rebu_cache and deflate_lev > 0:
+            ignored.append('rebu_cache')
+        if ignored:
+            utils.log_msg('netcdf4: rebuild_nemo option(s) not used by the '
+                          'in-process rebuild: ' + ', '.join(ignored),
+                          level='WARN')
+
+        rebuiltfile = os.path.join(datadir, filebase + '.nc')
+        chunking = []
+        if deflate_lev > 0:
+            for names, size in [(('x',), xchunk), (('y',), ychunk),
+                                (('deptht', 'depthu', 'depthv', 'depthw',
+                                  'nav_lev', 'z'), zchunk),
+                                (('time_counter', 't'), tchunk)]:
+                if size:
+                    chunking.extend(['{}/{}'.format(d, size) for d in names])
+
+        try:
+            netcdf_utils.rebuild_domains(
+                [os.path.join(datadir, f) for f in bldset],
+                rebuiltfile + '.tmp', compression=deflate_lev,
+                chunking=chunking, maskout=msk, dims=dims
+                )
+            os.rename(rebuiltfile + '.tmp', rebuiltfile)
+        except (RuntimeError, IOError, OSError, ValueError,
+                KeyError, AttributeError) as exc:
+            if os.path.exists(rebuiltfile + '.tmp'):
+                os.remove(rebuiltfile + '.tmp')
+            msg = 'netcdf4: Error={}\n -> Failed to rebuild file: {}'.\
+                format(exc, rebuiltfile)
+            utils.log_msg(msg, level='ERROR')
+            return 99
+
+        utils.log_msg('Successfully rebuilt file: ' + rebuiltfile,
+                      level='INFO')
+        return 0
+
     @timer.run_timer
     def rebuild_icebergs(self, datadir, filebase, ndom):
         '''
@@ -573,22 +818,44 @@ class NemoPostProc(mt.ModelTemplate):
 
         self.clean_archived_files(arch_rtn, 'iceberg_trajectory')
 
+    def region_limits(self, field):
+        '''
+        Return a list of regions to extract from a fieldsfile type, given by
+        namelist:nemo_processing/region_dimensions (6 values per region) and
+        region_names, as (<type str> name,
+                          <type OrderedDict> {dimension: (first, last)}).
+        The name is None for a single unnamed region.
+        Raises ValueError where the regions cannot be determined.
+        '''
+        dimensions = list(self.naml.processing.region_dimensions or [])
+        names = utils.ensure_list(self.naml.processing.region_names) \
+            if self.naml.processing.region_names else [None]
+        if not dimensions or len(dimensions) != 6 * len(names):
+            raise ValueError('region_dimensions and region_names mismatch')
+
+        regions = []
+        for i, name in enumerate(names):
+            xdim, xmin, xmax, ydim, ymin, ymax = dimensions[6 * i:6 * (i + 1)]
+            regions.append((name, OrderedDict([
+                (xdim.replace('%G', field[-1]), (int(xmin), int(xmax))),
+                (ydim.replace('%G', field[-1]), (int(ymin), int(ymax)))
+                ])))
+        return regions
+
     @timer.run_timer
     def create_regional_extraction(self):
         ''' Extract a region from global netCDF files '''
         utils.create_dir(self.diagsdir)
+        in_process = self.naml.processing.extract_region_cmd == 'netcdf4'
 
         for field in self.region_fields:
             ncfname = netcdf_filenames.NCFilename('[a-z]*', self.suite.prefix,
                                                   self.model_realm(field),
                                                   custom='_' + field)
-            pattern = self.mean_stencil(ncfname)
+            pattern = self.mean_stencil(ncfname) + '$'
             for filename in utils.get_subset(self.share, pattern):
                 try:
-                    xdim, xmin, xmax, ydim, ymin, ymax = \
-                        self.naml.processing.region_dimensions
-                    xdim = xdim.replace('%G', field[-1])
-                    ydim = ydim.replace('%G', field[-1])
+                    regions = self.region_limits(field)
                 except ValueError:
                     msg = 'Unable to determine x-y dimensions from &nemo' + \
                         'postproc/regional_dimensions: '
@@ -597,15 +864,49 @@ class NemoPostProc(mt.ModelTemplate):
                         level='ERROR'
                         )
                     continue
+                named = regions[0][0] is not None
+                if named and not in_process:
+                    utils.log_msg('Extraction of multiple named regions '
+                                  'requires extract_region_cmd="netcdf4"',
+                                  level='ERROR')
+                    continue
 
                 rcode = 0
-                # Check whether this is already an extracted region
+                compressed = False
                 full_fn = os.path.join(self.share, filename)
-                output = self.suite.preprocess_file('ncdump', full_fn, h='')
-                output = [l.strip(';').strip() for l in output.split('\n')]
-                if '{} = {}'.format(xdim, (xmax - xmin + 1)) in output:
-                    msg = 'This is a regional file. No extraction necessary'
+                (xdim, (xmin, xmax)), (ydim, (ymin, ymax)) = \
+                    regions[0][1].items()
+                # Check whether this is already an extracted region
+                if named:
+                    # Named regions are written to separate files.  The
+                    # global file of a mean field remains in share, so
+                    # check for regions already extracted in earlier cycles.
+                    extracted = self.extracted_regions(full_fn)
+                    regional = all(name in extracted for name, _ in regions)
+                    compressed = regional
+                elif in_process:
+                    with netcdf_utils.get_dataset(full_fn) as ncid:
+                        regional = xdim in ncid.dimensions and \
+                            len(ncid.dimensions[xdim]) == xmax - xmin + 1
+                else:
+                    output = self.suite.preprocess_file('ncdump', full_fn,
+                                                        h='')
+                    output = [l.strip(';').strip() for l in output.split('\n')]
+                    regional = '{} = {}'.format(xdim, (xmax - xmin + 1)) in \
+                        output
+
+                if regional:
+                    if named:
+                        msg = 'Regions already extracted from ' + filename
+                    else:
+                        msg = 'This is a regional file. ' \
+                            'No extraction necessary'
                     utils.log_msg(msg, level='INFO')
+                elif in_process:
+                    rcode = self.extract_regions_netcdf4(full_fn, regions)
+                    compressed = True
+                    if rcode == 0 and named:
+                        self.record_extracted_regions(full_fn, regions)
                 else:
                     # Use ncks to extract the required region
                     utils.log_msg('Extracting region from netCDF file...',
@@ -617,7 +918,8 @@ class NemoPostProc(mt.ModelTemplate):
                         )
 
                 # Compress file if necessary
-                if rcode == 0 and (self.naml.processing.compression_level > 0):
+                if rcode == 0 and not compressed and \
+                        (self.naml.processing.compression_level > 0):
                     rcode = self.compress_file(
                         full_fn, self.naml.processing.compress_netcdf,
                         compression=self.naml.processing.compression_level,
@@ -626,15 +928,104 @@ class NemoPostProc(mt.ModelTemplate):
 
                 # Move file to archive directory
                 if rcode == 0 and field not in self.mean_fields:
-                    utils.move_files(full_fn, self.diagsdir)
+                    if named:
+                        # Global data is not archived
+                        utils.remove_files(full_fn)
+                    else:
+                        utils.move_files(full_fn, self.diagsdir)
+
+    def region_filenames(self, full_fn, regions):
+        '''
+        Return the filenames, including the full path to the archive
+        directory, of the named regions extracted from a global file:
+        <filename>-<region name>.nc
+        '''
+        root, ext = os.path.splitext(os.path.basename(full_fn))
+        return [os.path.join(self.diagsdir, '{}-{}{}'.format(root, name, ext))
+                for name, _ in regions]
+
+    @staticmethod
+    def extracted_regions(full_fn):
+        '''
+        Return the names of the regions recorded as extracted from a global
+        file.  The record names the file itself, such that means created
+        from the file do not inherit it.
+        '''
+        with netcdf_utils.get_dataset(full_fn) as ncid:
+            record = getattr(ncid, EXTRACTED_REGIONS_ATTR, '')
+        fname, _, names = str(record).partition(':')
+        return names.split(',') if fname == os.path.basename(full_fn) else []
+
+    @staticmethod
+    def record_extracted_regions(full_fn, regions):
+        '''
+        Record the names of the regions extracted from a global file in
+        the EXTRACTED_REGIONS_ATTR global attribute of the file
+        '''
+        with netcdf_utils.get_dataset(full_fn, action='a') as ncid:
+            ncid.setncattr(EXTRACTED_REGIONS_ATTR, '{}:{}'.format(
+                os.path.basename(full_fn),
+                ','.join(name for name, _ in regions)
+                ))
+
+    @timer.run_timer
+    def extract_regions_netcdf4(self, full_fn, regions):
+        '''
+        Extract regions from a global netCDF file in-process using the
+        netCDF4 library, reading the file once for all regions.
+        A single unnamed region replaces the global file.  Named regions are
+        written to the archive directory, with the region name appended to
+        the filename: <filename>-<region name>.nc
+        Compression is applied as the regions are written.
+        Arguments:
+            full_fn - Global filename to include full path
+            regions - List of regions, as returned by region_limits
+        Returns 0 on success
+        '''
+        if regions[0][0] is None:
+            outfiles = [full_fn + '.tmp']
+        else:
+            outfiles = self.region_filenames(full_fn, regions)
+
+        utils.log_msg('Extracting {} region(s) from {} using the netCDF4 '
+                      'library'.format(len(regions), full_fn), level='INFO')
+        try:
+            stats, nread = netcdf_utils.extract_regions(
+                full_fn, [(outfile, dims) for outfile, (_, dims) in
+                          zip(outfiles, regions)],
+                compression=self.naml.processing.compression_level,
+                chunking=self.naml.processing.region_chunking_args
+                )
+            if regions[0][0] is None:
+                os.rename(outfiles[0], full_fn)
+        except (RuntimeError, IOError, OSError, ValueError, KeyError) as exc:
+            utils.remove_files(outfiles, ignore_non_exist=True)
+            utils.log_msg('Regional extraction failed for {}:\n{}'.
+                          format(full_fn, exc), level='ERROR')
+            return 99
+
+        for (name, _), outfile in zip(regions, outfiles):
+            nbytes, elapsed = stats[outfile]
+            utils.log_msg('Region {}: extracted {:.1f}MiB in {:.2f}s'.
+                          format(name or os.path.basename(full_fn),
+                                 nbytes / 1048576., elapsed), level='INFO')
+        utils.log_msg('Regional extraction: {:.1f}MiB read from {}'.
+                      format(nread / 1048576., os.path.basename(full_fn)),
+                      level='OK')
+        return 0
 
     @timer.run_timer
     def archive_regional_extraction(self):
         ''' Archive a regional extraction from global netCDF files '''
+        names = utils.ensure_list(self.naml.processing.region_names) \
+            if self.naml.processing.region_names else []
         for field in self.region_fields:
+            custom = '_' + field
+            if names:
+                custom += '(-({}))?'.format('|'.join(names))
             ncfname = netcdf_filenames.NCFilename('[a-z]*', self.suite.prefix,
                                                   self.model_realm(field),
-                                                  custom='_' + field)
+                                                  custom=custom)
             pattern = '^{}$'.format(self.mean_stencil(ncfname))
             a_files = utils.get_subset(self.diagsdir, pattern)
             a_files = utils.add_path(a_files, self.diagsdir)
@@ -653,57 +1044,114 @@ class NemoPostProc(mt.ModelTemplate):
             utils.log_msg('\n'.join(changes), level='INFO')
 
 
+def _cell_methods_updates(ncid, filename):
+    '''
+    Return the cell_methods updates required for the variables in an open
+    netCDF dataset as (OrderedDict of variable: (current, new cell_methods),
+    list of messages describing the changes).
+    Variables with the required cell_methods already are not updated.
+    '''
+    thickness_avail = False
+    for var in ncid.variables:
+        try:
+            if ncid.variables[var].standard_name == "cell_thickness":
+                thickness_avail = True
+                break
+        except AttributeError:
+            pass
+
+    updates = OrderedDict()
+    msgs = []
+    for var in ncid.variables:
+        if var in THICKNESS_WEIGHTED_VARIABLES:
+            if thickness_avail:
+                cell_methods = THICK_WEIGHT_CELL_METHODS
+                description = 'thickness weighted'
+            else:
+                warn = ('No cell thickness available.  Cannot update '
+                        'cell_methods for variable "{}" in {}.'.
+                        format(var, filename))
+                utils.log_msg(warn, level='WARN')
+                continue
+        elif var in VOLUME_WEIGHTED_VARIABLES:
+            cell_methods = VOL_WEIGHT_CELL_METHODS
+            description = 'volume weighted'
+        else:
+            continue
+
+        current = getattr(ncid.variables[var], 'cell_methods', None)
+        if current != cell_methods:
+            updates[var] = (current, cell_methods)
+            msgs.append('Overwriting cell_methods for variable {} in file '
+                        '{} with "time: mean ({})"'.format(var, filename,
+                                                           description))
+    return updates, msgs
+
+
+def _header_grows(data_model, updates):
+    '''
+    Return True if the attribute updates cannot be absorbed by the header
+    of a netCDF file without moving the data.  Netcdf4 (HDF5) files
+    accommodate larger attributes in place.  Classic format headers grow
+    where an attribute is added or its length, padded to 4 bytes,
+    increases.
+    '''
+    if not data_model.startswith('NETCDF3'):
+        return False
+
+    def padded(text):
+        ''' Length of attribute text padded to a 4 byte boundary '''
+        return (len(text) + 3) // 4 * 4
+
+    return any(current is None or padded(new) > padded(str(current))
+               for current, new in updates.values())
+
+
 def fix_nemo_cell_methods(filenames):
     '''
     Overwrite the cell_methods of certain variables to allow mean_nemo
     processes to correctly apply volume and thickness weights when
     averaging over time. Returns a list of messages describing the
     changes made.
+    Attributes are updated in place, except where the header of a classic
+    format file must grow, in which case the file is rewritten via a
+    temporary copy.
     Variables: filenames = iterable of file names to be operated on.
     '''
     msgs = []
+    nbytes = {'in_place': 0, 'rewritten': 0}
     # Set file extension for temporary files to ".tmp"
     tmpext = '.tmp'
-    tmp_files = utils.copy_files(filenames, tmp_ext=tmpext)
-    for filename in tmp_files:
+    for filename in filenames:
         ncid = netcdf_utils.get_dataset(filename, action='r+')
+        updates, file_msgs = _cell_methods_updates(ncid, filename)
+        tmpfile = None
+        if updates and _header_grows(ncid.data_model, updates):
+            ncid.close()
+            tmpfile = utils.copy_files(filename, tmp_ext=tmpext)[0]
+            ncid = netcdf_utils.get_dataset(tmpfile, action='r+')
+            nbytes['rewritten'] += os.path.getsize(filename)
+        else:
+            nbytes['in_place'] += sum(len(new) for _, new in updates.values())
 
-        thickness_avail = False
-        for var in ncid.variables:
-            try:
-                if ncid.variables[var].standard_name == "cell_thickness":
-                    thickness_avail = True
-                    break
-            except AttributeError:
-                pass
-
-        for var in ncid.variables:
-            msg = None
-            if var in THICKNESS_WEIGHTED_VARIABLES:
-                if thickness_avail:
-                    ncid.variables[var].cell_methods = THICK_WEIGHT_CELL_METHODS
-                    msg = ('Overwriting cell_methods for variable {} in file '
-                           '{} with "time: mean (thickness weighted)"'
-                           '').format(var, filename)
-                else:
-                    warn = ('No cell thickness available.  Cannot update '
-                            'cell_methods for variable "{}" in {}.'.
-                            format(var, filename))
-                    utils.log_msg(warn, level='WARN')
-            elif var in VOLUME_WEIGHTED_VARIABLES:
-                ncid.variables[var].cell_methods = VOL_WEIGHT_CELL_METHODS
-                msg = ('Overwriting cell_methods for variable {} in file '
-                       '{} with "time: mean (volume weighted)"'
-                       '').format(var, filename)
-            if msg is not None:
-                msgs.append(msg)
+        for var, (_, cell_methods) in updates.items():
+            ncid.variables[var].cell_methods = cell_methods
         ncid.close()
-        try:
-            os.rename(filename, os.path.splitext(filename)[0])
-        except OSError:
-            err = 'fix_nemo_cell_methods: Failed to rename modifed mean file'
-            utils.log_msg(err, level='ERROR')
+        msgs.extend(file_msgs)
 
+        if tmpfile:
+            try:
+                os.rename(tmpfile, filename)
+            except OSError:
+                err = 'fix_nemo_cell_methods: Failed to rename modifed ' \
+                    'mean file'
+                utils.log_msg(err, level='ERROR')
+
+    if msgs:
+        utils.log_msg('fix_nemo_cell_methods: {} bytes edited in place, '
+                      '{} bytes rewritten'.format(nbytes['in_place'],
+                                                  nbytes['rewritten']),
+                      level='INFO')
     return msgs
 
 
@@ -36,8 +36,11 @@ class Processing(template_namelist.Processing):
     exec_rebuild_iceberg_trajectory = os.environ['CYLC_SUITE_SHARE_DIR'] + \
         '/fcm_make_pp/build/bin/icb_pp.py'
     msk_rebuild = False
+    rebuild_netcdf4 = False
     rebuild_restart_timestamps = '05-30', '11-30', '06-01', '12-01'
     rebuild_omp_numthreads = 1
+    rebuild_concurrent_sets = 1
+    rebuild_memory_limit = None
     rebuild_compress = False
     xchunk = None
     ychunk = None
@@ -58,6 +61,8 @@ class Processing(template_namelist.Processing):
     region_fieldsfiles = None
     region_dimensions = 'x', '1055,1198', 'y', '850,1040'
     region_chunking_args = 'time_counter/1,y/191,x/144'
+    region_names = None
+    extract_region_cmd = 'ncks'
 
 
 class Archiving(template_namelist.Archiving):
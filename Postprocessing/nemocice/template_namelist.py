@@ -33,6 +33,8 @@ class Processing(object):
     ''' Default values for template processing namelist '''
 
     means_cmd = 'path/to/meaning_utility args'
+    running_means = False
+    time_weighted_means = False
     create_means = False
     create_monthly_mean = False
     create_seasonal_mean = False
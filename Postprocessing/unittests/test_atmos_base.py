@@ -15,6 +15,8 @@
 import unittest
 import os
 import shutil
+import threading
+import time
 try:
     # mock is integrated into unittest as of Python 3.3
     import unittest.mock as mock
@@ -184,9 +186,11 @@ class ArchiveDeleteTests(unittest.TestCase):
     def test_do_archive_fail_logfile(self):
         '''Test failure mode when creating log file'''
         func.logtest('Assert system exit with failure to create log:')
-        self.atmos.suite.logfile = '/MyLog'
-        with self.assertRaises(SystemExit):
-            self.atmos.do_archive()
+        with mock.patch.object(type(self.atmos.suite), 'archive_log',
+                               new_callable=mock.PropertyMock,
+                               side_effect=IOError, create=True):
+            with self.assertRaises(SystemExit):
+                self.atmos.do_archive()
         self.assertIn('Failed to open archive log', func.capture('err'))
 
     def test_archive_dump(self):
@@ -502,6 +506,65 @@ class ArchiveDeleteTests(unittest.TestCase):
         mock_getfiles.assert_called_once_with(False)
         self.assertListEqual(mock_cut.mock_calls, [])
 
+    @mock.patch('atmos.AtmosPostProc.diags_to_process')
+    @mock.patch('atmos.transform.extract_to_netcdf', return_value=0)
+    @mock.patch('atmos.transform.convert_to_pp')
+    @mock.patch('atmos.utils.max_subprocesses', return_value=2)
+    def test_transform_concurrent(self, mock_nproc, mock_convpp, mock_ncf,
+                                  mock_getfiles):
+        '''Test do_transform - concurrent processing of files'''
+        func.logtest('Assert concurrent processing of files by do_transform:')
+        self.atmos.convpp_streams = '([pm][a-z])'
+        self.atmos.netcdf_streams = '([pm][a-z])'
+        mock_getfiles.return_value = self.ffiles[1:]
+        threads = set()
+        def convpp(fname, *_):
+            ''' Record the thread converting each file '''
+            threads.add(threading.current_thread().name)
+            time.sleep(0.05)
+            return fname + '.pp'
+        mock_convpp.side_effect = convpp
+        ncf_threads = []
+        mock_ncf.side_effect = \
+            lambda *_: ncf_threads.append(threading.current_thread()) or 0
+
+        self.atmos.do_transform()
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread().name, threads)
+        self.assertListEqual(
+            mock_ncf.mock_calls,
+            [mock.call(f, {}, 'NETCDF4', None) for f in self.ppfiles]
+            )
+        self.assertListEqual(ncf_threads, [threading.current_thread()] * 3)
+
+    @mock.patch('atmos.AtmosPostProc.diags_to_process')
+    @mock.patch('atmos.transform.extract_to_netcdf', return_value=0)
+    @mock.patch('atmos.transform.convert_to_pp')
+    @mock.patch('atmos.utils.max_subprocesses', return_value=2)
+    def test_transform_concurrent_fail(self, mock_nproc, mock_convpp,
+                                       mock_ncf, mock_getfiles):
+        '''Test do_transform - concurrent processing of files - failure'''
+        func.logtest('Assert failure of concurrent processing of files:')
+        self.atmos.convpp_streams = '([pm][a-z])'
+        self.atmos.netcdf_streams = '([pm][a-z])'
+        mock_getfiles.return_value = self.ffiles[1:]
+        def convpp(fname, *_):
+            ''' Fail conversion of the second file while the first is
+            in progress '''
+            if fname == self.ffiles[2]:
+                raise SystemExit(1)
+            time.sleep(0.1)
+            return fname + '.pp'
+        mock_convpp.side_effect = convpp
+
+        with self.assertRaises(SystemExit):
+            self.atmos.do_transform()
+        # First file in progress is completed, third is not started
+        self.assertListEqual(sorted(c[1][0] for c in mock_convpp.mock_calls),
+                             self.ffiles[1:3])
+        self.assertListEqual(mock_ncf.mock_calls,
+                             [mock.call(self.ppfiles[0], {}, 'NETCDF4', None)])
+
 class MeaningTests(unittest.TestCase):
     ''' Unit tests relating to the cretion of atmosphere means '''
     def setUp(self):
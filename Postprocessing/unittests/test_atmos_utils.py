@@ -17,6 +17,8 @@ import os
 import re
 import shutil
 
+import numpy
+
 try:
     # mock is integrated into unittest as of Python 3.3
     import unittest.mock as mock
@@ -66,7 +68,8 @@ class HousekeepTests(unittest.TestCase):
                           'DUMP3', 'DUMP3a']
 
     def tearDown(self):
-        for fname in runtime_environment.RUNTIME_FILES + ['LOGFILE']:
+        for fname in runtime_environment.RUNTIME_FILES + \
+                ['LOGFILE', 'LOGFILE.db']:
             try:
                 os.remove(fname)
             except OSError:
@@ -129,6 +132,35 @@ atmos_runida_1m_1999010100_1999020100_generic-tag.nc ARCHIVE OK
         for i, item in enumerate(rval):
             self.assertListEqual(sorted(item), expected[i])
 
+    def test_read_log_index(self):
+        '''Test read the archive log index'''
+        func.logtest('Assert archive log read from the index:')
+        with open('LOGFILE', 'w') as logfile:
+            logfile.write('RUNIDa.da19790901_00 ARCHIVE FAILED\n')
+        with housekeeping.archive_log.ArchiveLog('LOGFILE') as logfile:
+            logfile.write('RUNIDa.da19850101_00 ARCHIVE OK\n')
+            logfile.record('RUNIDa.pb20010511.pp', 'ARCHIVE OK')
+            logfile.record('RUNIDa.da19790901_00', 'ARCHIVE OK')
+            logfile.record('OTHERa.da19790901_00', 'ARCHIVE OK')
+            logfile.record('atmos_runida_1d_19790901-19790902_ph.nc',
+                           'ARCHIVE OK')
+        log_content = open('LOGFILE', 'r').read()
+
+        with mock.patch('housekeeping.open', create=True) as mock_open:
+            rval = housekeeping.read_arch_logfile('LOGFILE', 'RUNID',
+                                                  '([pm][a-c])',
+                                                  '([p][msy])', '')
+        self.assertListEqual(mock_open.mock_calls, [])
+
+        self.assertListEqual(rval[0], [('RUNIDa.da19850101_00', True),
+                                       ('RUNIDa.da19790901_00', True)])
+        self.assertListEqual(rval[1], [('RUNIDa.pb20010511.pp', True)])
+        self.assertListEqual(
+            rval[3], [('atmos_runida_1d_19790901-19790902_ph.nc', True)]
+            )
+        # Archive log is unchanged
+        self.assertEqual(open('LOGFILE', 'r').read(), log_content)
+
     @mock.patch('utils.remove_files')
     def test_delete_ncfiles_archived(self, mock_rm):
         '''Test delete_ppfiles functionality - archived mean ppfiles'''
@@ -303,12 +335,91 @@ class HeaderTests(unittest.TestCase):
         self.logfile = open('logfile', 'w')
 
     def tearDown(self):
-        for fname in ['logfile'] + runtime_environment.RUNTIME_FILES:
+        for fname in ['logfile', 'a.pa1111'] + \
+                runtime_environment.RUNTIME_FILES:
             try:
                 os.remove(fname)
             except OSError:
                 pass
 
+    @staticmethod
+    def write_umfile(fname, dtype='>i8', nfields=2, nlookup=4, first=0):
+        ''' Write the headers of a dummy UM fieldsfile '''
+        fixhd = numpy.zeros(validation.FIXHD_LENGTH, dtype=dtype)
+        fixhd[:39] = numpy.arange(1, 40)
+        fixhd[27:30] = [1111, 22, 33]
+        fixhd[149:152] = [validation.FIXHD_LENGTH + 1, 64, nlookup]
+        lookup = numpy.full((nlookup, 64), -99, dtype=dtype)
+        lookup[first:first + nfields, 0] = 1111
+        with open(fname, 'wb') as umfile:
+            umfile.write(fixhd.tobytes())
+            umfile.write(lookup.tobytes())
+            # Field data
+            umfile.write(numpy.zeros(1000, dtype=dtype).tobytes())
+
+    def test_fixed_headers(self):
+        '''Test reading of the UM fixed-length header'''
+        func.logtest('Assert reading of the UM fixed-length header:')
+        expected = dict((h, h) for h in range(1, 40))
+        expected.update({28: 1111, 29: 22, 30: 33})
+        for dtype in ['>i8', '<i8', '>i4', '<i4']:
+            self.write_umfile('a.pa1111', dtype=dtype)
+            validation._HEADER_CACHE.clear()
+            headers, empty_file = validation.fixed_headers('a.pa1111')
+            self.assertDictEqual(headers, expected)
+            self.assertFalse(empty_file)
+
+        self.write_umfile('a.pa1111', nfields=0)
+        validation._HEADER_CACHE.clear()
+        self.assertTupleEqual(validation.fixed_headers('a.pa1111'),
+                              (expected, True))
+
+        # Lookup entry in use following empty entries
+        self.write_umfile('a.pa1111', nfields=1, nlookup=4096, first=4095)
+        validation._HEADER_CACHE.clear()
+        self.assertFalse(validation.fixed_headers('a.pa1111')[1])
+
+    def test_fixed_headers_cache(self):
+        '''Test reading of the UM fixed-length header - cached results'''
+        func.logtest('Assert caching of the UM fixed-length header:')
+        self.write_umfile('a.pa1111')
+        validation._HEADER_CACHE.clear()
+        headers = validation.fixed_headers('a.pa1111')
+        with mock.patch('validation.open', create=True) as mock_open:
+            self.assertTupleEqual(validation.fixed_headers('a.pa1111'),
+                                  headers)
+            self.assertListEqual(mock_open.mock_calls, [])
+
+        # Modified file is read again
+        self.write_umfile('a.pa1111', nfields=0)
+        os.utime('a.pa1111', (0, 0))
+        self.assertTrue(validation.fixed_headers('a.pa1111')[1])
+
+    def test_fixed_headers_invalid(self):
+        '''Test reading of the UM fixed-length header - not a UM file'''
+        func.logtest('Assert reading the fixed-length header of other files:')
+        self.assertTupleEqual(validation.fixed_headers('NoSuchFile'),
+                              (None, False))
+        with open('a.pa1111', 'w') as umfile:
+            umfile.write('Not a UM file')
+        self.assertTupleEqual(validation.fixed_headers('a.pa1111'),
+                              (None, False))
+
+    @mock.patch('validation.mule_headers')
+    @mock.patch('validation.genlist')
+    def test_verify_header_fixhd(self, mock_pumf, mock_mule):
+        '''Test verify_header functionality - fixed-length header read'''
+        func.logtest('Assert verify_header reading the fixed-length header:')
+        self.write_umfile('a.pa1111')
+        with mock.patch('validation.identify_dates',
+                        return_value=[(1111, 22, 33)]):
+            validfile = validation.verify_header(self.atmos.naml.atmospp,
+                                                 'a.pa1111', 'LogDir/job',
+                                                 logfile=self.logfile)
+        self.assertTrue(validfile)
+        self.assertListEqual(mock_mule.mock_calls, [])
+        self.assertListEqual(mock_pumf.mock_calls, [])
+
     @mock.patch('validation.mule_headers')
     @mock.patch('validation.genlist')
     @mock.patch('validation.identify_dates', return_value=[(1111, 22, 33)])
@@ -955,6 +1066,78 @@ class AtmosTransformTests(unittest.TestCase):
         self.assertEqual(rval, outfile)
         os.remove(outfile)
 
+    @mock.patch('atmos_transform.os.stat',
+                return_value=mock.Mock(st_size=10, st_mtime_ns=1))
+    @mock.patch('atmos_transform.os.path.exists', return_value=True)
+    def test_extract_to_pp_mule_dups(self, mock_exists, mock_stat):
+        '''Test Mule extraction to PP format - duplicate fields'''
+        func.logtest('Assert duplicate fields replaced in PP extraction:')
+        def dummy_field(stash, lbrel=3, address=0):
+            ''' Return a dummy UM field '''
+            field = mock.Mock(lbrel=lbrel, lbuser4=stash)
+            field.raw = [None] + [stash] * 45
+            # Data address should not be used to identify the field
+            field.raw[29] = address
+            return field
+
+        existing = [dummy_field(1), dummy_field(2)]
+        source = [dummy_field(2, address=100), dummy_field(3),
+                  dummy_field(4, lbrel=-99), dummy_field(5)]
+        atmos_transform._SOURCE_LOOKUP_KEYS.clear()
+        with mock.patch('atmos_transform.mule', create=True) as mock_mule, \
+                mock.patch('atmos_transform.fields_from_pp_file',
+                           create=True, side_effect=lambda _: existing[:]), \
+                mock.patch('atmos_transform.fields_to_pp_file',
+                           create=True) as mock_write, \
+                mock.patch('atmos_transform.pp_lookup_key',
+                           wraps=atmos_transform.pp_lookup_key) as mock_key:
+            mock_mule.FieldsFile.from_file.return_value.fields = source
+            rval = atmos_transform._extract_to_pp_mule(
+                ['SOURCE'], ['2', '3'], 'path/outfile.pp', None
+                )
+            self.assertEqual(mock_key.call_count, 4)
+
+            # Second extraction from the same source reuses lookup keys
+            rval = atmos_transform._extract_to_pp_mule(
+                ['SOURCE'], ['2', '3'], 'path/outfile.pp', None
+                )
+            self.assertEqual(mock_key.call_count, 6)
+
+        self.assertEqual(rval, 'outfile.pp')
+        mock_write.assert_called_with(
+            'outfile.pp', [existing[0], source[0], source[1]]
+            )
+        self.assertIn('Replaced 1 duplicate field(s) in path/outfile.pp',
+                      func.capture())
+        self.assertListEqual(
+            list(atmos_transform._SOURCE_LOOKUP_KEYS['SOURCE'][1].keys()),
+            [0, 1]
+            )
+
+    def test_source_lookup_keys(self):
+        '''Test cache of source file lookup keys'''
+        func.logtest('Assert invalidation of the source lookup key cache:')
+        atmos_transform._SOURCE_LOOKUP_KEYS.clear()
+        for fname in ['FNAME', 'FNAME.cut']:
+            with open(fname, 'w') as source:
+                source.write('Source')
+        os.utime('FNAME', (1, 1))
+        keys = atmos_transform._source_lookup_keys('FNAME')
+        keys[0] = 'KEY'
+        self.assertIs(atmos_transform._source_lookup_keys('FNAME'), keys)
+
+        # Rewritten with the same modification time
+        with open('FNAME', 'w') as source:
+            source.write('Source rewritten')
+        os.utime('FNAME', (1, 1))
+        self.assertDictEqual(atmos_transform._source_lookup_keys('FNAME'), {})
+
+        # Removed source files are discarded
+        os.remove('FNAME')
+        atmos_transform._source_lookup_keys('FNAME.cut')
+        self.assertListEqual(list(atmos_transform._SOURCE_LOOKUP_KEYS),
+                             ['FNAME.cut'])
+
     @unittest.skipUnless(atmos_transform.MULE_AVAIL,
                          'Python module "Mule" is not available')
     def test_extract_to_pp_mule_no_data(self):
@@ -1191,8 +1374,10 @@ class MeaningTests(unittest.TestCase):
         def __init__(self, value):
             self.data = None
             self.lbrel = value
-            self.lblev = None
-            self.lbuser4 = 'X{}'.format(value)
+            self.lblev = 1
+            self.lbuser4 = value
+            self.lbuser5 = 0
+            self.lbproc = 128
             self.raw = []
 
         def copy(self):
@@ -1284,6 +1469,45 @@ class MeaningTests(unittest.TestCase):
             (2 + 5 + 10) * 2 / 3.
             )
 
+    def test_weighted_mean(self):
+        ''' Test the streaming weighted mean against in-memory meaning '''
+        func.logtest('Assert weighted mean matches in-memory meaning:')
+        mdi = -1.073741824e+09
+        weights = [31, 28, 31]
+        rng = numpy.random.RandomState(0)
+        data_list = [rng.uniform(-50., 320., (73, 96)) for _ in weights]
+        data_list[1][5, 7] = mdi
+        data_list[2][:, 0] = mdi
+
+        # In-memory meaning with the full list of components
+        expected = sum([a * b for a, b in zip(data_list, weights)])
+        expected = expected / float(sum(weights))
+        for data in data_list:
+            expected[data == mdi] = mdi
+
+        read = []
+        def components():
+            ''' Record each component as it is read '''
+            for data in data_list:
+                read.append(data)
+                yield data
+        mean = atmos_transform.weighted_mean(components(), weights, mdi=mdi)
+        self.assertEqual(len(read), 3)
+        self.assertEqual(mean.dtype, numpy.float64)
+        self.assertEqual(mean.astype(numpy.float32).tobytes(),
+                         expected.astype(numpy.float32).tobytes())
+        self.assertEqual(mean[5, 7], mdi)
+        self.assertTrue(numpy.all(mean[:, 0] == mdi))
+
+    def test_weighted_mean_float32(self):
+        ''' Test the streaming weighted mean - 32-bit components '''
+        func.logtest('Assert weighted mean of 32-bit components:')
+        data_list = [numpy.full((2, 2), val, dtype=numpy.float32)
+                     for val in [1., 2., 4.]]
+        mean = atmos_transform.weighted_mean(iter(data_list), [1, 1, 2])
+        self.assertEqual(mean.dtype, numpy.float32)
+        self.assertTrue(numpy.all(mean == 2.75))
+
     @mock.patch('atmos_transform.MULE_AVAIL', True)
     @mock.patch('atmos_transform.mule')
     @mock.patch('atmos_transform.WeightedMeanOperator')
@@ -1398,6 +1622,34 @@ class MeaningTests(unittest.TestCase):
         self.assertTupleEqual(rtn, (None, 'create_um_mean: Mule is not '
                                     'available. Cannot create means'))
 
+    def test_match_um_fields(self):
+        '''Test matching of fields between component files'''
+        func.logtest('Assert matching of fields between component files:')
+        files = [MeaningTests.DummyMuleFile() for _ in range(3)]
+        # Pseudo-levels and repeated fields (eg. multiple validity times)
+        for umfile in files:
+            umfile.fields.append(MeaningTests.DummyField(2))
+            umfile.fields[-1].lbuser5 = 1
+            umfile.fields.append(MeaningTests.DummyField(3))
+        # Reverse the order of the fields in the second file
+        files[1].fields.reverse()
+        # Missing and additional fields in the third file
+        files[2].fields[2].lbproc = 4096
+
+        matched = atmos_transform.match_um_fields(files, ['F1', 'F2', 'F3'])
+        fields = [umfile.fields for umfile in files]
+        self.assertListEqual(matched, [
+            [fields[0][1], fields[1][3], fields[2][1]],
+            [fields[0][2], fields[1][0], fields[2][4]],
+            [fields[0][3], fields[1][1], fields[2][3]],
+            [fields[0][4], fields[1][2]],
+            ])
+        self.assertIn('1 field(s) of F1 missing from F3 (lbuser4,lblev,'
+                      'lbuser5,lbproc): (3,1,0,128)', func.capture('err'))
+        self.assertIn('1 field(s) of F3 not in F1 (lbuser4,lblev,'
+                      'lbuser5,lbproc): (3,1,0,4096)', func.capture('err'))
+        self.assertNotIn('F2', func.capture('err'))
+
 
 class DatestringTests(unittest.TestCase):
     '''Unit tests relating extraction of dates from an inputstring'''
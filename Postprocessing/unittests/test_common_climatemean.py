@@ -710,6 +710,39 @@ class DateRegexTests(unittest.TestCase):
             _ = climatemean.calc_enddate('startdate', 'period')
         self.assertIn('Invalid target provided', func.capture('err'))
 
+    def test_period_end_date(self):
+        '''Test calculation of period end date for a component'''
+        func.logtest('Assert period end date of a component file:')
+        meanref = [1000, 12, 1]
+        self.assertTupleEqual(
+            climatemean.period_end_date(('2000', '01', '01'), '1m', '1s',
+                                        meanref),
+            ('2000', '03', '01')
+            )
+        self.assertTupleEqual(
+            climatemean.period_end_date(('2000', '03', '01'), '1m', '1s',
+                                        meanref),
+            ('2000', '03', '01')
+            )
+        self.assertTupleEqual(
+            climatemean.period_end_date(('2000', '06', '01'), '1s', '1y',
+                                        meanref),
+            ('2000', '12', '01')
+            )
+        self.assertTupleEqual(
+            climatemean.period_end_date(('2000', '01', '11'), '10d', '1m',
+                                        meanref),
+            ('2000', '02', '01')
+            )
+
+    def test_period_end_date_fail(self):
+        '''Test calculation of period end date - no end date found'''
+        func.logtest('Assert failure to find period end date:')
+        self.assertIsNone(climatemean.period_end_date(('2000', '01', '11'),
+                                                      '1m', '1s',
+                                                      [1000, 12, 1]))
+        self.assertIn('Unable to find end of 1s period', func.capture('err'))
+
     def test_end_date_regex_monthly(self):
         '''Test calculation of regular expression for endates - monthly'''
         func.logtest('Assert monthly period enddate regular expression:')
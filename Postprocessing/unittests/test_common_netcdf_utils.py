@@ -13,6 +13,8 @@
 *****************************COPYRIGHT******************************
 '''
 import unittest
+import os
+import shutil
 # mock is integrated into unittest as of Python3.3, but is a stand alone
 # package (back-ported) at earlier versions.
 try:
@@ -156,15 +158,15 @@ class FixTimeTests(unittest.TestCase):
             mock_dataset().variables[''].units = \
                 'seconds since 1950-01-01 00:00:00'
             mock_dataset().variables[''].calendar = 'gregorian'
-            with mock.patch('netcdf_utils.correct_time') as mock_time:
-                with mock.patch('netcdf_utils.correct_bounds'):
-                    netcdf_utils.fix_times('meanset', 'meanfile',
-                                           'time_counter',
-                                           'time_counter_bounds')
+            with mock.patch('netcdf_utils.component_times',
+                            return_value=(numpy.array([1., 2.]),
+                                          None)) as mock_time:
+                netcdf_utils.fix_times('meanset', 'meanfile',
+                                       'time_counter', do_time=True)
                 mock_time.assert_called_with(
                     'meanset', 'time_counter',
                     'seconds since 1950-01-01 00:00:00',
-                    'gregorian')
+                    'gregorian', times=True, bounds=False)
 
     def test_fix_times_calls_noleap(self):
         '''Test call to fix_times with the 365cal'''
@@ -173,12 +175,703 @@ class FixTimeTests(unittest.TestCase):
             mock_dataset().variables[''].units = \
                 'seconds since 1950-01-01 00:00:00'
             mock_dataset().variables[''].calendar = 'NoLeap'
-            with mock.patch('netcdf_utils.correct_time') as mock_time:
-                with mock.patch('netcdf_utils.correct_bounds'):
-                    netcdf_utils.fix_times('meanset', 'meanfile',
-                                           'time_counter',
-                                           'time_counter_bounds')
+            with mock.patch('netcdf_utils.component_times',
+                            return_value=(numpy.array([1., 2.]),
+                                          None)) as mock_time:
+                netcdf_utils.fix_times('meanset', 'meanfile',
+                                       'time_counter', do_time=True)
                 mock_time.assert_called_with(
                     'meanset', 'time_counter',
                     'seconds since 1950-01-01 00:00:00',
-                    'noleap')
+                    'noleap', times=True, bounds=False)
+
+
+    def test_convert_times(self):
+        '''Test conversion of arrays of time values'''
+        func.logtest('Assert conversion of arrays of time values:')
+        netcdf_utils._TIME_CONVERSIONS.clear()
+        values = numpy.array([[0., 1.], [31., 59.]])
+        converted = netcdf_utils.convert_times(
+            values, 'days since 2000-01-01', 'hours since 1999-12-31',
+            'gregorian'
+            )
+        self.assertListEqual(converted.tolist(),
+                             [[24., 48.], [768., 1440.]])
+        self.assertIn(('days since 2000-01-01', 'hours since 1999-12-31',
+                       'gregorian'), netcdf_utils._TIME_CONVERSIONS)
+
+        # Cached conversion
+        with mock.patch('netcdf_utils.date2num') as mock_d2n:
+            converted = netcdf_utils.convert_times(
+                numpy.array([2.]), 'days since 2000-01-01',
+                'hours since 1999-12-31', 'gregorian'
+                )
+        self.assertListEqual(mock_d2n.mock_calls, [])
+        self.assertListEqual(converted.tolist(), [72.])
+
+        # Conversion between calendars
+        converted = netcdf_utils.convert_times(
+            numpy.array([0., 59.]), 'days since 2000-01-01',
+            'days since 2000-01-01', 'gregorian', target_calendar='360_day'
+            )
+        self.assertListEqual(converted.tolist(), [0., 58.])
+
+        # Months - not of fixed length
+        converted = netcdf_utils.convert_times(
+            numpy.array([1., 2.]), 'months since 2000-01-01',
+            'days since 2000-01-01', '360_day'
+            )
+        self.assertListEqual(converted.tolist(), [30., 60.])
+        self.assertNotIn(('months since 2000-01-01', 'days since 2000-01-01',
+                          '360_day'), netcdf_utils._TIME_CONVERSIONS)
+
+    def test_fix_times(self):
+        '''Test correction of time and time bounds in a mean file'''
+        func.logtest('Assert correction of time and bounds in a mean file:')
+        meanset = []
+        for i, units in enumerate(['days since 2000-01-01',
+                                   'hours since 2000-01-01',
+                                   'seconds since 2000-02-01']):
+            fname = 'fixtimes_{}.nc'.format(i)
+            meanset.append(fname)
+            start = [0., 30. * 24, -86400. * 30 + 60 * 86400.][i]
+            scale = [1., 24., 86400.][i]
+            with netcdf_utils.Dataset(fname, 'w') as ncid:
+                ncid.createDimension('time', None)
+                ncid.createDimension('nv', 2)
+                var = ncid.createVariable('time', 'f8', ('time',))
+                var.units = units
+                var.calendar = '360_day'
+                var.bounds = 'time_bnds'
+                var[:] = [start + 15. * scale]
+                bnds = ncid.createVariable('time_bnds', 'f8', ('time', 'nv'))
+                bnds[:] = [[start, start + 30. * scale]]
+        shutil.copy(meanset[0], 'fixtimes_mean.nc')
+        meanset.append('fixtimes_mean.nc')
+
+        try:
+            msg = netcdf_utils.fix_times(meanset[:3], 'fixtimes_mean.nc',
+                                         'time', do_time=True,
+                                         do_bounds=True)
+            with netcdf_utils.Dataset('fixtimes_mean.nc') as ncid:
+                self.assertListEqual(ncid.variables['time'][:].tolist(),
+                                     [45.])
+                self.assertListEqual(ncid.variables['time_bnds'][:].tolist(),
+                                     [[0., 90.]])
+        finally:
+            for fname in meanset:
+                os.remove(fname)
+        self.assertIn('Corrected time in file', msg)
+        self.assertIn('Corrected time_bnds in file', msg)
+
+class CompressTests(unittest.TestCase):
+    '''Unit tests relating to in-process compression of netCDF files'''
+    def setUp(self):
+        self.ncfile = 'compress_test.nc'
+        with netcdf_utils.Dataset(self.ncfile, 'w',
+                                  format='NETCDF3_CLASSIC') as ncid:
+            ncid.title = 'Compression test'
+            ncid.createDimension('time', None)
+            ncid.createDimension('y', 4)
+            ncid.createDimension('x', 6)
+            var = ncid.createVariable('time', 'f8', ('time',))
+            var.units = 'days since 1950-01-01'
+            var[:] = [15., 45.]
+            var = ncid.createVariable('temp', 'f4', ('time', 'y', 'x'),
+                                      fill_value=1.e20)
+            var.units = 'K'
+            var[:] = numpy.arange(48.).reshape(2, 4, 6)
+            var[0, 0, 0] = numpy.ma.masked
+            var = ncid.createVariable('scalar', 'i4', ())
+            var.assignValue(7)
+
+    def tearDown(self):
+        for fname in [self.ncfile, self.ncfile + '.tmp']:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+    def test_parse_chunking(self):
+        '''Test parsing of chunking arguments'''
+        func.logtest('Assert parsing of chunking arguments:')
+        self.assertEqual(netcdf_utils.parse_chunking(['a/1', 'var:b/2']),
+                         ({'a': 1}, {'var': {'b': 2}}))
+        self.assertEqual(netcdf_utils.parse_chunking('a/1,b/2'),
+                         ({'a': 1, 'b': 2}, {}))
+        self.assertEqual(netcdf_utils.parse_chunking(None), ({}, {}))
+
+    def test_parse_chunking_invalid(self):
+        '''Test parsing of invalid chunking arguments'''
+        func.logtest('Assert failure to parse invalid chunking arguments:')
+        with self.assertRaises(SystemExit):
+            netcdf_utils.parse_chunking(['a/X'])
+        self.assertIn('Invalid chunking argument: a/X', func.capture('err'))
+
+    def test_compress_netcdf(self):
+        '''Test compression of a netCDF file'''
+        func.logtest('Assert compression of netCDF file:')
+        outfile = self.ncfile + '.tmp'
+        netcdf_utils.compress_netcdf(self.ncfile, outfile, 5,
+                                     chunking=['time/1', 'y/2',
+                                               'temp:x/3'])
+        self.assertEqual(netcdf_utils.deflate_level(outfile), 5)
+        self.assertEqual(netcdf_utils.deflate_level(self.ncfile), 0)
+        with netcdf_utils.Dataset(self.ncfile) as src, \
+                netcdf_utils.Dataset(outfile) as out:
+            self.assertEqual(out.data_model, 'NETCDF4_CLASSIC')
+            self.assertEqual(out.title, 'Compression test')
+            self.assertTrue(out.dimensions['time'].isunlimited())
+            self.assertEqual(out['temp'].chunking(), [1, 2, 3])
+            self.assertEqual(out['time'].chunking(), [1])
+            self.assertEqual(out['temp'].units, 'K')
+            self.assertTrue(out['temp'].filters()['shuffle'])
+            self.assertEqual(out['scalar'].getValue(), 7)
+            for var in src.variables:
+                self.assertTrue(numpy.ma.allequal(src[var][:], out[var][:]))
+            self.assertTrue(out['temp'][:].mask[0, 0, 0])
+
+    def test_compress_netcdf_slabs(self):
+        '''Test compression of a netCDF file, copying data in slabs'''
+        func.logtest('Assert compression of netCDF file in slabs:')
+        outfile = self.ncfile + '.tmp'
+        with mock.patch('netcdf_utils.COPY_SLAB_BYTES', 1):
+            netcdf_utils.compress_netcdf(self.ncfile, outfile, 1)
+        with netcdf_utils.Dataset(self.ncfile) as src, \
+                netcdf_utils.Dataset(outfile) as out:
+            self.assertTrue(numpy.ma.allequal(src['temp'][:],
+                                              out['temp'][:]))
+            self.assertEqual(out['temp'].chunking(), [1, 4, 6])
+
+
+    def test_compress_netcdf_groups(self):
+        '''Test compression of a netCDF file - groups present'''
+        func.logtest('Assert failure to compress a netCDF file with groups:')
+        outfile = self.ncfile + '.tmp'
+        with netcdf_utils.Dataset(self.ncfile, 'w', format='NETCDF4') as ncid:
+            ncid.createGroup('forecast')
+        with self.assertRaises(ValueError):
+            netcdf_utils.compress_netcdf(self.ncfile, outfile, 1)
+        self.assertFalse(os.path.exists(outfile))
+
+
+class RebuildDomainsTests(unittest.TestCase):
+    '''Unit tests relating to in-process rebuilding of NEMO domains'''
+    def setUp(self):
+        self.data = numpy.arange(2 * 6 * 8, dtype='f4').reshape(2, 6, 8)
+        self.outfile = 'rebuild_test.nc'
+        self.components = []
+        # 2x2 decomposition of an 8x6 (x,y) domain, with a one point
+        # halo on internal boundaries
+        for num, (ifirst, jfirst) in enumerate([(1, 1), (5, 1),
+                                                (1, 4), (5, 4)]):
+            self.components.append(self.write_component(num, ifirst, jfirst))
+
+    def tearDown(self):
+        for fname in self.components + [self.outfile]:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+    def write_component(self, num, ifirst, jfirst, total=4):
+        ''' Write a per-processor file '''
+        fname = 'rebuild_test_{:04d}.nc'.format(num)
+        halo_start = [0 if ifirst == 1 else 1, 0 if jfirst == 1 else 1]
+        halo_end = [1 - halo_start[0], 1 - halo_start[1]]
+        istart = ifirst - 1 - halo_start[0]
+        jstart = jfirst - 1 - halo_start[1]
+        with netcdf_utils.Dataset(fname, 'w') as ncid:
+            ncid.title = 'Rebuild test'
+            ncid.DOMAIN_number_total = total
+            ncid.DOMAIN_number = num
+            ncid.DOMAIN_dimensions_ids = [2, 3]
+            ncid.DOMAIN_size_global = [8, 6]
+            ncid.DOMAIN_size_local = [5, 4]
+            ncid.DOMAIN_position_first = [istart + 1, jstart + 1]
+            ncid.DOMAIN_position_last = [istart + 5, jstart + 4]
+            ncid.DOMAIN_halo_size_start = halo_start
+            ncid.DOMAIN_halo_size_end = halo_end
+            ncid.createDimension('time_counter', None)
+            ncid.createDimension('x', 5)
+            ncid.createDimension('y', 4)
+            var = ncid.createVariable('time_counter', 'f8',
+                                      ('time_counter',))
+            var[:] = [1., 2.]
+            var = ncid.createVariable('nav_lon', 'f4', ('y', 'x'))
+            var[:] = self.data[0, jstart:jstart + 4, istart:istart + 5]
+            var = ncid.createVariable('sst', 'f4', ('time_counter', 'y', 'x'),
+                                      fill_value=1.e20)
+            var.coordinates = 'nav_lon'
+            var[:] = self.data[:, jstart:jstart + 4, istart:istart + 5]
+            var = ncid.createVariable('sss', 'f4', ('time_counter', 'y', 'x'))
+            var[:] = self.data[:, jstart:jstart + 4, istart:istart + 5]
+        return fname
+
+    def test_rebuild_domains(self):
+        '''Test rebuilding of a decomposed domain'''
+        func.logtest('Assert rebuilding of a decomposed domain:')
+        netcdf_utils.rebuild_domains(self.components, self.outfile,
+                                     compression=1, chunking='x/4')
+        with netcdf_utils.Dataset(self.outfile) as out:
+            self.assertEqual(out.title, 'Rebuild test')
+            self.assertNotIn('DOMAIN_number', out.ncattrs())
+            self.assertEqual(len(out.dimensions['x']), 8)
+            self.assertEqual(len(out.dimensions['y']), 6)
+            self.assertTrue(out.dimensions['time_counter'].isunlimited())
+            self.assertTrue(numpy.array_equal(out['sst'][:], self.data))
+            self.assertTrue(numpy.array_equal(out['nav_lon'][:],
+                                              self.data[0]))
+            self.assertEqual(out['sst'].filters()['complevel'], 1)
+            self.assertEqual(out['sst'].chunking(), [1, 6, 4])
+            self.assertListEqual(list(out['time_counter'][:]), [1., 2.])
+
+    def test_rebuild_domains_land(self):
+        '''Test rebuilding of a decomposed domain - land suppressed'''
+        func.logtest('Assert rebuilding of a domain with land suppression:')
+        for num, (ifirst, jfirst) in enumerate([(1, 1), (5, 1), (1, 4)]):
+            self.write_component(num, ifirst, jfirst, total=3)
+        netcdf_utils.rebuild_domains(self.components[:3], self.outfile,
+                                     maskout=True)
+        with netcdf_utils.Dataset(self.outfile) as out:
+            sst = out['sst'][:]
+            self.assertTrue(sst.mask[:, 3:, 4:].all())
+            self.assertFalse(sst.mask[:, :3, :].any())
+            self.assertTrue(numpy.array_equal(sst[:, :3, :],
+                                              self.data[:, :3, :]))
+            self.assertTrue((out['sss'][:][:, 3:, 4:] == 0).all())
+
+        # Without masking, land-suppressed domains are zero
+        netcdf_utils.rebuild_domains(self.components[:3], self.outfile)
+        with netcdf_utils.Dataset(self.outfile) as out:
+            sst = out['sst'][:]
+            self.assertFalse(numpy.ma.is_masked(sst))
+            self.assertTrue((sst[:, 3:, 4:] == 0).all())
+
+    def test_rebuild_domains_dims(self):
+        '''Test rebuilding of a decomposed domain - given dimensions'''
+        func.logtest('Assert rebuilding with given decomposed dimensions:')
+        for fname in self.components:
+            with netcdf_utils.Dataset(fname, 'a') as ncid:
+                ncid.delncattr('DOMAIN_dimensions_ids')
+                ncid.renameDimension('x', 'i')
+                ncid.renameDimension('y', 'j')
+        netcdf_utils.rebuild_domains(self.components, self.outfile,
+                                     dims=['i', 'j'])
+        with netcdf_utils.Dataset(self.outfile) as out:
+            self.assertEqual(len(out.dimensions['i']), 8)
+            self.assertEqual(len(out.dimensions['j']), 6)
+            self.assertTrue(numpy.array_equal(out['sst'][:], self.data))
+
+    def test_rebuild_domains_missing(self):
+        '''Test rebuilding of a decomposed domain - missing component'''
+        func.logtest('Assert failure to rebuild with a missing component:')
+        with self.assertRaises(ValueError):
+            netcdf_utils.rebuild_domains(self.components[:3], self.outfile)
+
+    def test_rebuild_domains_slabs(self):
+        '''Test rebuilding of a decomposed domain in slabs'''
+        func.logtest('Assert rebuilding of a decomposed domain in slabs:')
+        with mock.patch('netcdf_utils.COPY_SLAB_BYTES', 1):
+            netcdf_utils.rebuild_domains(self.components, self.outfile)
+        with netcdf_utils.Dataset(self.outfile) as out:
+            self.assertTrue(numpy.array_equal(out['sst'][:], self.data))
+            self.assertTrue(numpy.array_equal(out['nav_lon'][:],
+                                              self.data[0]))
+
+    def test_slab_indices(self):
+        '''Test division of an array into slabs'''
+        func.logtest('Assert division of an array into bounded slabs:')
+        with mock.patch('netcdf_utils.COPY_SLAB_BYTES', 16):
+            slabs = list(netcdf_utils._slab_indices((2, 3, 4), 4))
+            self.assertEqual(len(slabs), 6)
+            self.assertEqual(slabs[1], (slice(0, 1), slice(1, 2),
+                                        slice(0, 4)))
+            slabs = list(netcdf_utils._slab_indices((2, 3, 4), 4, axes=[0]))
+            self.assertListEqual(slabs, [
+                (slice(0, 1), slice(0, 3), slice(0, 4)),
+                (slice(1, 2), slice(0, 3), slice(0, 4))
+                ])
+            slabs = list(netcdf_utils._slab_indices((2, 6, 4), 1))
+            self.assertListEqual(slabs, [
+                (slice(0, 1), slice(0, 4), slice(0, 4)),
+                (slice(0, 1), slice(4, 6), slice(0, 4)),
+                (slice(1, 2), slice(0, 4), slice(0, 4)),
+                (slice(1, 2), slice(4, 6), slice(0, 4))
+                ])
+
+    def test_rebuild_domains_subset(self):
+        '''Test rebuilding of a decomposed domain - subset of variables'''
+        func.logtest('Assert rebuilding of a subset of variables:')
+        with mock.patch('netcdf_utils.MAX_OPEN_COMPONENTS', 1):
+            netcdf_utils.rebuild_domains(self.components, self.outfile,
+                                         variables=['sst'])
+        with netcdf_utils.Dataset(self.outfile) as out:
+            self.assertListEqual(sorted(out.variables),
+                                 ['nav_lon', 'sst', 'time_counter'])
+            self.assertTrue(numpy.array_equal(out['sst'][:], self.data))
+
+
+class MeanNetcdfTests(unittest.TestCase):
+    '''Unit tests relating to in-process meaning of netCDF files'''
+    def setUp(self):
+        self.meanfile = 'mean_test.nc'
+        self.infiles = []
+        # Three "months" of 30, 31 and 28 days
+        self.bounds = [[0., 30.], [30., 61.], [61., 89.]]
+        self.data = numpy.arange(3 * 2 * 4 * 5, dtype='f4').reshape(3, 2, 4,
+                                                                      5)
+        for num, bounds in enumerate(self.bounds):
+            fname = 'mean_test_{}.nc'.format(num)
+            with netcdf_utils.Dataset(fname, 'w') as ncid:
+                ncid.title = 'Meaning test'
+                ncid.createDimension('time_counter', None)
+                ncid.createDimension('bnds', 2)
+                ncid.createDimension('z', 2)
+                ncid.createDimension('y', 4)
+                ncid.createDimension('x', 5)
+                for tvar in ['time_counter', 'time_centered']:
+                    var = ncid.createVariable(tvar, 'f8', ('time_counter',))
+                    var.units = 'days since 2000-01-01'
+                    var.calendar = 'gregorian'
+                    var.bounds = tvar + '_bounds'
+                    var[:] = [numpy.mean(bounds)]
+                    var = ncid.createVariable(tvar + '_bounds', 'f8',
+                                              ('time_counter', 'bnds'))
+                    var[:] = [bounds]
+                var = ncid.createVariable('nav_lat', 'f4', ('y', 'x'))
+                var[:] = numpy.ones((4, 5))
+                var = ncid.createVariable('temp', 'f4',
+                                          ('time_counter', 'z', 'y', 'x'),
+                                          fill_value=1.e20, zlib=True)
+                var.cell_methods = 'time: mean'
+                var[:] = self.data[num:num + 1]
+                if num == 1:
+                    var[0, 0, 0, 0] = numpy.ma.masked
+                var = ncid.createVariable('count', 'i4', ('time_counter',))
+                var[:] = [num]
+            self.infiles.append(fname)
+
+    def tearDown(self):
+        for fname in self.infiles + [self.meanfile]:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+    def test_mean_netcdf(self):
+        '''Test time-weighted mean of netCDF files'''
+        func.logtest('Assert time-weighted mean of netCDF files:')
+        with mock.patch('netcdf_utils.COPY_SLAB_BYTES', 1):
+            netcdf_utils.mean_netcdf(self.infiles, self.meanfile,
+                                     time_vars=['time_counter',
+                                                'time_centered'],
+                                     weighted=True)
+        weights = numpy.array([30., 31., 28.])
+        expected = numpy.average(self.data, axis=0, weights=weights)
+        # Missing data excluded from the mean
+        expected[0, 0, 0] = numpy.average(self.data[[0, 2], 0, 0, 0],
+                                          weights=weights[[0, 2]])
+        with netcdf_utils.Dataset(self.meanfile) as ncid:
+            self.assertEqual(ncid.title, 'Meaning test')
+            self.assertEqual(ncid['temp'].shape, (1, 2, 4, 5))
+            self.assertTrue(numpy.allclose(ncid['temp'][0], expected,
+                                           rtol=1.e-6))
+            self.assertEqual(ncid['temp'].cell_methods, 'time: mean')
+            self.assertTrue(ncid['temp'].filters()['zlib'])
+            self.assertTrue(numpy.array_equal(ncid['nav_lat'][:],
+                                              numpy.ones((4, 5))))
+            for tvar in ['time_counter', 'time_centered']:
+                self.assertAlmostEqual(ncid[tvar][0],
+                                       numpy.mean([15., 45.5, 75.]))
+                self.assertListEqual(list(ncid[tvar + '_bounds'][0]),
+                                     [0., 89.])
+            self.assertEqual(ncid['count'][0], 1)
+
+    def test_mean_netcdf_unweighted(self):
+        '''Test unweighted mean of netCDF files'''
+        func.logtest('Assert unweighted mean of netCDF files:')
+        netcdf_utils.mean_netcdf(self.infiles, self.meanfile,
+                                 time_vars='time_counter')
+        with netcdf_utils.Dataset(self.meanfile) as ncid:
+            self.assertTrue(numpy.allclose(ncid['temp'][0, 1],
+                                           self.data[:, 1].mean(axis=0)))
+
+    def test_mean_netcdf_thickness(self):
+        '''Test thickness weighted mean of netCDF files'''
+        func.logtest('Assert thickness weighted mean of netCDF files:')
+        thickness = numpy.arange(1., 3 * 2 * 4 * 5 + 1).reshape(3, 2, 4, 5)
+        for num, fname in enumerate(self.infiles):
+            with netcdf_utils.Dataset(fname, 'a') as ncid:
+                ncid['temp'].cell_methods = \
+                    netcdf_utils.THICKNESS_WEIGHTED_CELL_METHODS
+                var = ncid.createVariable('e3t', 'f4',
+                                          ('time_counter', 'z', 'y', 'x'),
+                                          fill_value=1.e20)
+                var.standard_name = 'cell_thickness'
+                var[:] = thickness[num:num + 1]
+                if num == 2:
+                    var[0, 1, 0, 0] = numpy.ma.masked
+
+        with mock.patch('netcdf_utils.COPY_SLAB_BYTES', 1):
+            netcdf_utils.mean_netcdf(self.infiles, self.meanfile,
+                                     time_vars='time_counter')
+        expected = numpy.average(self.data, axis=0, weights=thickness)
+        # Missing data and missing thickness excluded from the mean
+        expected[0, 0, 0] = numpy.average(self.data[[0, 2], 0, 0, 0],
+                                          weights=thickness[[0, 2], 0, 0, 0])
+        expected[1, 0, 0] = numpy.average(self.data[:2, 1, 0, 0],
+                                          weights=thickness[:2, 1, 0, 0])
+        with netcdf_utils.Dataset(self.meanfile) as ncid:
+            self.assertTrue(numpy.allclose(ncid['temp'][0], expected,
+                                           rtol=1.e-6))
+            self.assertEqual(ncid['temp'].cell_methods,
+                             netcdf_utils.THICKNESS_WEIGHTED_CELL_METHODS)
+            self.assertTrue(numpy.allclose(ncid['e3t'][0, 0],
+                                           thickness[:, 0].mean(axis=0)))
+
+        # Time weighting is combined with the thickness weighting
+        netcdf_utils.mean_netcdf(self.infiles, self.meanfile,
+                                 time_vars='time_counter', weighted=True)
+        weights = thickness * numpy.array([30., 31., 28.])[:, None, None,
+                                                            None]
+        with netcdf_utils.Dataset(self.meanfile) as ncid:
+            self.assertTrue(numpy.allclose(
+                ncid['temp'][0, 1, 1:],
+                numpy.average(self.data[:, 1, 1:], axis=0,
+                              weights=weights[:, 1, 1:]),
+                rtol=1.e-6
+                ))
+
+    def test_mean_netcdf_no_thickness(self):
+        '''Test thickness weighted mean - no cell thickness available'''
+        func.logtest('Assert thickness weighted mean requires thickness:')
+        with netcdf_utils.Dataset(self.infiles[0], 'a') as ncid:
+            ncid['temp'].cell_methods = \
+                netcdf_utils.THICKNESS_WEIGHTED_CELL_METHODS
+        with self.assertRaises(ValueError):
+            netcdf_utils.mean_netcdf(self.infiles, self.meanfile,
+                                     time_vars='time_counter')
+        with self.assertRaises(ValueError):
+            netcdf_utils.accumulate_netcdf(self.infiles, self.meanfile,
+                                           time_vars='time_counter')
+
+    def test_running_mean(self):
+        '''Test running mean accumulated over several updates'''
+        func.logtest('Assert running mean matches mean of all files:')
+        accumfile = self.meanfile + '.running'
+        self.infiles.append(accumfile)
+        time_vars = ['time_counter', 'time_centered']
+        self.assertListEqual(
+            netcdf_utils.running_mean_components(accumfile), []
+            )
+        added = netcdf_utils.accumulate_netcdf(self.infiles[:2], accumfile,
+                                               time_vars=time_vars)
+        self.assertListEqual(added, self.infiles[:2])
+        # Files already added are ignored
+        added = netcdf_utils.accumulate_netcdf(self.infiles[1:3], accumfile,
+                                               time_vars=time_vars)
+        self.assertListEqual(added, self.infiles[:3])
+        self.assertListEqual(
+            netcdf_utils.running_mean_components(accumfile),
+            self.infiles[:3]
+            )
+        self.assertFalse(os.path.exists(accumfile + '.tmp'))
+
+        netcdf_utils.finalise_netcdf(accumfile, self.infiles[0],
+                                     self.meanfile, time_vars=time_vars)
+        expected = 'mean_test_all.nc'
+        self.infiles.append(expected)
+        netcdf_utils.mean_netcdf(self.infiles[:3], expected,
+                                 time_vars=time_vars)
+        with netcdf_utils.Dataset(self.meanfile) as running, \
+                netcdf_utils.Dataset(expected) as ncid:
+            for var in ncid.variables:
+                self.assertTrue(numpy.ma.allclose(running[var][:],
+                                                  ncid[var][:]))
+
+
+class ConcatenateTests(unittest.TestCase):
+    '''Unit tests relating to in-process concatenation of netCDF files'''
+    def setUp(self):
+        self.catfile = 'concat_test.nc'
+        self.infiles = []
+        self.data = numpy.arange(4 * 3 * 2, dtype='f4').reshape(4, 3, 2)
+        for day in range(4):
+            fname = 'concat_test_{}.nc'.format(day)
+            with netcdf_utils.Dataset(fname, 'w') as ncid:
+                ncid.title = 'Concatenation test'
+                ncid.createDimension('time', None)
+                ncid.createDimension('d2', 2)
+                ncid.createDimension('nj', 3)
+                ncid.createDimension('ni', 2)
+                var = ncid.createVariable('time', 'f8', ('time',))
+                # Final file with different time units
+                scale = 24. if day == 3 else 1.
+                var.units = 'hours since 2000-01-01' if day == 3 else \
+                    'days since 2000-01-01'
+                var.calendar = '360_day'
+                var.bounds = 'time_bounds'
+                var[:] = [(day + 1) * scale]
+                var = ncid.createVariable('time_bounds', 'f8',
+                                          ('time', 'd2'))
+                var[:] = [[day * scale, (day + 1) * scale]]
+                var = ncid.createVariable('tmask', 'f4', ('nj', 'ni'))
+                var[:] = numpy.ones((3, 2))
+                var = ncid.createVariable('aice', 'f4', ('time', 'nj', 'ni'),
+                                          fill_value=1.e30, zlib=True,
+                                          complevel=3)
+                var[:] = self.data[day:day + 1]
+            self.infiles.append(fname)
+
+    def tearDown(self):
+        for fname in self.infiles + [self.catfile]:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+    def test_concatenate_netcdf(self):
+        '''Test concatenation of netCDF files'''
+        func.logtest('Assert concatenation of netCDF files:')
+        appended = netcdf_utils.concatenate_netcdf(self.infiles, self.catfile)
+        self.assertListEqual(appended, self.infiles)
+        with netcdf_utils.Dataset(self.catfile) as ncid:
+            self.assertListEqual(ncid.variables['time'][:].tolist(),
+                                 [1., 2., 3., 4.])
+            self.assertListEqual(ncid.variables['time_bounds'][:].tolist(),
+                                 [[0., 1.], [1., 2.], [2., 3.], [3., 4.]])
+            self.assertTrue(numpy.array_equal(ncid.variables['aice'][:],
+                                              self.data))
+            self.assertTrue(numpy.array_equal(ncid.variables['tmask'][:],
+                                              numpy.ones((3, 2))))
+            self.assertEqual(ncid.variables['aice'].filters()['complevel'], 3)
+            self.assertEqual(ncid.title, 'Concatenation test')
+            self.assertNotIn(netcdf_utils.CONCAT_RECORDS_ATTR,
+                             ncid.ncattrs())
+
+    def test_concatenate_slabs(self):
+        '''Test concatenation of netCDF files, copying records in slabs'''
+        func.logtest('Assert concatenation of netCDF files in slabs:')
+        with mock.patch('netcdf_utils.COPY_SLAB_BYTES', 8):
+            netcdf_utils.concatenate_netcdf(self.infiles, self.catfile)
+        with netcdf_utils.Dataset(self.catfile) as ncid:
+            self.assertTrue(numpy.array_equal(ncid.variables['aice'][:],
+                                              self.data))
+
+    def test_concatenate_partial(self):
+        '''Test concatenation of netCDF files - partial concatenation'''
+        func.logtest('Assert appending to a partial concatenation:')
+        appended = netcdf_utils.concatenate_netcdf(self.infiles[:2],
+                                                   self.catfile, partial=True)
+        self.assertListEqual(appended, self.infiles[:2])
+        with netcdf_utils.Dataset(self.catfile) as ncid:
+            self.assertEqual(
+                ncid.getncattr(netcdf_utils.CONCAT_RECORDS_ATTR), 2
+                )
+
+        # Files already concatenated are ignored
+        appended = netcdf_utils.concatenate_netcdf(self.infiles[:3],
+                                                   self.catfile, partial=True)
+        self.assertListEqual(appended, self.infiles[2:3])
+
+        appended = netcdf_utils.concatenate_netcdf(self.infiles, self.catfile)
+        self.assertListEqual(appended, self.infiles[3:])
+        with netcdf_utils.Dataset(self.catfile) as ncid:
+            self.assertListEqual(ncid.variables['time'][:].tolist(),
+                                 [1., 2., 3., 4.])
+            self.assertTrue(numpy.array_equal(ncid.variables['aice'][:],
+                                              self.data))
+            self.assertNotIn(netcdf_utils.CONCAT_RECORDS_ATTR,
+                             ncid.ncattrs())
+
+    def test_concatenate_interrupted(self):
+        '''Test concatenation of netCDF files - interrupted append'''
+        func.logtest('Assert repeat of an interrupted append:')
+        netcdf_utils.concatenate_netcdf(self.infiles[:2], self.catfile,
+                                        partial=True)
+        with netcdf_utils.Dataset(self.catfile, 'a') as ncid:
+            # Record 3 written, but not complete
+            ncid.variables['time'][2] = 3.
+            ncid.variables['aice'][2] = 0.
+
+        appended = netcdf_utils.concatenate_netcdf(self.infiles, self.catfile)
+        self.assertListEqual(appended, self.infiles[2:])
+        with netcdf_utils.Dataset(self.catfile) as ncid:
+            self.assertTrue(numpy.array_equal(ncid.variables['aice'][:],
+                                              self.data))
+
+        # Incomplete records beyond those appended
+        os.remove(self.catfile)
+        netcdf_utils.concatenate_netcdf(self.infiles[:1], self.catfile,
+                                        partial=True)
+        with netcdf_utils.Dataset(self.catfile, 'a') as ncid:
+            ncid.variables['time'][2] = 3.
+        with self.assertRaises(ValueError):
+            netcdf_utils.concatenate_netcdf(self.infiles[:2], self.catfile)
+
+
+class ExtractRegionsTests(unittest.TestCase):
+    '''Unit tests relating to in-process extraction of regions'''
+    def setUp(self):
+        self.infile = 'region_test.nc'
+        self.outfiles = ['region_test_a.nc', 'region_test_b.nc']
+        self.data = numpy.arange(2 * 6 * 5, dtype='f4').reshape(2, 6, 5)
+        with netcdf_utils.Dataset(self.infile, 'w') as ncid:
+            ncid.title = 'Extraction test'
+            ncid.createDimension('time_counter', None)
+            ncid.createDimension('y', 6)
+            ncid.createDimension('x', 5)
+            var = ncid.createVariable('time_counter', 'f8',
+                                      ('time_counter',))
+            var[:] = [1., 2.]
+            var = ncid.createVariable('nav_lon', 'f4', ('y', 'x'))
+            var.units = 'degrees_east'
+            var[:] = self.data[0]
+            var = ncid.createVariable('thetao', 'f4',
+                                      ('time_counter', 'y', 'x'),
+                                      fill_value=1.e20)
+            var[:] = self.data
+
+    def tearDown(self):
+        for fname in [self.infile] + self.outfiles:
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+
+    def test_extract_regions(self):
+        '''Test extraction of multiple regions in a single pass'''
+        func.logtest('Assert extraction of multiple regions:')
+        regions = [(self.outfiles[0], {'x': (0, 1), 'y': (1, 3)}),
+                   (self.outfiles[1], {'x': (3, 4), 'y': (4, 5)})]
+        stats, nread = netcdf_utils.extract_regions(
+            self.infile, regions, compression=1,
+            chunking=['time_counter/1', 'y/2', 'x/2']
+            )
+        self.assertListEqual(list(stats.keys()), self.outfiles)
+        # Bounding box x=0:5, y=1:6 for nav_lon and thetao, plus time
+        self.assertEqual(nread, (5 * 5 + 2 * 5 * 5) * 4 + 2 * 8)
+        self.assertEqual(stats[self.outfiles[0]][0],
+                         (3 * 2 + 2 * 3 * 2) * 4 + 2 * 8)
+
+        for outfile, (_, ranges) in zip(self.outfiles, regions):
+            yslice = slice(ranges['y'][0], ranges['y'][1] + 1)
+            xslice = slice(ranges['x'][0], ranges['x'][1] + 1)
+            with netcdf_utils.Dataset(outfile) as ncid:
+                self.assertEqual(ncid.title, 'Extraction test')
+                thetao = ncid.variables['thetao']
+                self.assertTrue(numpy.array_equal(
+                    thetao[:], self.data[:, yslice, xslice]
+                    ))
+                self.assertTrue(numpy.array_equal(
+                    ncid.variables['nav_lon'][:], self.data[0, yslice, xslice]
+                    ))
+                self.assertEqual(ncid.variables['nav_lon'].units,
+                                 'degrees_east')
+                self.assertEqual(thetao.getncattr('_FillValue'), 1.e20)
+                self.assertEqual(thetao.filters()['complevel'], 1)
+                self.assertListEqual(thetao.chunking(), [1, 2, 2])
+                self.assertListEqual(
+                    ncid.variables['time_counter'][:].tolist(), [1., 2.]
+                    )
@@ -15,6 +15,7 @@
 import unittest
 import os
 import sys
+import shutil
 try:
     # mock is integrated into unittest as of Python 3.3
     import unittest.mock as mock
@@ -49,6 +50,7 @@ multiline_var=1,
             self.fail(msg)
 
     def tearDown(self):
+        nlist.NAMELIST_CACHE.clear()
         for fname in [self.nlfile, self.newnlfile]:
             if os.path.exists(fname):
                 os.remove(fname)
@@ -80,6 +82,61 @@ multiline_var=1,
         attributes = [a for a in dir(namelists) if not a.startswith('__')]
         self.assertListEqual(attributes, [])
 
+    def test_load_cached(self):
+        '''Test load namelist file from the cache'''
+        func.logtest('Load namelist file from the cache:')
+        with open(self.nlfile, 'w') as handle:
+            handle.write(self.testnl)
+        namelists = nlist.load_namelist(self.nlfile)
+        namelists.testnl.multiline_var.append(7)
+        with mock.patch('nlist.ReadNamelist._parse_variables') as mock_parse:
+            namelists = nlist.load_namelist(self.nlfile)
+            self.assertFalse(mock_parse.called)
+        self.assertEqual(namelists.testnl.test_variable, 'Blue')
+        self.assertEqual(namelists.testnl.multiline_var, [1, 2, 3, 4, 5, 6])
+
+    def test_load_cached_modified(self):
+        '''Test load namelist file modified since caching'''
+        func.logtest('Load namelist file modified since caching:')
+        with open(self.nlfile, 'w') as handle:
+            handle.write(self.testnl)
+        nlist.load_namelist(self.nlfile)
+        with open(self.nlfile, 'w') as handle:
+            handle.write(self.testnl.replace('Blue', 'Green'))
+        namelists = nlist.load_namelist(self.nlfile)
+        self.assertEqual(namelists.testnl.test_variable, 'Green')
+
+    def test_load_not_cached_env(self):
+        '''Test namelist file with environment variables is not cached'''
+        func.logtest('Namelist file with environment variables not cached:')
+        with open(self.nlfile, 'w') as handle:
+            handle.write(self.testnl.replace('"Blue"', '$COLOUR'))
+        with mock.patch.dict('nlist.os.environ', {'COLOUR': 'Blue'}):
+            namelists = nlist.load_namelist(self.nlfile)
+        self.assertEqual(namelists.testnl.test_variable, 'Blue')
+        with mock.patch.dict('nlist.os.environ', {'COLOUR': 'Red'}):
+            namelists = nlist.load_namelist(self.nlfile)
+        self.assertEqual(namelists.testnl.test_variable, 'Red')
+        self.assertNotIn(os.path.abspath(self.nlfile), nlist.NAMELIST_CACHE)
+
+    def test_load_disk_cache(self):
+        '''Test load namelist file from the on-disk cache'''
+        func.logtest('Load namelist file from the on-disk cache:')
+        with open(self.nlfile, 'w') as handle:
+            handle.write(self.testnl)
+        os.mkdir('NLCache')
+        with mock.patch.dict('nlist.os.environ',
+                             {'NAMELIST_CACHE_DIR': 'NLCache'}):
+            nlist.load_namelist(self.nlfile)
+            self.assertEqual(len(os.listdir('NLCache')), 1)
+            nlist.NAMELIST_CACHE.clear()
+            with mock.patch('nlist.ReadNamelist._parse_variables') as \
+                    mock_parse:
+                namelists = nlist.load_namelist(self.nlfile)
+                self.assertFalse(mock_parse.called)
+        shutil.rmtree('NLCache')
+        self.assertEqual(namelists.testnl.multiline_var, [1, 2, 3, 4, 5, 6])
+
     def test_create_unwritable_file(self):
         '''Test attempt to create a file in unwritable location'''
         func.logtest('Attempt to create a file in an unwritable location:')
@@ -180,7 +180,10 @@ class ArchiveTests(unittest.TestCase):
         self.mysuite = suite.SuiteEnvironment('somePath/directory', 'input.nl')
 
     def tearDown(self):
-        for fname in [self.logfile] + runtime_environment.RUNTIME_FILES:
+        if self.mysuite._archive_log:
+            self.mysuite.archive_log.close()
+        for fname in [self.logfile, self.logfile + '.db'] + \
+                runtime_environment.RUNTIME_FILES:
             if os.path.exists(fname):
                 os.remove(fname)
 
@@ -298,6 +301,100 @@ class ArchiveTests(unittest.TestCase):
         with self.assertRaises(SystemExit):
             self.mysuite.archive_file('TestFile')
 
+    def test_archive_status(self):
+        '''Test archive_status lookup from the archive log index'''
+        func.logtest('Assert archive status retrieved from index:')
+        self.mysuite.archive_system = 'moose'
+        with mock.patch('suite.moo.archive_to_moose', side_effect=[-1, 0, 0]):
+            self.mysuite.archive_file('path/File1')
+            self.mysuite.archive_file('path/File2')
+            self.mysuite.archive_file('path/File1')
+        self.assertTrue(os.path.exists(self.logfile + '.db'))
+        self.assertTrue(self.mysuite.archive_status('File1'))
+        self.assertTrue(self.mysuite.archive_status('path/File2'))
+        self.assertIsNone(self.mysuite.archive_status('File3'))
+        self.assertEqual(self.mysuite.archive_log.entries(),
+                         [('File2', 'ARCHIVE OK'), ('File1', 'ARCHIVE OK')])
+        self.assertEqual(open(self.logfile, 'r').read(),
+                         'File1 ARCHIVE FAILED. Archive process error\n'
+                         'File2 ARCHIVE OK\nFile1 ARCHIVE OK\n')
+
+    def test_archive_status_failed(self):
+        '''Test archive_status lookup of a failed archive'''
+        func.logtest('Assert archive status of a failed archive:')
+        self.mysuite.archive_system = 'moose'
+        with mock.patch('suite.moo.archive_to_moose', return_value=-1):
+            self.mysuite.archive_file('File1')
+        self.assertFalse(self.mysuite.archive_status('File1'))
+
+    def test_archive_log_size_checksum(self):
+        '''Test size and checksum of an archived file in the index'''
+        func.logtest('Assert size and checksum recorded in the index:')
+        with open('TestFile', 'w') as fname:
+            fname.write('Content')
+        self.mysuite.naml.archive_log_checksum = True
+        with mock.patch('suite.utils.get_debugmode', return_value=True):
+            self.mysuite.archive_file('TestFile')
+        os.remove('TestFile')
+        row = self.mysuite.archive_log._index.execute(
+            'SELECT status, size, checksum FROM archive'
+            ).fetchall()
+        self.assertEqual(row, [('WOULD BE ARCHIVED', 7,
+                                'f15c1cae7882448b3fb0404682e17e61')])
+
+    def test_archive_log_existing_text(self):
+        '''Test creation of an index from a pre-existing text log'''
+        func.logtest('Assert index created from pre-existing text log:')
+        with open(self.logfile, 'w') as logfile:
+            logfile.write('File1 ARCHIVE OK\n\nFile2 ARCHIVE FAILED\n')
+        self.assertTrue(self.mysuite.archive_status('File1'))
+        self.assertFalse(self.mysuite.archive_status('File2'))
+
+    def test_archive_log_readonly(self):
+        '''Test reading the archive log index read-only'''
+        func.logtest('Assert archive log index read-only:')
+        with mock.patch('suite.utils.get_debugmode', return_value=True):
+            for fname in ['RUNIDa.da1', 'RUNIDb.da1', 'RUNIDa.pa1', 'RUNIDb']:
+                self.mysuite.archive_file(fname)
+        self.mysuite.archive_log.close()
+        log_content = open(self.logfile, 'r').read()
+
+        with suite.archive_log.ArchiveLog(self.logfile,
+                                          readonly=True) as arch_log:
+            self.assertEqual(arch_log.entries(prefixes=['RUNIDa.', 'RUNIDb']),
+                             [('RUNIDa.da1', 'WOULD BE ARCHIVED'),
+                              ('RUNIDb.da1', 'WOULD BE ARCHIVED'),
+                              ('RUNIDa.pa1', 'WOULD BE ARCHIVED'),
+                              ('RUNIDb', 'WOULD BE ARCHIVED')])
+            self.assertEqual(arch_log.entries(prefixes='RUNIDa.'),
+                             [('RUNIDa.da1', 'WOULD BE ARCHIVED'),
+                              ('RUNIDa.pa1', 'WOULD BE ARCHIVED')])
+            self.assertEqual(arch_log.entries(prefixes=['RUNIDa.', '']),
+                             arch_log.entries())
+            self.assertEqual(len(arch_log.entries()), 4)
+            self.assertTrue(arch_log.archived('RUNIDb'))
+            with self.assertRaises(IOError):
+                arch_log.record('RUNIDc', 'ARCHIVE OK')
+        self.assertEqual(open(self.logfile, 'r').read(), log_content)
+
+        with suite.archive_log.ArchiveLog('NoSuchLog',
+                                          readonly=True) as arch_log:
+            self.assertIsNone(arch_log._index)
+        self.assertFalse(os.path.exists('NoSuchLog'))
+        self.assertFalse(os.path.exists('NoSuchLog.db'))
+
+    def test_archive_log_no_sqlite(self):
+        '''Test archive_status lookup without the sqlite3 module'''
+        func.logtest('Assert archive status retrieved from text log:')
+        with mock.patch('archive_log.SQLITE_AVAIL', False):
+            with mock.patch('suite.utils.get_debugmode', return_value=True):
+                self.mysuite.archive_file('File1')
+            self.assertTrue(self.mysuite.archive_status('File1'))
+            self.assertIsNone(self.mysuite.archive_status('File2'))
+            self.assertEqual(self.mysuite.archive_log.entries(),
+                             [('File1', 'WOULD BE ARCHIVED')])
+        self.assertFalse(os.path.exists(self.logfile + '.db'))
+
 
 class PreProcessTests(unittest.TestCase):
     '''Unit tests for the model-independent pre-processing methods'''
@@ -336,6 +433,32 @@ class PreProcessTests(unittest.TestCase):
                 mock_mv.assert_called_with(infile + '.tmp', infile)
             mock_exec.assert_called_with(cmd)
 
+    def test_netcdf4(self):
+        '''Test file compression with the netCDF4 library'''
+        func.logtest('Assert function of file compression with netCDF4:')
+        infile = 'TestDir/myMean'
+        with mock.patch('netcdf_utils.compress_netcdf') as mock_compress:
+            with mock.patch('suite.os.rename') as mock_mv:
+                rcode = self.mysuite.preproc_netcdf4(
+                    infile, compression=5, chunking=['a/1', 'b/2', 'c/3']
+                    )
+                mock_mv.assert_called_with(infile + '.tmp', infile)
+            mock_compress.assert_called_with(infile, infile + '.tmp', 5,
+                                             chunking=['a/1', 'b/2', 'c/3'])
+        self.assertEqual(rcode, 0)
+        self.assertIn('Compression successful', func.capture())
+
+    def test_netcdf4_fail(self):
+        '''Test file compression with the netCDF4 library - failure'''
+        func.logtest('Assert failure of file compression with netCDF4:')
+        with mock.patch('netcdf_utils.compress_netcdf',
+                        side_effect=RuntimeError('NetCDF: HDF error')):
+            with self.assertRaises(SystemExit):
+                _ = self.mysuite.preproc_netcdf4('TestDir/myMean',
+                                                 compression=5)
+        self.assertIn('Compression failed of file TestDir/myMean\n'
+                      'NetCDF: HDF error', func.capture('err'))
+
     def test_nccopy_complete_path(self):
         '''Test file compression with nccopy (complete path given)'''
         func.logtest('Assert function of nccopy method given full path:')
@@ -14,6 +14,8 @@
 '''
 import unittest
 import os
+import json
+import shutil
 try:
     # mock is integrated into unittest as of Python 3.3
     import unittest.mock as mock
@@ -51,10 +53,10 @@ class PostProcTimerTests(unittest.TestCase):
     def setUp(self):
         self.timer = timer.PostProcTimer()
         if 'init_timer' not in self.id():
-            self.timer.timings = {'Method1': [1, 1, 1, 1],
-                                  'Method3': [3, 3, 3, 3]}
-            self.timer.timing_cache = {'Method1': 2.5,
-                                       'Method2': 2.5}
+            self.timer.timings = {'Method1': [1, 1, 1, 1, 1, 1, 1, 1],
+                                  'Method3': [3, 3, 3, 3, 3, 3, 3, 3]}
+            self.timer.timing_cache = {'Method1': (2.5, [1, 10, 100, 0]),
+                                       'Method2': (2.5, [1, 10, 100, 0])}
 
     def tearDown(self):
         pass
@@ -72,20 +74,53 @@ class PostProcTimerTests(unittest.TestCase):
         func.logtest('Assert functionality of start_timer method:')
         self.timer.start_timer('Label')
         self.assertTrue('Label' in self.timer.timing_cache.keys())
+        start_time, usage = self.timer.timing_cache['Label']
+        self.assertTrue(isinstance(start_time, float))
+        self.assertEqual(len(usage), 4)
 
     def test_end_timer_existing_func(self):
         '''test end_timer method - existing method'''
         func.logtest('Assert functionality of end_timer - existing method:')
         with mock.patch('timer.time.time', return_value=10.0):
-            self.timer.end_timer('Method1')
-        self.assertEqual(self.timer.timings['Method1'], [8.5, 1, 7.5, 2])
+            with mock.patch('timer._resource_usage',
+                            return_value=[3, 15, 150, 50]):
+                self.timer.end_timer('Method1')
+        self.assertEqual(self.timer.timings['Method1'],
+                         [8.5, 1, 7.5, 2, 3, 6, 51, 51])
+        self.assertNotIn('Method1', self.timer.timing_cache)
 
     def test_end_timer_new_func(self):
         '''test end_timer method - new method'''
         func.logtest('Assert functionality of end_timer - new method:')
         with mock.patch('timer.time.time', return_value=10.0):
-            self.timer.end_timer('Method2')
-        self.assertEqual(self.timer.timings['Method2'], [7.5, 7.5, 7.5, 1])
+            with mock.patch('timer._resource_usage',
+                            return_value=[3, 15, 150, 50]):
+                self.timer.end_timer('Method2')
+        self.assertEqual(self.timer.timings['Method2'],
+                         [7.5, 7.5, 7.5, 1, 2, 5, 50, 50])
+
+    def test_timer_threads(self):
+        '''test start_timer/end_timer methods - concurrent threads'''
+        func.logtest('Assert concurrent timing of a function in threads:')
+        import threading
+        self.timer.timing_cache = {}
+        started = threading.Barrier(3) if hasattr(threading, 'Barrier') \
+            else None
+
+        def timed():
+            ''' Time a function concurrently with other threads '''
+            self.timer.start_timer('Method4')
+            if started:
+                started.wait()
+            self.timer.end_timer('Method4')
+
+        threads = [threading.Thread(target=timed) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.timer.timings['Method4'][3], 3)
+        self.assertEqual(self.timer.timing_cache, {})
 
     def test_check_timer_ok(self):
         '''test _check_timer_end method'''
@@ -102,6 +137,24 @@ class PostProcTimerTests(unittest.TestCase):
         self.assertIn('Function Method1', func.capture('err'))
         self.assertIn('Function Method2', func.capture('err'))
 
+    def test_collect_timings(self):
+        '''test collect method'''
+        func.logtest('Assert functionality of collect method:')
+        timings = self.timer.collect()
+        self.assertEqual(timings, {'Method1': [1, 1, 1, 1, 1, 1, 1, 1],
+                                   'Method3': [3, 3, 3, 3, 3, 3, 3, 3]})
+        self.assertEqual(self.timer.timings, {})
+
+    def test_merge_timings(self):
+        '''test merge method'''
+        func.logtest('Assert functionality of merge method:')
+        self.timer.merge({'Method1': [4, 0.5, 2, 3, 4, 5, 6, 7],
+                          'Method2': [2, 2, 2, 1, 2, 2, 2, 2]})
+        self.assertEqual(self.timer.timings,
+                         {'Method1': [5, 0.5, 2, 4, 5, 6, 7, 8],
+                          'Method2': [2, 2, 2, 1, 2, 2, 2, 2],
+                          'Method3': [3, 3, 3, 3, 3, 3, 3, 3]})
+
     @mock.patch('timer.time.time', return_value=100.0)
     def test_finalise_timer(self, mock_time):
         '''test finalise method'''
@@ -115,6 +168,52 @@ class PostProcTimerTests(unittest.TestCase):
         self.assertNotIn('Method2', func.capture())
         self.assertIn(meth3, func.capture())
         mock_time.assert_called_once_with()
+        self.assertNotIn('Timings written to', func.capture())
+
+    @mock.patch('timer.time.time', return_value=100.0)
+    def test_finalise_timer_json(self, _):
+        '''test finalise method - JSON output'''
+        func.logtest('Assert functionality of finalise method - JSON:')
+        self.timer.outfile = os.path.join(os.getcwd(), 'TimerDir',
+                                          'timings.json')
+        self.timer.finalise()
+        self.assertIn('Timings written to ' + self.timer.outfile,
+                      func.capture())
+        with open(self.timer.outfile) as outfile:
+            output = json.load(outfile)
+        shutil.rmtree('TimerDir')
+        self.assertEqual(output['cycle'],
+                         os.environ['CYLC_TASK_CYCLE_POINT'])
+        self.assertEqual(output['functions']['Method3'],
+                         {'total': 3, 'min': 3, 'max': 3, 'calls': 3,
+                          'cpu': 3, 'maxrss': 3, 'read': 3, 'write': 3})
+
+    @mock.patch('timer.time.time', return_value=100.0)
+    def test_finalise_timer_csv(self, _):
+        '''test finalise method - CSV output'''
+        func.logtest('Assert functionality of finalise method - CSV:')
+        self.timer.outfile = 'timings.csv'
+        self.timer.finalise()
+        with open(self.timer.outfile) as outfile:
+            output = outfile.read().split()
+        os.remove(self.timer.outfile)
+        self.assertListEqual(
+            output,
+            ['function,total,min,max,calls,cpu,maxrss,read,write',
+             'Method1,1,1,1,1,1,1,1,1', 'Method3,3,3,3,3,3,3,3,3']
+            )
+
+    @mock.patch('timer.time.time', return_value=100.0)
+    def test_finalise_timer_output_fail(self, _):
+        '''test finalise method - unwritable output'''
+        func.logtest('Assert functionality of finalise method - write fail:')
+        # Parent directory of the output file is a regular file
+        open('TimerFile', 'w').close()
+        self.timer.outfile = 'TimerFile/timings.json'
+        self.timer.finalise()
+        os.remove('TimerFile')
+        self.assertIn('Unable to write timings to TimerFile/timings.json',
+                      func.capture('err'))
 
 
 class TimerMethodsTests(unittest.TestCase):
@@ -145,6 +244,29 @@ class TimerMethodsTests(unittest.TestCase):
         mock_nl.return_value.monitoring.ltimer = True
         timer.initialise_timer()
         self.assertIsInstance(timer.tim, timer.PostProcTimer)
+        self.assertIsNone(timer.tim.outfile)
+
+    @mock.patch('nlist.load_namelist')
+    def test_initialise_timer_output(self, mock_nl):
+        '''test initialise_timer method - output file'''
+        func.logtest('Assert functionality of initialise_timer - output:')
+        mock_nl.return_value.monitoring.ltimer = True
+        mock_nl.return_value.monitoring.timer_format = 'csv'
+        mock_nl.return_value.monitoring.timer_dir = '$CYLC_SUITE_SHARE_DIR'
+        with mock.patch.dict('timer.os.environ', {'CYLC_TASK_NAME': 'pp'}):
+            timer.initialise_timer()
+        self.assertEqual(timer.tim.outfile,
+                         os.path.join(os.environ['CYLC_SUITE_SHARE_DIR'],
+                                      'pp.' +
+                                      os.environ['CYLC_TASK_CYCLE_POINT'] +
+                                      '.csv'))
+
+    def test_resource_usage(self):
+        '''test _resource_usage method'''
+        func.logtest('Assert functionality of _resource_usage method:')
+        usage = timer._resource_usage()
+        self.assertEqual(len(usage), 4)
+        self.assertTrue(all(val >= 0 for val in usage))
 
     @mock.patch('timer.PostProcTimer.finalise')
     def test_finalise_timer(self, mock_obj):
@@ -16,6 +16,8 @@ import unittest
 import os
 import sys
 import shutil
+import threading
+import time
 try:
     # mock is integrated into unittest as of Python 3.3
     import unittest.mock as mock
@@ -156,6 +158,177 @@ class ExecTests(unittest.TestCase):
         self.assertIn('CMD1 output', func.capture())
         self.assertNotIn('CMD2 output', func.capture())
 
+    def test_batch_success(self):
+        '''Test batch execution of subprocess commands'''
+        func.logtest('Shell out with a batch of commands:')
+        cmds = ['echo {}'.format(i) for i in range(6)]
+        results = utils.exec_subproc_batch(cmds, max_workers=3)
+        self.assertListEqual([r.cmd for r in results], cmds)
+        self.assertListEqual([r.rcode for r in results], [0]*6)
+        self.assertListEqual([r.stdout.strip() for r in results],
+                             [str(i) for i in range(6)])
+        self.assertTrue(all(r.elapsed >= 0 for r in results))
+        self.assertIn('[SUBPROCESS]: 5', func.capture())
+
+    def test_batch_output(self):
+        '''Test batch execution - separate standard output and error'''
+        func.logtest('Batch of commands with separate stdout and stderr:')
+        cmds = ['ls TestDir; echo There', self.cmd.split()]
+        os.mkdir('TestDir')
+        open('TestDir/MyFile', 'w').close()
+        results = utils.exec_subproc_batch(cmds, verbose=False)
+        self.assertEqual(results[0].stdout, 'MyFile\nThere\n')
+        self.assertEqual(results[0].stderr, '')
+        self.assertEqual(results[1].stdout, 'Hello World!\n')
+        self.assertNotIn('[SUBPROCESS]', func.capture())
+
+        results = utils.exec_subproc_batch('ls NoSuchFile')
+        self.assertNotEqual(results[0].rcode, 0)
+        self.assertEqual(results[0].stdout, '')
+        self.assertIn('no such file or directory', results[0].stderr.lower())
+        self.assertIn('[SUBPROCESS]: Command: ls NoSuchFile',
+                      func.capture('err'))
+
+    def test_batch_continue(self):
+        '''Test batch execution - continue after failure'''
+        func.logtest('Batch of commands with failure - continue:')
+        cmds = ['pumpkin', 'echo 1', 'false', 'echo 2']
+        results = utils.exec_subproc_batch(cmds, max_workers=1)
+        self.assertNotEqual(results[0].rcode, 0)
+        self.assertListEqual([r.rcode for r in results[1:]], [0, 1, 0])
+
+    def test_batch_cancel(self):
+        '''Test batch execution - cancel after failure'''
+        func.logtest('Batch of commands with failure - cancel:')
+        cmds = ['echo 1', 'false', 'echo 2', 'echo 3']
+        results = utils.exec_subproc_batch(cmds, max_workers=1,
+                                           on_error='cancel')
+        self.assertListEqual([r.rcode for r in results], [0, 1, None, None])
+        self.assertEqual(results[3].stderr, 'Command not run')
+
+    def test_batch_fail(self):
+        '''Test batch execution - fail after failure'''
+        func.logtest('Batch of commands with failure - fail:')
+        with self.assertRaises(SystemExit):
+            _ = utils.exec_subproc_batch(['false', 'echo 1'], max_workers=1,
+                                         on_error='fail')
+        self.assertIn('2 of 2 commands failed or were not run',
+                      func.capture('err'))
+
+    def test_batch_no_commands(self):
+        '''Test batch execution - no commands'''
+        func.logtest('Empty batch of commands:')
+        self.assertListEqual(utils.exec_subproc_batch([]), [])
+
+    def test_max_subprocesses(self):
+        '''Test maximum number of concurrent subprocesses'''
+        func.logtest('Assert maximum number of concurrent subprocesses:')
+        self.assertEqual(utils.max_subprocesses(), 4)
+        with mock.patch.dict('utils.os.environ', {'MAX_SUBPROCESSES': '2'}):
+            self.assertEqual(utils.max_subprocesses(), 2)
+        with mock.patch.dict('utils.os.environ', {'MAX_SUBPROCESSES': 'X'}):
+            with self.assertRaises(SystemExit):
+                _ = utils.max_subprocesses()
+
+    def test_map_concurrent(self):
+        '''Test concurrent mapping of a function to a list'''
+        func.logtest('Assert concurrent mapping of a function:')
+        running = {'now': 0, 'max': 0}
+        lock = threading.Lock()
+
+        def square(item):
+            ''' Record the number of items in progress '''
+            with lock:
+                running['now'] += 1
+                running['max'] = max(running['max'], running['now'])
+            time.sleep(0.02)
+            with lock:
+                running['now'] -= 1
+            return item * item
+
+        rtn = list(utils.map_concurrent(square, range(6), max_workers=3))
+        self.assertListEqual(rtn, [i * i for i in range(6)])
+        self.assertEqual(running['max'], 3)
+        self.assertListEqual(list(utils.map_concurrent(square, [])), [])
+
+    def test_map_concurrent_footprint(self):
+        '''Test concurrent mapping of a function - footprint limit'''
+        func.logtest('Assert footprint limit on concurrent mapping:')
+        running = []
+        concurrent = []
+        lock = threading.Lock()
+
+        def record(item):
+            ''' Record the items in progress together '''
+            with lock:
+                running.append(item)
+                concurrent.append(sorted(running))
+            time.sleep(0.02)
+            with lock:
+                running.remove(item)
+            return item
+
+        sizes = [60, 30, 120, 10]
+        rtn = list(utils.map_concurrent(record, range(4), max_workers=3,
+                                        footprints=sizes, footprint_limit=100))
+        self.assertListEqual(rtn, list(range(4)))
+        for items in concurrent:
+            if len(items) > 1:
+                self.assertLessEqual(sum(sizes[i] for i in items), 100)
+        self.assertIn([2], concurrent)
+
+    def test_map_concurrent_fail(self):
+        '''Test concurrent mapping of a function - failure'''
+        func.logtest('Assert failure of concurrent mapping:')
+        started = []
+        completed = []
+
+        def process(item):
+            ''' Fail item 1 while item 0 is in progress '''
+            started.append(item)
+            if item == 1:
+                raise IOError('Failed item')
+            time.sleep(0.1)
+            completed.append(item)
+            return item
+
+        results = utils.map_concurrent(process, range(4), max_workers=2)
+        self.assertEqual(next(results), 0)
+        with self.assertRaises(IOError):
+            next(results)
+        # Item in progress completed, no further items started
+        self.assertListEqual(sorted(started), [0, 1])
+        self.assertListEqual(completed, [0])
+
+        started = []
+        with self.assertRaises(SystemExit):
+            _ = list(utils.map_concurrent(
+                lambda i: started.append(i) or utils.log_msg('Fail',
+                                                             level='ERROR'),
+                range(4), max_workers=1
+                ))
+        self.assertListEqual(started, [0])
+
+    def test_map_concurrent_close(self):
+        '''Test concurrent mapping of a function - caller stops early'''
+        func.logtest('Assert caller stopping concurrent mapping early:')
+        completed = []
+
+        def process(item):
+            ''' Slow processing '''
+            time.sleep(0.05)
+            completed.append(item)
+            return item
+
+        results = utils.map_concurrent(process, range(6), max_workers=2)
+        self.assertEqual(next(results), 0)
+        results.close()
+        # Items in progress are completed before close returns
+        self.assertLess(len(completed), 6)
+        final = len(completed)
+        time.sleep(0.1)
+        self.assertEqual(len(completed), final)
+
     def test_utility_avail(self):
         '''Test availability of shell command'''
         func.logtest('Assert availablity of shell command')
@@ -277,6 +450,49 @@ class DateCheckTests(unittest.TestCase):
         with self.assertRaises(SystemExit):
             _ = utils.add_period_to_date(['a']*5, self.delta)
 
+    def test_calendar_date(self):
+        '''Test in-process date arithmetic for non-360day calendars'''
+        func.logtest('Assert in-process date calculation by calendar:')
+        # Expected dates as returned by `isodatetime --calendar <cal>`
+        cases = [
+            ('gregorian', [2000, 1, 31], [0, 1], [2000, 2, 29, 0, 0]),
+            ('365day', [2000, 1, 31], [0, 1], [2000, 2, 28, 0, 0]),
+            ('noleap', [2004, 12, 31, 12, 0], [0, 0, 60, 12],
+             [2005, 3, 2, 0, 0]),
+            ('366day', [2001, 3, 31], [0, -1], [2001, 2, 29, 0, 0]),
+            ('gregorian', [1900, 3, 1], [0, 0, -1], [1900, 2, 28, 0, 0]),
+            ('gregorian', [2000, 1, 31, 23, 0], [0, 0, 0, 0, 90],
+             [2000, 2, 1, 0, 30]),
+            ('gregorian', [2000, 2, 29], [1], [2001, 2, 28, 0, 0]),
+            ('gregorian', [2004, 3, 31], [0, -2], [2004, 1, 29, 0, 0]),
+            ]
+        for cal, indate, delta, outdate in cases:
+            with mock.patch('utils.calendar', return_value=cal):
+                with mock.patch('utils._mod_all_calendars_date') \
+                        as mock_exec:
+                    date = utils.add_period_to_date(indate, delta)
+                    self.assertListEqual(date, outdate)
+                    self.assertListEqual(mock_exec.mock_calls, [])
+
+    def test_calendar_date_invalid(self):
+        '''Test in-process date arithmetic with an invalid date'''
+        func.logtest('Assert in-process date calculation - invalid date:')
+        with self.assertRaises(SystemExit):
+            _ = utils._mod_calendar_date([2001, 2, 29], [0, 0, 1],
+                                         'gregorian')
+        self.assertIn('Invalid date for gregorian calendar',
+                      func.capture('err'))
+
+    def test_calendar_other(self):
+        '''Test date arithmetic for calendars not handled in-process'''
+        func.logtest('Assert external date calculation - other calendar:')
+        with mock.patch('utils.calendar', return_value='julian'):
+            with mock.patch('utils._mod_all_calendars_date',
+                            return_value=[1, 2, 3, 4, 5]) as mock_exec:
+                date = utils.add_period_to_date(self.indate, self.delta)
+        mock_exec.assert_called_once_with(self.indate, self.delta, 'julian')
+        self.assertListEqual(date, [1, 2, 3, 4, 5])
+
     def test_string_delta(self):
         '''Test time delta in string format'''
         func.logtest('Assert calculation of delta from input string:')
@@ -412,6 +628,30 @@ class FileManipulationTests(unittest.TestCase):
                              fail_on_err=True)
         self.assertIn('Attempted to overwrite', func.capture('err'))
 
+    def test_move_replace_existing(self):
+        '''Test moving a file, replacing a file in the destination'''
+        func.logtest('Move file, replacing existing target:')
+        open(os.path.join(self.dir2, DUMMY[0]), 'w').close()
+        utils.move_files(DUMMY[0], self.dir2, originpath=self.dir1)
+        self.assertTrue(os.path.exists(os.path.join(self.dir2, DUMMY[0])))
+        self.assertFalse(os.path.exists(os.path.join(self.dir1, DUMMY[0])))
+        self.assertIn('Deleted pre-existing file', func.capture('err'))
+
+    def test_move_cross_device(self):
+        '''Test moving files between filesystems'''
+        func.logtest('Move files between filesystems:')
+        with open(os.path.join(self.dir1, DUMMY[0]), 'w') as fname:
+            fname.write('Content')
+        with mock.patch('utils.os.rename',
+                        side_effect=OSError(utils.errno.EXDEV, 'XDev')):
+            utils.move_files(DUMMY, self.dir2, originpath=self.dir1,
+                             max_workers=2)
+        for fname in DUMMY:
+            self.assertTrue(os.path.exists(os.path.join(self.dir2, fname)))
+            self.assertFalse(os.path.exists(os.path.join(self.dir1, fname)))
+        with open(os.path.join(self.dir2, DUMMY[0]), 'r') as fname:
+            self.assertEqual(fname.read(), 'Content')
+
     def test_remove_one_file(self):
         '''Test removing single file'''
         func.logtest('Remove single file:')
@@ -482,6 +722,38 @@ class FileManipulationTests(unittest.TestCase):
             self.assertTrue(os.path.isfile(fname + '.ext'))
             self.assertIn(fname + '.ext', tmpfiles)
 
+    def test_copy_files_content(self):
+        '''Test copying file content, with and without os.sendfile'''
+        func.logtest('Assert copy of file content:')
+        srcfile = os.path.join(self.dir1, DUMMY[0])
+        with open(srcfile, 'w') as fname:
+            fname.write('Content' * 1000)
+        utils.copy_files(srcfile, self.dir2)
+        with mock.patch('utils.os.sendfile', create=True,
+                        side_effect=OSError):
+            utils.copy_files(srcfile)
+        for output in [os.path.join(self.dir2, DUMMY[0]), srcfile + '.tmp']:
+            with open(output, 'r') as fname:
+                self.assertEqual(fname.read(), 'Content' * 1000)
+            self.assertFalse(os.path.samefile(srcfile, output))
+
+    def test_copy_files_link(self):
+        '''Test hardlinking files in place of a copy'''
+        func.logtest('Assert hardlink of files to a new directory:')
+        srcfiles = [os.path.join(self.dir1, d) for d in DUMMY]
+        tmpfiles = utils.copy_files(srcfiles, self.dir2, link=True)
+        for srcfile, tmpfile in zip(srcfiles, tmpfiles):
+            self.assertTrue(os.path.samefile(srcfile, tmpfile))
+
+    def test_copy_files_link_fail(self):
+        '''Test copying files where a hardlink is not possible'''
+        func.logtest('Assert copy of files where hardlink fails:')
+        srcfile = os.path.join(self.dir1, DUMMY[0])
+        with mock.patch('utils.os.link', side_effect=OSError):
+            tmpfiles = utils.copy_files(srcfile, self.dir2, link=True)
+        self.assertTrue(os.path.isfile(tmpfiles[0]))
+        self.assertFalse(os.path.samefile(srcfile, tmpfiles[0]))
+
     def test_copy_files_no_such_dir(self):
         '''Test failure mode of copy_files - no such directory'''
         func.logtest('Assert failure to copy file to a new directory:')
@@ -562,6 +834,8 @@ class GetSubsetTests(unittest.TestCase):
     def setUp(self):
         self.dir = os.path.join(os.getcwd(), 'TestSubset')
         self.pattern = '^file[a-z]*$'
+        utils.DIR_INDEX.clear()
+        _ = utils.dir_index_stats(reset=True)
         os.mkdir(self.dir)
         for fname in DUMMY:
             open(os.path.join(self.dir, fname), 'w').close()
@@ -608,6 +882,43 @@ class GetSubsetTests(unittest.TestCase):
         # Code should catch exception: TypeError
         self.assertListEqual(files, [])
 
+    def test_index_hit(self):
+        '''Test get_subset directory index reuse'''
+        func.logtest('Assert reuse of directory index by get_subset:')
+        mtime = os.stat(self.dir).st_mtime
+        with mock.patch('utils.time.time', return_value=mtime + 10):
+            files = utils.get_subset(self.dir, self.pattern)
+            self.assertListEqual(files, sorted(DUMMY))
+            files.remove(DUMMY[0])
+            self.assertListEqual(utils.get_subset(self.dir, self.pattern),
+                                 sorted(DUMMY))
+            self.assertListEqual(utils.get_subset(self.dir, 'one$'),
+                                 [DUMMY[0]])
+        self.assertDictEqual(utils.dir_index_stats(),
+                             {'hits': 2, 'misses': 1, 'rescans': 0})
+
+    def test_index_modified(self):
+        '''Test get_subset directory index - modified directory'''
+        func.logtest('Assert get_subset rescan of a modified directory:')
+        _ = utils.get_subset(self.dir, self.pattern)
+        open(os.path.join(self.dir, 'filefour'), 'w').close()
+        self.assertListEqual(utils.get_subset(self.dir, self.pattern),
+                             sorted(DUMMY + ['filefour']))
+        self.assertDictEqual(utils.dir_index_stats(reset=True),
+                             {'hits': 0, 'misses': 1, 'rescans': 1})
+        self.assertDictEqual(utils.dir_index_stats(),
+                             {'hits': 0, 'misses': 0, 'rescans': 0})
+
+    def test_index_invalidate(self):
+        '''Test get_subset directory index - invalidated by remove_files'''
+        func.logtest('Assert get_subset index invalidated by remove_files:')
+        _ = utils.get_subset(self.dir, self.pattern)
+        self.assertIn(self.dir, utils.DIR_INDEX)
+        utils.remove_files(DUMMY[0], path=self.dir)
+        self.assertNotIn(self.dir, utils.DIR_INDEX)
+        self.assertListEqual(utils.get_subset(self.dir, self.pattern),
+                             sorted(DUMMY[1:]))
+
 
 class CycletimeTests(unittest.TestCase):
     '''Unit tests for the SuiteEnvironment class'''
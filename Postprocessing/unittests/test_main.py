@@ -221,6 +221,113 @@ class PostprocTests(unittest.TestCase):
         mock_pp.assert_called_once_with()
         mock_verify.assert_called_once_with()
 
+    @mock.patch('main_pp.run_models_parallel', return_value={})
+    def test_parallel_models(self, mock_parallel):
+        '''Test call to run models in parallel'''
+        func.logtest('Assert call to run models in parallel:')
+        sys.argv = ('script', 'cice', 'nemo')
+        modules = self.modules
+        del modules['atmos']
+        with mock.patch('main_pp.sys.modules', modules):
+            with mock.patch.dict('main_pp.os.environ',
+                                 {'PARALLEL_MODELS': '4'}):
+                main_pp.run_postproc()
+        self.assertEqual(sorted(mock_parallel.call_args[0][0].keys()),
+                         ['cice', 'nemo'])
+        self.assertEqual(mock_parallel.call_args[0][1], 4)
+        self.assertNotIn('Running method1', func.capture())
+
+    def test_parallel_models_invalid(self):
+        '''Test failure mode with invalid number of parallel models'''
+        func.logtest('Assert failure with invalid PARALLEL_MODELS:')
+        sys.argv = ('script', 'nemo')
+        with mock.patch('main_pp.sys.modules', {'nemo': self.mock_nemo}):
+            with mock.patch.dict('main_pp.os.environ',
+                                 {'PARALLEL_MODELS': 'two'}):
+                with self.assertRaises(SystemExit):
+                    main_pp.run_postproc()
+        self.assertIn('PARALLEL_MODELS should be an integer',
+                      func.capture('err'))
+
+
+class ParallelModelTests(unittest.TestCase):
+    '''Unit tests relating to running models in parallel'''
+    def setUp(self):
+        self.model = mock.Mock()
+        self.model().runpp = True
+        self.model().methods = OrderedDict([('method1', True)])
+        self.models = OrderedDict([('nemo', ('nl_nemo', self.model)),
+                                   ('cice', ('nl_cice', self.model))])
+
+    def tearDown(self):
+        pass
+
+    @staticmethod
+    def serial_pool(results):
+        '''Return a mock multiprocessing context with an in-process Pool'''
+        context = mock.Mock()
+        context.Pool().imap_unordered.side_effect = \
+            lambda worker, tasks: iter(results)
+        return context
+
+    def test_model_worker(self):
+        '''Test capture of model output in a worker'''
+        func.logtest('Assert capture of output in a worker:')
+        name, check, out, err, timings = \
+            main_pp._model_worker(('nemo', 'nl_nemo', self.model))
+        self.assertEqual(name, 'nemo')
+        self.assertListEqual(sorted(check.keys()),
+                             ['nemo_archive', 'nemo_debug'])
+        self.assertIn('Running method1 for nemo', out)
+        self.assertEqual(err, '')
+        self.assertEqual(timings, {})
+        self.assertNotIn('Running method1 for nemo', func.capture())
+
+    def test_model_worker_failure(self):
+        '''Test capture of a model failure in a worker'''
+        func.logtest('Assert capture of failure in a worker:')
+        self.model().method1.side_effect = SystemExit
+        name, check, _, _, _ = \
+            main_pp._model_worker(('nemo', 'nl_nemo', self.model))
+        self.assertEqual(name, 'nemo')
+        self.assertEqual(check, {'nemo_run': False})
+
+        self.model().method1.side_effect = ValueError('Bad value')
+        _, check, _, err, _ = \
+            main_pp._model_worker(('nemo', 'nl_nemo', self.model))
+        self.assertEqual(check, {'nemo_run': False})
+        self.assertIn('ValueError: Bad value', err)
+
+    def test_run_models_parallel(self):
+        '''Test running models in parallel'''
+        func.logtest('Assert running models in parallel:')
+        results = [('cice', {'cice_archive': True}, 'CICE OUT\n', '', {}),
+                   ('nemo', {'nemo_archive': True}, 'NEMO OUT\n', '', {})]
+        context = self.serial_pool(results)
+        with mock.patch('main_pp.multiprocessing.get_context',
+                        return_value=context):
+            check = main_pp.run_models_parallel(self.models, 4)
+        self.assertEqual(check, {'cice_archive': True, 'nemo_archive': True})
+        context.Pool.assert_called_with(processes=2)
+        context.Pool().terminate.assert_called_once_with()
+        self.assertIn('CICE OUT', func.capture())
+        self.assertIn('NEMO OUT', func.capture())
+
+    def test_run_models_parallel_fail(self):
+        '''Test fail fast running models in parallel'''
+        func.logtest('Assert fail fast running models in parallel:')
+        results = [('cice', {'cice_run': False}, '', 'CICE FAILED\n', {}),
+                   ('nemo', {'nemo_archive': True}, 'NEMO OUT\n', '', {})]
+        context = self.serial_pool(results)
+        with mock.patch('main_pp.multiprocessing.get_context',
+                        return_value=context):
+            check = main_pp.run_models_parallel(self.models, 2)
+        self.assertEqual(check, {'cice_run': False, 'nemo_run': False})
+        context.Pool().terminate.assert_called_once_with()
+        self.assertIn('CICE FAILED', func.capture('err'))
+        self.assertIn('Failed to post-process cice', func.capture('err'))
+        self.assertNotIn('NEMO OUT', func.capture())
+
 
 class VerifyTests(unittest.TestCase):
     '''Unit tests relating to verification app control'''
@@ -402,6 +402,98 @@ class MeansProcessingTests(unittest.TestCase):
             self.cice.create_concat_daily_means()
         self.assertIn('only got 3 files', func.capture('err'))
 
+    @mock.patch('cice.utils.get_subset')
+    @mock.patch('cice.utils.remove_files')
+    @mock.patch('cice.netcdf_filenames.os.rename')
+    def test_create_concat_netcdf4(self, mock_rn, mock_rm, mock_set):
+        '''Test concatenation of means - netCDF4 library'''
+        func.logtest('Assert concatenation of means using netCDF4 library:')
+        self.cice.naml.processing.cat_daily_means_cmd = 'netcdf4'
+        self.cice.concat_netcdf4 = mock.Mock(return_value=0)
+        self.cice.update_partial_concat = mock.Mock()
+        catsets = ['SET' + str(i) for i in range(1, 30)]
+        mock_set.side_effect = [['END.1111-02-01.nc'], catsets]
+        self.cice.create_concat_daily_means()
+
+        procsets = sorted(['./' + s for s in catsets])
+        self.cice.concat_netcdf4.assert_called_once_with(
+            ['./END.1111-02-01.nc'] + procsets, './cicecat',
+            ('1111', '01', '01')
+            )
+        self.assertListEqual(self.cice.suite.preprocess_file.mock_calls, [])
+        mock_rn.assert_called_once_with('./cicecat',
+                                        './cice_runidi_1d_11110101-11110201.nc')
+        self.cice.update_partial_concat.assert_called_once_with()
+
+    @mock.patch('cice.os.rename')
+    @mock.patch('cice.netcdf_utils.concatenate_netcdf')
+    def test_concat_netcdf4(self, mock_cat, mock_rn):
+        '''Test completion of concatenation using the netCDF4 library'''
+        func.logtest('Assert completion of concatenation - netCDF4 library:')
+        mock_cat.return_value = ['file3']
+        icode = self.cice.concat_netcdf4(['file1', 'file2', 'file3'],
+                                         'cicecat', ('1111', '02', '01'))
+        self.assertEqual(icode, 0)
+        mock_cat.assert_called_once_with(['file1', 'file2', 'file3'],
+                                         './cicecat_111102.partial')
+        mock_rn.assert_called_once_with('./cicecat_111102.partial', 'cicecat')
+        self.assertIn('1 files appended to 2 files previously',
+                      func.capture())
+
+    @mock.patch('cice.utils.remove_files')
+    @mock.patch('cice.netcdf_utils.concatenate_netcdf',
+                side_effect=ValueError('Bad file'))
+    def test_concat_netcdf4_fail(self, mock_cat, mock_rm):
+        '''Test failure of concatenation using the netCDF4 library'''
+        func.logtest('Assert failure of concatenation - netCDF4 library:')
+        with mock.patch('cice.utils.get_debugmode', return_value=True):
+            icode = self.cice.concat_netcdf4(['file1'], 'cicecat',
+                                             ('1111', '02', '01'))
+        self.assertEqual(icode, 99)
+        mock_rm.assert_called_once_with('./cicecat_111102.partial',
+                                        ignore_non_exist=True)
+        self.assertIn('Concatenation failed:\nBad file', func.capture('err'))
+
+    @mock.patch('cice.utils.get_subset')
+    @mock.patch('cice.netcdf_utils.concatenate_netcdf')
+    def test_update_partial_concat(self, mock_cat, mock_set):
+        '''Test update of partial concatenations'''
+        func.logtest('Assert update of partial concatenations:')
+        mock_set.return_value = ['RUNIDi.24h.1111-02-03.nc',
+                                 'RUNIDi.24h.1111-01-30.nc',
+                                 'RUNIDi.24h.1111-01-29.nc']
+        mock_cat.side_effect = [['./RUNIDi.24h.1111-01-30.nc'],
+                                ['./RUNIDi.24h.1111-02-03.nc']]
+        self.cice.update_partial_concat()
+        mock_set.assert_called_once_with(
+            '.', r'^RUNIDi\.[0-9hdm]*_?24h\.\d{4}-\d{2}-(0[2-9]|[1-3][0-9])'
+            r'(-\d{5})?\.nc$'
+            )
+        self.assertListEqual(
+            mock_cat.mock_calls,
+            [mock.call(['./RUNIDi.24h.1111-01-29.nc',
+                        './RUNIDi.24h.1111-01-30.nc'],
+                       './cicecat_111101.partial', partial=True),
+             mock.call(['./RUNIDi.24h.1111-02-03.nc'],
+                       './cicecat_111102.partial', partial=True)]
+            )
+        self.assertIn('1 files appended to cicecat_111101.partial',
+                      func.capture())
+
+    @mock.patch('cice.utils.get_subset')
+    @mock.patch('cice.utils.remove_files')
+    @mock.patch('cice.netcdf_utils.concatenate_netcdf',
+                side_effect=IOError('Corrupt'))
+    def test_update_partial_concat_fail(self, mock_cat, mock_rm, mock_set):
+        '''Test update of partial concatenations - failure'''
+        func.logtest('Assert failure to update partial concatenation:')
+        mock_set.return_value = ['RUNIDi.24h.1111-01-29.nc']
+        self.cice.update_partial_concat()
+        mock_rm.assert_called_once_with('./cicecat_111101.partial',
+                                        ignore_non_exist=True)
+        self.assertIn('Failed to update cicecat_111101.partial: Corrupt',
+                      func.capture('err'))
+
     @mock.patch('cice.utils.remove_files')
     @mock.patch('cice.mt.ModelTemplate.archive_files')
     def test_archive_concat_daily(self, mock_arch, mock_rm):
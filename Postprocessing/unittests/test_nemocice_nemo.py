@@ -15,6 +15,9 @@
 import unittest
 import os
 import re
+import shutil
+import time
+import threading
 try:
     # mock is integrated into unittest as of Python 3.3
     import unittest.mock as mock
@@ -31,6 +34,10 @@ runtime_environment.setup_env()
 import nemo
 import nemo_namelist
 
+MEAN_NEMO_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              os.pardir, os.pardir, 'Utilities', 'mean_nemo',
+                              'test_data')
+
 
 class StencilTests(unittest.TestCase):
     '''Unit tests relating to the NEMO output filename stencils'''
@@ -597,6 +604,23 @@ class RebuildTests(unittest.TestCase):
             'SourceDir', ['component_file1', 'component_file2']
             )
 
+    @mock.patch('nemo.NemoPostProc.rebuild_namelist')
+    @mock.patch('nemo.utils.get_subset')
+    @mock.patch('nemo.NemoPostProc.global_attr_to_zonal')
+    def test_rebuild_diaptr_batch(self, mock_attr, mock_subset, mock_nl):
+        '''Test rebuild all function - diaptr attributes fixed in batch'''
+        func.logtest('Assert diaptr attributes are fixed in a single batch:')
+        self.nemo.naml.processing.rebuild_mean_buffer = 0
+        rebuild_zero = ['file_19980530_yyyymmdd_diaptr_0000.nc',
+                        'file_19980630_yyyymmdd_diaptr_0000.nc']
+        mock_subset.side_effect = [[], rebuild_zero, ['f1_cmpt1', 'f1_cmpt2'],
+                                   ['f2_cmpt1', 'f2_cmpt2']]
+        self.nemo.rebuild_fileset('SourceDir', 'f_diaptr')
+        mock_attr.assert_called_once_with(
+            'SourceDir', ['f1_cmpt1', 'f1_cmpt2', 'f2_cmpt1', 'f2_cmpt2']
+            )
+        self.assertEqual(mock_nl.call_count, 2)
+
     @mock.patch('nemo.utils.exec_subproc')
     @mock.patch('nemo.os.path.isfile')
     def test_rebuild_namelist(self, mock_isfile, mock_exec):
@@ -814,6 +838,214 @@ fchunksize=54321
         self.assertIn('failed to rebuild file', func.capture('err').lower())
         self.assertIn('file_19980530_ymd', func.capture('err').lower())
 
+    def test_rebuild_sets_concurrent(self):
+        '''Test maximum number of filesets rebuilt concurrently'''
+        func.logtest('Assert number of filesets rebuilt concurrently:')
+        self.nemo.naml.processing.rebuild_concurrent_sets = 3
+        for cmd, nsets in [('utility', 3), ('utility %F', 3),
+                           ('utility mynaml', 1)]:
+            with mock.patch('nemo.NemoPostProc.rebuild_cmd',
+                            new_callable=mock.PropertyMock,
+                            return_value=cmd):
+                self.assertEqual(self.nemo.rebuild_sets_concurrent, nsets)
+
+    @mock.patch('nemo.utils.remove_files')
+    @mock.patch('nemo.NemoPostProc.rebuild_namelist', return_value=0)
+    def test_rebuild_concurrent(self, mock_nl, mock_rm):
+        '''Test concurrent rebuilding of filesets'''
+        func.logtest('Assert concurrent rebuilding of filesets:')
+        self.nemo.naml.processing.rebuild_concurrent_sets = 2
+        jobs = [('file{}'.format(i), ['f{}_c1'.format(i), 'f{}_c2'.format(i)],
+                 i == 2) for i in range(4)]
+        self.nemo.rebuild_concurrent('SourceDir', jobs)
+
+        self.assertEqual(mock_nl.call_count, 4)
+        for corename, bldset, _ in jobs:
+            mock_nl.assert_any_call('SourceDir', corename, bldset,
+                                    omp=1, deflate_lev=0, rebu_cache=1234,
+                                    xchunk=2, ychunk=4, zchunk=6, tchunk=8,
+                                    msk=False)
+        # Components deleted in order, other than those to be kept
+        self.assertListEqual(
+            mock_rm.mock_calls,
+            [mock.call(jobs[i][1], path='SourceDir') for i in [0, 1, 3]]
+            )
+        self.assertIn('estimated footprint', func.capture())
+
+    @mock.patch('nemo.NemoPostProc.rebuild_footprint')
+    def test_rebuild_concurrent_memory(self, mock_size):
+        '''Test concurrent rebuilding of filesets - memory limit'''
+        func.logtest('Assert memory limit on concurrent rebuilding:')
+        self.nemo.naml.processing.rebuild_concurrent_sets = 3
+        self.nemo.naml.processing.rebuild_memory_limit = 100
+        mock_size.side_effect = [60., 30., 120., 10.]
+        jobs = [('file{}'.format(i), ['f{}'.format(i)], False)
+                for i in range(4)]
+        running = []
+        concurrent = []
+        lock = threading.Lock()
+
+        def rebuild(datadir, corename, *args, **kwargs):
+            ''' Record the filesets being rebuilt concurrently '''
+            with lock:
+                running.append(corename)
+                concurrent.append(sorted(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(corename)
+            return 0
+
+        with mock.patch('nemo.NemoPostProc.rebuild_namelist',
+                        side_effect=rebuild):
+            with mock.patch('nemo.utils.remove_files'):
+                self.nemo.rebuild_concurrent('SourceDir', jobs)
+
+        self.assertEqual(len(concurrent), 4)
+        sizes = {'file0': 60., 'file1': 30., 'file2': 120., 'file3': 10.}
+        for rebuilding in concurrent:
+            if len(rebuilding) > 1:
+                self.assertLessEqual(sum(sizes[f] for f in rebuilding), 100.)
+            self.assertLessEqual(len(rebuilding), 3)
+        self.assertIn(['file2'], concurrent)
+
+    @mock.patch('nemo.utils.remove_files')
+    def test_rebuild_concurrent_fail(self, mock_rm):
+        '''Test concurrent rebuilding of filesets - failure'''
+        func.logtest('Assert failure of concurrent rebuilding:')
+        self.nemo.naml.processing.rebuild_concurrent_sets = 2
+        jobs = [('file{}'.format(i), ['f{}'.format(i)], False)
+                for i in range(4)]
+
+        def rebuild(datadir, corename, *args, **kwargs):
+            ''' Fail to rebuild the second fileset '''
+            if corename == 'file1':
+                nemo.utils.log_msg('Failed to rebuild', level='ERROR')
+            time.sleep(0.05)
+            return 0
+
+        with mock.patch('nemo.NemoPostProc.rebuild_namelist',
+                        side_effect=rebuild) as mock_nl:
+            with self.assertRaises(SystemExit):
+                self.nemo.rebuild_concurrent('SourceDir', jobs)
+        self.assertLess(mock_nl.call_count, 4)
+        self.assertIn(mock.call(['f0'], path='SourceDir'), mock_rm.mock_calls)
+        self.assertNotIn(mock.call(['f1'], path='SourceDir'),
+                         mock_rm.mock_calls)
+
+    @mock.patch('nemo.NemoPostProc.rebuild_footprint', return_value=60.)
+    @mock.patch('nemo.utils.remove_files')
+    def test_rebuild_concurrent_exception(self, mock_rm, mock_size):
+        '''Test concurrent rebuilding of filesets - unexpected exception'''
+        func.logtest('Assert exception in concurrent rebuilding:')
+        self.nemo.naml.processing.rebuild_concurrent_sets = 2
+        self.nemo.naml.processing.rebuild_memory_limit = 100
+        self.nemo.naml.processing.rebuild_omp_numthreads = 4
+        jobs = [('file{}'.format(i), ['f{}'.format(i)], False)
+                for i in range(3)]
+
+        def rebuild(datadir, corename, *args, **kwargs):
+            ''' Fail to write the namelist for the first fileset '''
+            if corename == 'file0':
+                raise IOError('Permission denied')
+            return 0
+
+        with mock.patch('nemo.NemoPostProc.rebuild_namelist',
+                        side_effect=rebuild) as mock_nl:
+            with self.assertRaises(IOError):
+                self.nemo.rebuild_concurrent('SourceDir', jobs)
+        # Memory released following failure - no further sets started
+        mock_nl.assert_called_once_with('SourceDir', 'file0', ['f0'],
+                                        omp=2, deflate_lev=0, rebu_cache=1234,
+                                        xchunk=2, ychunk=4, zchunk=6,
+                                        tchunk=8, msk=False)
+        self.assertListEqual(mock_rm.mock_calls, [])
+
+    @mock.patch('nemo.NemoPostProc.rebuild_netcdf4', return_value=0)
+    @mock.patch('nemo.utils.exec_subproc')
+    def test_rebuild_namelist_netcdf4(self, mock_exec, mock_nc4):
+        '''Test rebuild namelist function - in-process rebuild'''
+        func.logtest('Assert in-process rebuild from rebuild_namelist:')
+        self.nemo.naml.processing.rebuild_netcdf4 = True
+        rtn = self.nemo.rebuild_namelist('TestDir', 'file_19980530_ymd',
+                                         ['f1', 'f2'], deflate_lev=3)
+        self.assertEqual(rtn, 0)
+        mock_nc4.assert_called_once_with('TestDir', 'file_19980530_ymd',
+                                         ['f1', 'f2'], deflate_lev=3,
+                                         xchunk=None, ychunk=None,
+                                         zchunk=None, tchunk=None,
+                                         rebu_cache=None, chunk=None,
+                                         dims=None, msk=False)
+        self.assertEqual(mock_exec.mock_calls, [])
+        self.assertEqual(self.nemo.rebuild_sets_concurrent, 1)
+
+    @mock.patch('nemo.NemoPostProc.rebuild_netcdf4')
+    @mock.patch('nemo.utils.exec_subproc', return_value=(0, ''))
+    def test_rebuild_netcdf4_icebergs(self, mock_exec, mock_nc4):
+        '''Test rebuild namelist function - in-process, iceberg restarts'''
+        func.logtest('Assert iceberg restarts not rebuilt in-process:')
+        self.nemo.naml.processing.rebuild_netcdf4 = True
+        with mock.patch('nemo.os.path.isfile', return_value=True):
+            with mock.patch('nemo.NemoPostProc.rebuild_icebergs',
+                            return_value=0):
+                with mock.patch('nemo.utils.move_files'):
+                    with mock.patch('nemo.utils.remove_files'):
+                        _ = self.nemo.rebuild_namelist(
+                            os.getcwd(), 'file_19980530_icebergs', ['f1']
+                            )
+        self.assertEqual(mock_nc4.mock_calls, [])
+        self.assertEqual(len(mock_exec.mock_calls), 1)
+
+    @mock.patch('nemo.os.rename')
+    @mock.patch('nemo.netcdf_utils.rebuild_domains')
+    def test_rebuild_netcdf4(self, mock_rebuild, mock_mv):
+        '''Test in-process rebuild of a fileset'''
+        func.logtest('Assert in-process rebuild of a fileset:')
+        rtn = self.nemo.rebuild_netcdf4('TestDir', 'file_ymd',
+                                        ['f1', 'f2'], deflate_lev=2,
+                                        xchunk=10, tchunk=1)
+        self.assertEqual(rtn, 0)
+        mock_rebuild.assert_called_once_with(
+            [os.path.join('TestDir', 'f1'), os.path.join('TestDir', 'f2')],
+            os.path.join('TestDir', 'file_ymd.nc.tmp'), compression=2,
+            chunking=['x/10', 'time_counter/1', 't/1'], maskout=False,
+            dims=None
+            )
+        mock_mv.assert_called_once_with(
+            os.path.join('TestDir', 'file_ymd.nc.tmp'),
+            os.path.join('TestDir', 'file_ymd.nc')
+            )
+        self.assertIn('Successfully rebuilt file', func.capture())
+        self.assertNotIn('not used by the in-process rebuild',
+                         func.capture('err'))
+
+    @mock.patch('nemo.os.rename')
+    @mock.patch('nemo.netcdf_utils.rebuild_domains')
+    def test_rebuild_netcdf4_options(self, mock_rebuild, mock_mv):
+        '''Test in-process rebuild of a fileset - rebuild_nemo options'''
+        func.logtest('Assert rebuild_nemo options with in-process rebuild:')
+        rtn = self.nemo.rebuild_netcdf4('TestDir', 'file_ymd', ['f1'],
+                                        deflate_lev=2, rebu_cache=1234,
+                                        chunk=10, dims=['i', 'j'], msk=True)
+        self.assertEqual(rtn, 0)
+        mock_rebuild.assert_called_once_with(
+            [os.path.join('TestDir', 'f1')],
+            os.path.join('TestDir', 'file_ymd.nc.tmp'), compression=2,
+            chunking=[], maskout=True, dims=['i', 'j']
+            )
+        self.assertIn('not used by the in-process rebuild: nchunksize, '
+                      'rebu_cache', func.capture('err'))
+
+    @mock.patch('nemo.netcdf_utils.rebuild_domains',
+                side_effect=KeyError('DOMAIN_size_global'))
+    def test_rebuild_netcdf4_fail(self, mock_rebuild):
+        '''Test in-process rebuild of a fileset - failure'''
+        func.logtest('Assert failure of in-process rebuild:')
+        with mock.patch('nemo.utils.get_debugmode', return_value=True):
+            rtn = self.nemo.rebuild_netcdf4('TestDir', 'file_ymd', ['f1'])
+        self.assertEqual(rtn, 99)
+        self.assertIn('Failed to rebuild file', func.capture('err'))
+        self.assertIn('DOMAIN_size_global', func.capture('err'))
+
     def test_rebuild_icebergs_call(self):
         '''Test call to external iceberg rebuilding routine: icb_combrest'''
         func.logtest('Assert call to external iceberg rebuilding routine:')
@@ -960,6 +1192,105 @@ History_Data/NEMOhist/ae710o_10d_19780901_19780910_diaptr_0000.nc";
 
         self.assertIn('1D data, global attributes OK', func.capture())
 
+    def test_global_to_zonal_netcdf4(self):
+        '''Test in-process transform of global attributes to zonal ones'''
+        func.logtest('Assert in-process global_attr_to_zonal method:')
+        self.nemo.naml.processing.ncatted_cmd = 'netcdf4'
+        fnames = ['zonal_test1.nc', 'zonal_test2.nc', 'zonal_test3.nc']
+        attributes = [
+            {'DOMAIN_size_global': [123, 1207],
+             'DOMAIN_position_first': [1, 1],
+             'DOMAIN_position_last': [12, 151], 'ibegin': 5},
+            {'DOMAIN_size_global': [1, 1207],
+             'DOMAIN_position_first': [1, 1],
+             'DOMAIN_position_last': [1, 151], 'ibegin': 1},
+            {'DOMAIN_size_global': 1207}
+            ]
+        for fname, attrs in zip(fnames, attributes):
+            with nemo.netcdf_utils.Dataset(fname, 'w') as ncid:
+                ncid.setncatts(attrs)
+        try:
+            with mock.patch('nemo.netcdf_utils.get_dataset',
+                            wraps=nemo.netcdf_utils.get_dataset) as mock_ncid:
+                self.nemo.global_attr_to_zonal(os.getcwd(), fnames)
+            self.assertEqual(len(mock_ncid.mock_calls), 3)
+            self.assertListEqual(self.nemo.suite.preprocess_file.mock_calls,
+                                 [])
+            for fname in fnames[:2]:
+                with nemo.netcdf_utils.Dataset(fname) as ncid:
+                    for attr, value in attributes[1].items():
+                        self.assertListEqual(
+                            nemo.numpy.atleast_1d(ncid.getncattr(attr)).
+                            tolist(), nemo.numpy.atleast_1d(value).tolist()
+                            )
+            with nemo.netcdf_utils.Dataset(fnames[2]) as ncid:
+                self.assertEqual(ncid.DOMAIN_size_global, 1207)
+        finally:
+            for fname in fnames:
+                os.remove(fname)
+        self.assertIn('1 of 3 file(s) updated', func.capture())
+
+    def test_global_to_zonal_nc4_missing(self):
+        '''Test in-process global attributes to zonal - missing attributes'''
+        func.logtest('Assert missing attributes with in-process method:')
+        self.nemo.naml.processing.ncatted_cmd = 'netcdf4'
+        fname = 'zonal_test.nc'
+        with nemo.netcdf_utils.Dataset(fname, 'w') as ncid:
+            ncid.setncatts({'DOMAIN_size_global': [123, 1207],
+                            'DOMAIN_position_last': [12, 151]})
+        try:
+            with nemo.netcdf_utils.Dataset(fname) as ncid:
+                updates, missing = self.nemo._zonal_attr_updates(ncid)
+            self.assertListEqual(missing, ['DOMAIN_position_first'])
+            self.assertListEqual(sorted(updates), ['DOMAIN_position_last',
+                                                   'DOMAIN_size_global'])
+            self.assertListEqual(updates['DOMAIN_size_global'].tolist(),
+                                 [1, 1207])
+            with self.assertRaises(SystemExit):
+                self.nemo.global_attr_to_zonal(os.getcwd(), fname)
+        finally:
+            os.remove(fname)
+        self.assertIn('attribute(s) DOMAIN_position_first not found',
+                      func.capture('err'))
+
+    @unittest.skipUnless(os.path.isdir(MEAN_NEMO_DATA),
+                         'mean_nemo test data not available')
+    def test_mean_netcdf4_mean_nemo(self):
+        '''Test in-process mean agrees with mean_nemo reference output'''
+        func.logtest('Assert in-process mean matches mean_nemo output:')
+        fnames = ['mean_nemo_input1.nc', 'mean_nemo_input2.nc']
+        meanfile = 'mean_nemo_output.nc'
+        try:
+            for i, fname in enumerate(fnames, 1):
+                shutil.copy(os.path.join(MEAN_NEMO_DATA,
+                                         'input_file{}.nc'.format(i)), fname)
+            nemo.fix_nemo_cell_methods(fnames)
+            nemo.netcdf_utils.mean_netcdf(
+                fnames, meanfile, time_vars=self.defaults.time_vars
+                )
+            with nemo.netcdf_utils.Dataset(meanfile) as mean, \
+                    nemo.netcdf_utils.Dataset(
+                        os.path.join(MEAN_NEMO_DATA, 'known_output_xcs.nc')
+                        ) as ref:
+                self.assertEqual(mean.variables['thetao'].cell_methods,
+                                 'time: mean (thickness weighted)')
+                for var in ['thetao', 'to', 'tos', 'e3t', 'time_counter',
+                            'time_centered', 'time_instant']:
+                    mvals = mean.variables[var][:]
+                    rvals = ref.variables[var][:]
+                    self.assertListEqual(
+                        nemo.numpy.ma.getmaskarray(mvals).tolist(),
+                        nemo.numpy.ma.getmaskarray(rvals).tolist()
+                        )
+                    self.assertTrue(nemo.numpy.ma.allclose(mvals, rvals,
+                                                           rtol=1.e-6))
+        finally:
+            for fname in fnames + [meanfile]:
+                try:
+                    os.remove(fname)
+                except OSError:
+                    pass
+
 
 class AdditionalArchiveTests(unittest.TestCase):
     '''Unit tests relating to the archiving additional file'''
@@ -1129,7 +1460,7 @@ class AdditionalArchiveTests(unittest.TestCase):
         self.nemo.create_general()
 
         pattern = r'[a-z]*_runido_\d+[hdmsyx]{{1}}_\d{{4}}\d{{2}}\d{{2}}' + \
-            r'-\d{{4}}\d{{2}}\d{{2}}_{}.nc'
+            r'-\d{{4}}\d{{2}}\d{{2}}_{}.nc$'
         mockset_calls = []
         for field in ['UK_shelf_T', 'UK_shelf_U', 'UK_shelf_V']:
             mockset_calls.append(mock.call('HERE', pattern.format(field)))
@@ -1162,7 +1493,7 @@ class AdditionalArchiveTests(unittest.TestCase):
         self.nemo.create_general()
 
         pattern = r'[a-z]*_runido_\d+[hdmsyx]{{1}}_\d{{4}}\d{{2}}\d{{2}}' + \
-            r'-\d{{4}}\d{{2}}\d{{2}}_{}.nc'
+            r'-\d{{4}}\d{{2}}\d{{2}}_{}.nc$'
         self.assertListEqual(mock_set.mock_calls,
                              [mock.call('HERE', pattern.format('shelf-T'))])
 
@@ -1248,7 +1579,7 @@ class AdditionalArchiveTests(unittest.TestCase):
             self.nemo.create_general()
 
         pattern = r'[a-z]*_runido_\d+[hdmsyx]{{1}}_\d{{4}}\d{{2}}\d{{2}}' + \
-            r'-\d{{4}}\d{{2}}\d{{2}}_{}.nc'
+            r'-\d{{4}}\d{{2}}\d{{2}}_{}.nc$'
         self.assertListEqual(mock_set.mock_calls,
                              [mock.call('HERE', pattern.format('shelf-T'))])
 
@@ -1271,7 +1602,7 @@ class AdditionalArchiveTests(unittest.TestCase):
             self.nemo.create_general()
 
         pattern = r'[a-z]*_runido_\d+[hdmsyx]{{1}}_\d{{4}}\d{{2}}\d{{2}}' + \
-            r'-\d{{4}}\d{{2}}\d{{2}}_{}.nc'
+            r'-\d{{4}}\d{{2}}\d{{2}}_{}.nc$'
         self.assertListEqual(mock_set.mock_calls,
                              [mock.call('HERE', pattern.format('shelf-T'))])
 
@@ -1279,6 +1610,219 @@ class AdditionalArchiveTests(unittest.TestCase):
         self.assertListEqual(mock_mv.mock_calls, [])
         self.assertIn('Unable to determine x-y dimensions', func.capture('err'))
 
+    def test_region_limits(self):
+        '''Test regions to extract'''
+        func.logtest('Assert regions to extract:')
+        self.nemo.naml.processing.region_dimensions = ['x_%G', 1, '2',
+                                                       'y', 3, 4]
+        self.assertListEqual(
+            self.nemo.region_limits('shelf-T'),
+            [(None, nemo.OrderedDict([('x_T', (1, 2)), ('y', (3, 4))]))]
+            )
+
+        self.nemo.naml.processing.region_names = ['arctic', 'shelf']
+        with self.assertRaises(ValueError):
+            self.nemo.region_limits('grid-T')
+        self.nemo.naml.processing.region_dimensions += ['x', 5, 6, 'y', 7, 8]
+        self.assertListEqual(
+            self.nemo.region_limits('grid-T'),
+            [('arctic', nemo.OrderedDict([('x_T', (1, 2)), ('y', (3, 4))])),
+             ('shelf', nemo.OrderedDict([('x', (5, 6)), ('y', (7, 8))]))]
+            )
+
+    @mock.patch('nemo.utils.get_subset')
+    @mock.patch('nemo.utils.move_files')
+    @mock.patch('nemo.utils.remove_files')
+    @mock.patch('nemo.mt.ModelTemplate.compress_file')
+    def test_create_region_netcdf4(self, mock_cmp, mock_rm, mock_mv,
+                                   mock_set):
+        '''Test call to create_regional_extraction - named regions'''
+        func.logtest('Assert call to create_regional_extraction - netcdf4:')
+        self.nemo.naml.processing.extract_region = True
+        self.nemo.naml.processing.extract_region_cmd = 'netcdf4'
+        self.nemo.naml.processing.compression_level = 2
+        self.nemo.naml.processing.region_names = ['arctic', 'shelf']
+        self.nemo.naml.processing.region_dimensions = ['x', 1, 2, 'y', 3, 4,
+                                                       'x', 5, 6, 'y', 7, 8]
+        self.nemo.region_fields = ['grid-T']
+        self.nemo.diagsdir = os.getcwd()
+        self.nemo.extract_regions_netcdf4 = mock.Mock(return_value=0)
+        self.nemo.extracted_regions = mock.Mock(return_value=['arctic'])
+        self.nemo.record_extracted_regions = mock.Mock()
+        mock_set.side_effect = [['fileT']]
+        self.nemo.create_regional_extraction()
+
+        self.nemo.extract_regions_netcdf4.assert_called_once_with(
+            'HERE/fileT', self.nemo.region_limits('grid-T')
+            )
+        self.nemo.record_extracted_regions.assert_called_once_with(
+            'HERE/fileT', self.nemo.region_limits('grid-T')
+            )
+        self.assertListEqual(self.nemo.suite.preprocess_file.mock_calls, [])
+        self.assertListEqual(mock_cmp.mock_calls, [])
+        mock_rm.assert_called_once_with('HERE/fileT')
+        self.assertListEqual(mock_mv.mock_calls, [])
+
+    @mock.patch('nemo.utils.get_subset')
+    @mock.patch('nemo.utils.remove_files')
+    @mock.patch('nemo.mt.ModelTemplate.compress_file')
+    def test_create_region_named_done(self, mock_cmp, mock_rm, mock_set):
+        '''Test call to create_regional_extraction - regions extracted'''
+        func.logtest('Assert named regions are extracted only once:')
+        fname = 'nemo_runido_1m_19800901-19801001_grid-T.nc'
+        with nemo.netcdf_utils.Dataset(fname, 'w') as ncid:
+            ncid.createDimension('x', 10)
+        mock_set.return_value = [fname]
+        extract_calls = []
+        try:
+            # Each job has a new archive log.  Regions extracted and
+            # archived by the first job are no longer in the archive
+            # directory for the second.
+            for _ in range(2):
+                postproc = nemo.NemoPostProc()
+                postproc.suite = mock.Mock()
+                postproc.suite.prefix = 'RUNID'
+                postproc.share = os.getcwd()
+                postproc.diagsdir = os.getcwd()
+                postproc.naml.processing.extract_region = True
+                postproc.naml.processing.extract_region_cmd = 'netcdf4'
+                postproc.naml.processing.compression_level = 2
+                postproc.naml.processing.region_names = ['arctic', 'shelf']
+                postproc.naml.processing.region_dimensions = \
+                    ['x', 1, 2, 'y', 3, 4, 'x', 5, 6, 'y', 7, 8]
+                postproc.region_fields = ['grid-T']
+                postproc.mean_fields = ['grid-T']
+                postproc.extract_regions_netcdf4 = mock.Mock(return_value=0)
+                postproc.create_regional_extraction()
+                extract_calls += postproc.extract_regions_netcdf4.mock_calls
+
+            with nemo.netcdf_utils.Dataset(fname) as ncid:
+                self.assertEqual(ncid.getncattr(nemo.EXTRACTED_REGIONS_ATTR),
+                                 fname + ':arctic,shelf')
+        finally:
+            os.remove(fname)
+
+        self.assertListEqual(extract_calls, [mock.call(
+            os.path.join(os.getcwd(), fname),
+            postproc.region_limits('grid-T')
+            )])
+        self.assertIn('Regions already extracted from ' + fname,
+                      func.capture())
+        self.assertListEqual(postproc.suite.mock_calls, [])
+        # Global file is retained for meaning
+        self.assertListEqual(mock_cmp.mock_calls, [])
+        self.assertListEqual(mock_rm.mock_calls, [])
+
+    def test_extracted_regions(self):
+        '''Test record of regions extracted from a global file'''
+        func.logtest('Assert record of extracted regions:')
+        fname = 'nemo_runido_1s_19800901-19801201_grid-T.nc'
+        with nemo.netcdf_utils.Dataset(fname, 'w') as ncid:
+            # Record inherited from a component of the mean
+            ncid.setncattr(nemo.EXTRACTED_REGIONS_ATTR,
+                           'nemo_runido_1m_19800901-19801001_grid-T.nc:arctic')
+        try:
+            self.assertListEqual(self.nemo.extracted_regions(fname), [])
+            self.nemo.record_extracted_regions(
+                fname, [('arctic', {}), ('shelf', {})]
+                )
+            self.assertListEqual(self.nemo.extracted_regions(fname),
+                                 ['arctic', 'shelf'])
+        finally:
+            os.remove(fname)
+
+    @mock.patch('nemo.utils.get_subset')
+    @mock.patch('nemo.utils.move_files')
+    def test_create_region_netcdf4_pass(self, mock_mv, mock_set):
+        '''Test call to create_regional_extraction - netcdf4 regional'''
+        func.logtest('Assert call to create_regional_extraction - regional:')
+        self.nemo.naml.processing.extract_region = True
+        self.nemo.naml.processing.extract_region_cmd = 'netcdf4'
+        self.nemo.naml.processing.region_dimensions = ['x', 1, 2, 'y', 3, 4]
+        self.nemo.region_fields = ['shelf-T']
+        self.nemo.diagsdir = os.getcwd()
+        self.nemo.extract_regions_netcdf4 = mock.Mock(return_value=0)
+        mock_set.side_effect = [['fileT']]
+        with mock.patch('nemo.netcdf_utils.get_dataset') as mock_ncid:
+            mock_ncid().__enter__().dimensions = {'x': [0, 1], 'y': [0] * 10}
+            self.nemo.create_regional_extraction()
+
+        self.assertListEqual(self.nemo.extract_regions_netcdf4.mock_calls,
+                             [])
+        self.assertIn('No extraction necessary', func.capture())
+        mock_mv.assert_called_once_with('HERE/fileT', os.getcwd())
+
+    @mock.patch('nemo.utils.get_subset')
+    def test_create_region_named_ncks(self, mock_set):
+        '''Test call to create_regional_extraction - named regions, ncks'''
+        func.logtest('Assert named regions cannot be extracted by ncks:')
+        self.nemo.naml.processing.extract_region = True
+        self.nemo.naml.processing.region_names = 'arctic'
+        self.nemo.naml.processing.region_dimensions = ['x', 1, 2, 'y', 3, 4]
+        self.nemo.region_fields = ['grid-T']
+        self.nemo.diagsdir = os.getcwd()
+        mock_set.side_effect = [['fileT']]
+        with self.assertRaises(SystemExit):
+            self.nemo.create_regional_extraction()
+        self.assertListEqual(self.nemo.suite.preprocess_file.mock_calls, [])
+        self.assertIn('requires extract_region_cmd="netcdf4"',
+                      func.capture('err'))
+
+    @mock.patch('nemo.os.rename')
+    @mock.patch('nemo.netcdf_utils.extract_regions')
+    def test_extract_regions_netcdf4(self, mock_extract, mock_rn):
+        '''Test in-process extraction of regions'''
+        func.logtest('Assert in-process extraction of regions:')
+        self.nemo.diagsdir = 'DDIR'
+        self.nemo.naml.processing.compression_level = 1
+        regions = [('arctic', {'x': (1, 2)}), ('shelf', {'x': (3, 4)})]
+        outfiles = ['DDIR/file_grid-T-arctic.nc', 'DDIR/file_grid-T-shelf.nc']
+        mock_extract.return_value = (
+            nemo.OrderedDict([(outfiles[0], (1048576, 0.5)),
+                              (outfiles[1], (2097152, 1.))]),
+            3145728
+            )
+        rcode = self.nemo.extract_regions_netcdf4('HERE/file_grid-T.nc',
+                                                  regions)
+        self.assertEqual(rcode, 0)
+        mock_extract.assert_called_once_with(
+            'HERE/file_grid-T.nc',
+            [(outfiles[0], {'x': (1, 2)}), (outfiles[1], {'x': (3, 4)})],
+            compression=1, chunking=['time_counter/1', 'y/191', 'x/144']
+            )
+        self.assertListEqual(mock_rn.mock_calls, [])
+        self.assertIn('Region arctic: extracted 1.0MiB in 0.50s',
+                      func.capture())
+        self.assertIn('Region shelf: extracted 2.0MiB in 1.00s',
+                      func.capture())
+        self.assertIn('3.0MiB read from file_grid-T.nc', func.capture())
+
+        # Single unnamed region - replaces the global file
+        mock_extract.return_value = (
+            {'HERE/file_grid-T.nc.tmp': (1048576, 0.5)}, 1048576
+            )
+        rcode = self.nemo.extract_regions_netcdf4('HERE/file_grid-T.nc',
+                                                  [(None, {'x': (1, 2)})])
+        self.assertEqual(rcode, 0)
+        mock_rn.assert_called_once_with('HERE/file_grid-T.nc.tmp',
+                                        'HERE/file_grid-T.nc')
+
+    @mock.patch('nemo.utils.remove_files')
+    @mock.patch('nemo.netcdf_utils.extract_regions',
+                side_effect=IOError('Disk full'))
+    def test_extract_regions_netcdf4_fail(self, mock_extract, mock_rm):
+        '''Test in-process extraction of regions - failure'''
+        func.logtest('Assert failure of in-process extraction of regions:')
+        with mock.patch('nemo.utils.get_debugmode', return_value=True):
+            rcode = self.nemo.extract_regions_netcdf4(
+                'HERE/file.nc', [(None, {'x': (1, 2)})]
+                )
+        self.assertEqual(rcode, 99)
+        mock_rm.assert_called_once_with(['HERE/file.nc.tmp'],
+                                        ignore_non_exist=True)
+        self.assertIn('Regional extraction failed for HERE/file.nc:\n'
+                      'Disk full', func.capture('err'))
+
     @mock.patch('nemo.utils.get_subset')
     @mock.patch('nemo.mt.ModelTemplate.clean_archived_files')
     def test_arch_region_extract(self, mock_clean, mock_set):
@@ -1308,6 +1852,20 @@ class AdditionalArchiveTests(unittest.TestCase):
                                        'UK Shelf region'))
         self.assertEqual(len(mock_clean.mock_calls), 3)
 
+    @mock.patch('nemo.utils.get_subset', return_value=[])
+    def test_arch_region_named(self, mock_set):
+        '''Test call to archive_regional_extraction - named regions'''
+        func.logtest('Assert call to archive_regional_extraction - named:')
+        self.nemo.naml.processing.region_names = ['arctic', 'shelf']
+        self.nemo.region_fields = ['grid-T']
+        self.nemo.diagsdir = 'DDIR'
+        with mock.patch('nemo.utils.check_directory', return_value='DDIR'):
+            self.nemo.archive_regional_extraction()
+        mock_set.assert_called_once_with(
+            'DDIR', r'^[a-z]*_runido_\d+[hdmsyx]{1}_\d{4}\d{2}\d{2}-'
+            r'\d{4}\d{2}\d{2}_grid-T(-(arctic|shelf))?.nc$'
+            )
+
     @mock.patch('nemo.utils.get_subset')
     @mock.patch('nemo.utils.remove_files')
     @mock.patch('nemo.os.rename')
@@ -1380,6 +1938,7 @@ class UtilityMethodTests(unittest.TestCase):
         self.ncid = nemo.utils.Variables()
         self.ncid.variables = {'dummy1': mock.Mock()}
         self.ncid.variables['dummy1'].standard_name = "cell_thickness"
+        self.ncid.data_model = 'NETCDF4'
         self.ncid.close = lambda: None
 
     def tearDown(self):
@@ -1497,8 +2056,9 @@ class UtilityMethodTests(unittest.TestCase):
         mock_ncid.return_value = self.ncid
         msgs = nemo.fix_nemo_cell_methods(['file1'])
         self.assertListEqual(msgs, [])
-        mock_cp.assert_called_once_with(['file1'], tmp_ext='.tmp')
-        mock_mv.assert_called_once_with('file1.tmp', 'file1')
+        mock_ncid.assert_called_once_with('file1', action='r+')
+        self.assertListEqual(mock_cp.mock_calls, [])
+        self.assertListEqual(mock_mv.mock_calls, [])
 
     @mock.patch('nemo.utils.copy_files', return_value=['file1.tmp'])
     @mock.patch('nemo.os.rename')
@@ -1521,8 +2081,66 @@ class UtilityMethodTests(unittest.TestCase):
         self.assertIn('volume weighted', sorted(msgs)[0])
         self.assertEqual(self.ncid.variables['temptot'].cell_methods,
                          nemo.VOL_WEIGHT_CELL_METHODS)
-        mock_cp.assert_called_once_with(['file1'], tmp_ext='.tmp')
+        self.assertListEqual(mock_cp.mock_calls, [])
+        self.assertListEqual(mock_mv.mock_calls, [])
+        self.assertIn('59 bytes edited in place, 0 bytes rewritten',
+                      func.capture())
+
+    @mock.patch('nemo.utils.copy_files', return_value=['file1.tmp'])
+    @mock.patch('nemo.os.rename')
+    @mock.patch('nemo.os.path.getsize', return_value=1000)
+    @mock.patch('nemo.netcdf_utils.get_dataset')
+    def test_fix_nemo_cell_methods_classic(self, mock_ncid, mock_size,
+                                           mock_mv, mock_cp):
+        '''Test fix_nemo_cell_methods - classic format header grows'''
+        func.logtest('Assert rewrite of classic file by fix_nemo_cell_methods:')
+        self.ncid.data_model = 'NETCDF3_CLASSIC'
+        self.ncid.variables['temptot'] = nemo.utils.Variables()
+        self.ncid.variables['temptot'].cell_methods = 'time: mean'
+
+        mock_ncid.return_value = self.ncid
+        msgs = nemo.fix_nemo_cell_methods(['file1'])
+
+        self.assertEqual(len(msgs), 1)
+        self.assertIn('variable temptot in file file1', msgs[0])
+        self.assertEqual(self.ncid.variables['temptot'].cell_methods,
+                         nemo.VOL_WEIGHT_CELL_METHODS)
+        self.assertListEqual(mock_ncid.mock_calls,
+                             [mock.call('file1', action='r+'),
+                              mock.call('file1.tmp', action='r+')])
+        mock_cp.assert_called_once_with('file1', tmp_ext='.tmp')
+        mock_size.assert_called_once_with('file1')
         mock_mv.assert_called_once_with('file1.tmp', 'file1')
+        self.assertIn('0 bytes edited in place, 1000 bytes rewritten',
+                      func.capture())
+
+    @mock.patch('nemo.utils.copy_files')
+    @mock.patch('nemo.netcdf_utils.get_dataset')
+    def test_fix_nemo_cell_methods_done(self, mock_ncid, mock_cp):
+        '''Test fix_nemo_cell_methods - cell_methods already correct'''
+        func.logtest('Assert no update of correct cell_methods:')
+        self.ncid.data_model = 'NETCDF3_CLASSIC'
+        self.ncid.variables['temptot'] = nemo.utils.Variables()
+        self.ncid.variables['temptot'].cell_methods = \
+            nemo.VOL_WEIGHT_CELL_METHODS
+
+        mock_ncid.return_value = self.ncid
+        msgs = nemo.fix_nemo_cell_methods(['file1'])
+
+        self.assertListEqual(msgs, [])
+        self.assertListEqual(mock_cp.mock_calls, [])
+        self.assertNotIn('bytes edited in place', func.capture())
+
+    def test_header_grows(self):
+        '''Test assessment of netCDF header growth'''
+        func.logtest('Assert assessment of netCDF header growth:')
+        updates = {'var1': ('time: mean (volume w)', 'time: mean (volume wt)')}
+        self.assertFalse(nemo._header_grows('NETCDF3_CLASSIC', updates))
+        updates['var2'] = (None, 'time: mean')
+        self.assertTrue(nemo._header_grows('NETCDF3_64BIT_OFFSET', updates))
+        self.assertFalse(nemo._header_grows('NETCDF4', updates))
+        updates = {'var1': ('time: mean', 'time: mean (volume weighted)')}
+        self.assertTrue(nemo._header_grows('NETCDF3_CLASSIC', updates))
 
     @mock.patch('nemo.utils.copy_files', return_value=['file1.tmp'])
     @mock.patch('nemo.os.rename')
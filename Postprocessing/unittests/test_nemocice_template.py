@@ -15,6 +15,10 @@
 import unittest
 import os
 import copy
+import shutil
+import tempfile
+import threading
+import time
 try:
     # mock is integrated into unittest as of Python 3.3
     import unittest.mock as mock
@@ -26,6 +30,7 @@ import testing_functions as func
 import runtime_environment
 
 import netcdf_filenames
+import utils
 
 # Import of modeltemplate requires 'RUNID' from runtime environment
 runtime_environment.setup_env()
@@ -679,6 +684,176 @@ class MeansTests(unittest.TestCase):
         self.assertListEqual(self.model.fix_mean_time.mock_calls, [])
 
 
+    @mock.patch('modeltemplate.os.path')
+    @mock.patch('modeltemplate.utils.remove_files')
+    @mock.patch('modeltemplate.climatemean.create_mean', return_value=0)
+    def test_create_means_netcdf4(self, mock_create, mock_rm, mock_path):
+        '''Test successful creation of means - in-process meaning'''
+        func.logtest('Assert creation of a mean in-process:')
+        self.model.naml.processing.means_cmd = 'netcdf4'
+        self.ncf.base = '1m'
+        self.model.loop_inputs.return_value = [self.ncf]
+        cmpt_files = ['month' + str(x) for x in range(1, 3)]
+        self.model.periodfiles.side_effect = [['setend'], cmpt_files]
+
+        with mock.patch('modeltemplate.utils.create_dir'):
+            self.model.create_means()
+
+        mock_create.assert_called_once_with(mock.ANY, self.model.mean_netcdf4,
+                                            [0]*5)
+        mock_rm.assert_called_once_with(cmpt_files, path='ShareDir')
+        self.assertListEqual(self.model.fix_mean_time.mock_calls, [])
+
+    @mock.patch('modeltemplate.utils.check_directory', side_effect=lambda x: x)
+    @mock.patch('modeltemplate.netcdf_utils.mean_netcdf')
+    def test_mean_netcdf4(self, mock_mean, mock_dir):
+        '''Test in-process creation of a mean file'''
+        func.logtest('Assert in-process creation of a mean file:')
+        meanfile = modeltemplate.climatemean.MeanFile('1s', '1m')
+        meanfile.component_files = ['month1', 'month2', 'month3']
+        meanfile.set_filename('MeanFileName', 'MeansDir')
+        self.model.naml.processing.time_vars = ['time_counter', 'time_c']
+
+        rcode, _ = self.model.mean_netcdf4(meanfile)
+        self.assertEqual(rcode, 0)
+        mock_mean.assert_called_once_with(
+            ['ShareDir/month1', 'ShareDir/month2', 'ShareDir/month3'],
+            'MeansDir/MeanFileName.tmp',
+            time_vars=['time_counter', 'time_c'], weighted=False
+            )
+
+        # Time weighted means
+        self.model.naml.processing.time_weighted_means = True
+        rcode, _ = self.model.mean_netcdf4(meanfile)
+        self.assertEqual(rcode, 0)
+        self.assertTrue(mock_mean.call_args[1]['weighted'])
+
+        mock_mean.side_effect = KeyError('time_counter')
+        rcode, output = self.model.mean_netcdf4(meanfile)
+        self.assertEqual(rcode, 99)
+        self.assertIn('time_counter', output)
+
+    @mock.patch('modeltemplate.ModelTemplate.accumulate_means')
+    @mock.patch('modeltemplate.utils.remove_files')
+    @mock.patch('modeltemplate.climatemean.create_mean', return_value=0)
+    def test_create_means_running(self, mock_create, mock_rm, mock_acc):
+        '''Test creation of means - running means'''
+        func.logtest('Assert update of running means with means creation:')
+        self.model.naml.processing.means_cmd = 'netcdf4'
+        self.model.naml.processing.running_means = True
+        self.ncf.base = '1m'
+        self.model.loop_inputs.return_value = [self.ncf]
+        cmpt_files = ['month' + str(x) for x in range(1, 3)]
+        self.model.periodfiles.side_effect = [['setend'], cmpt_files]
+
+        with mock.patch('modeltemplate.utils.create_dir'):
+            with mock.patch('modeltemplate.utils.check_directory',
+                            side_effect=lambda x: x):
+                self.model.create_means()
+
+        self.assertListEqual(
+            mock_rm.mock_calls,
+            [mock.call(cmpt_files, path='ShareDir'),
+             mock.call('ShareDir/MeanFileName.running',
+                       ignore_non_exist=True)]
+            )
+        mock_acc.assert_called_once_with(self.ncf)
+
+    @mock.patch('modeltemplate.utils.get_subset')
+    @mock.patch('modeltemplate.netcdf_utils.accumulate_netcdf')
+    def test_accumulate_means(self, mock_acc, mock_subset):
+        '''Test accumulation of running means'''
+        func.logtest('Assert accumulation of running means:')
+        self.ncf.base = '1s'
+        self.model.suite.meanref = [1000, 12, 1]
+        self.model.get_date = mock.Mock(side_effect=[('1996', '01', '01'),
+                                                     ('1996', '02', '01'),
+                                                     ('1996', '04', '01')])
+        stencils = ['AllMonths', 'Season1', 'Season1', 'Season2']
+        start_dates = []
+
+        def stencil(ncfile):
+            '''Record the start date of each filename requested'''
+            start_dates.append(ncfile.start_date)
+            return stencils.pop(0)
+        self.model.mean_stencil = mock.Mock(side_effect=stencil)
+        mock_subset.return_value = ['month3', 'month1', 'month2']
+        mock_acc.side_effect = [['month1', 'month2'], ['month3']]
+
+        with mock.patch('modeltemplate.utils.check_directory',
+                        side_effect=lambda x: x):
+            with mock.patch('modeltemplate.os.path.exists',
+                            side_effect=[False, True]):
+                self.model.accumulate_means(self.ncf)
+
+        mock_subset.assert_called_once_with('ShareDir', 'AllMonths$')
+        mock_acc.assert_called_once_with(
+            ['ShareDir/month1', 'ShareDir/month2'],
+            'ShareDir/Season1.running', time_vars='time', weighted=False
+            )
+        self.assertListEqual(start_dates[1:], [('1995', '12', '01'),
+                                           ('1995', '12', '01'),
+                                           ('1996', '03', '01')])
+        self.assertIn('Season1.running - 2 component(s) added',
+                      func.capture())
+
+    @mock.patch('modeltemplate.utils.remove_files')
+    @mock.patch('modeltemplate.utils.get_subset', return_value=['month1'])
+    @mock.patch('modeltemplate.netcdf_utils.accumulate_netcdf',
+                side_effect=IOError('Corrupt'))
+    def test_accumulate_means_fail(self, mock_acc, mock_subset, mock_rm):
+        '''Test accumulation of running means - failure'''
+        func.logtest('Assert failure to accumulate running means:')
+        self.ncf.base = '1s'
+        self.model.suite.meanref = [1000, 12, 1]
+        self.model.get_date = mock.Mock(return_value=('1996', '01', '01'))
+        self.model.mean_stencil = mock.Mock(side_effect=['AllMonths',
+                                                         'Season1'])
+        with mock.patch('modeltemplate.utils.check_directory',
+                        side_effect=lambda x: x):
+            self.model.accumulate_means(self.ncf)
+        mock_rm.assert_called_once_with('ShareDir/Season1.running',
+                                        ignore_non_exist=True)
+        self.assertIn('Failed to update running mean', func.capture('err'))
+
+    @mock.patch('modeltemplate.utils.check_directory', side_effect=lambda x: x)
+    @mock.patch('modeltemplate.netcdf_utils.running_mean_components')
+    @mock.patch('modeltemplate.netcdf_utils.mean_netcdf')
+    @mock.patch('modeltemplate.netcdf_utils.finalise_netcdf')
+    @mock.patch('modeltemplate.netcdf_utils.accumulate_netcdf')
+    def test_mean_netcdf4_running(self, mock_acc, mock_final, mock_mean,
+                                  mock_cmpts, mock_dir):
+        '''Test in-process creation of a mean file - running mean'''
+        func.logtest('Assert creation of a mean file from running mean:')
+        meanfile = modeltemplate.climatemean.MeanFile('1s', '1m')
+        meanfile.component_files = ['month1', 'month2', 'month3']
+        meanfile.set_filename('MeanFileName', 'MeansDir')
+        infiles = ['ShareDir/month1', 'ShareDir/month2', 'ShareDir/month3']
+
+        mock_cmpts.return_value = ['month1', 'month2']
+        rcode, output = self.model.mean_netcdf4(meanfile)
+        self.assertEqual(rcode, 0)
+        self.assertIn('from running mean', output)
+        mock_acc.assert_called_once_with(infiles,
+                                         'MeansDir/MeanFileName.running',
+                                         time_vars='time', weighted=False)
+        mock_final.assert_called_once_with('MeansDir/MeanFileName.running',
+                                           'ShareDir/month1',
+                                           'MeansDir/MeanFileName.tmp',
+                                           time_vars='time')
+        self.assertListEqual(mock_mean.mock_calls, [])
+
+        # Running mean with components from another period
+        mock_cmpts.return_value = ['month0', 'month1']
+        rcode, _ = self.model.mean_netcdf4(meanfile)
+        self.assertEqual(rcode, 0)
+        self.assertEqual(len(mock_acc.mock_calls), 1)
+        mock_mean.assert_called_once_with(infiles,
+                                          'MeansDir/MeanFileName.tmp',
+                                          time_vars='time', weighted=False)
+        self.assertIn('contains files outside the mean period',
+                      func.capture('err'))
+
 class ArchiveTests(unittest.TestCase):
     '''Unit tests relating to archiving of files'''
 
@@ -793,7 +968,7 @@ class ArchiveTests(unittest.TestCase):
                                 return_value=['10x']):
                     self.model.prepare_archive()
 
-        pattern = r'.*_runidx_(10x)_\d{4}\d{2}\d{2}-\d{4}\d{2}\d{2}.nc'
+        pattern = r'.*_runidx_(10x)_\d{4}\d{2}\d{2}-\d{4}\d{2}\d{2}.nc$'
         self.assertListEqual(mock_set.mock_calls,
                              [mock.call(os.getcwd(), pattern)])
         self.assertListEqual(mock_mv.mock_calls,
@@ -820,7 +995,8 @@ class ArchiveTests(unittest.TestCase):
                                 return_value=['10x']):
                     self.model.prepare_archive()
 
-        pattern = r'.*_runidx_(10x)_\d{4}\d{2}\d{2}-\d{4}\d{2}\d{2}_(F1|F2).nc'
+        pattern = r'.*_runidx_(10x)_\d{4}\d{2}\d{2}-\d{4}\d{2}\d{2}' \
+            r'_(F1|F2).nc$'
         self.assertListEqual(mock_set.mock_calls,
                              [mock.call(os.getcwd(), pattern)])
         self.assertListEqual(mock_mv.mock_calls,
@@ -847,7 +1023,7 @@ class ArchiveTests(unittest.TestCase):
                 self.model.prepare_archive()
 
         pattern = r'.*_runid[a-z]+_(1m|1s|1y)_' \
-                  '\d{4}\d{2}\d{2}-\d{4}\d{2}\d{2}.nc'
+                  '\d{4}\d{2}\d{2}-\d{4}\d{2}\d{2}.nc$'
         self.assertListEqual(mock_set.mock_calls,
                              [mock.call(os.getcwd(), pattern)])
 
@@ -859,6 +1035,36 @@ class ArchiveTests(unittest.TestCase):
              mock.call(fname.format('1s', 1), 'DiagDir'),
              mock.call(fname.format('1s', 2), 'DiagDir')])
 
+    @mock.patch('modeltemplate.shutil.copy2')
+    def test_prep_archive_means_fcycle_running(self, mock_cp):
+        '''Test prepare_archive - final cycle with running mean present'''
+        func.logtest('Assert running mean accumulators are not archived:')
+        meanfile = 'model_runidx_1s_19800901-19801201.nc'
+        accumfile = 'model_runidx_1y_19791201-19801201.nc' + \
+            modeltemplate.climatemean.RUNNING_MEAN_EXT
+        for fname in [meanfile, accumfile]:
+            open(fname, 'w').close()
+        self.model.diagsdir = 'DiagDir'
+        self.model.periodfiles = mock.Mock(side_effect=[[]])
+        self.model.naml.archiving.archive_means = True
+        self.model.suite.finalcycle = True
+
+        try:
+            with mock.patch('modeltemplate.ModelTemplate.model_realm',
+                            return_value='x'):
+                with mock.patch('modeltemplate.ModelTemplate.prefix',
+                                new_callable=mock.PropertyMock,
+                                return_value='RUNID'):
+                    self.model.prepare_archive()
+        finally:
+            for fname in [meanfile, accumfile]:
+                os.remove(fname)
+
+        self.assertListEqual(
+            mock_cp.mock_calls,
+            [mock.call(os.path.join(os.getcwd(), meanfile), 'DiagDir')]
+            )
+
     @mock.patch('modeltemplate.utils.get_subset')
     def test_prep_archive_means_cpfail(self, mock_set):
         '''Test prepare_archive - final cycle with copy failure'''
@@ -878,7 +1084,7 @@ class ArchiveTests(unittest.TestCase):
                     self.model.prepare_archive()
 
         pattern = r'.*_runid[a-z]+_(1m|1s|1y)_' \
-                  '\d{4}\d{2}\d{2}-\d{4}\d{2}\d{2}.nc'
+                  '\d{4}\d{2}\d{2}-\d{4}\d{2}\d{2}.nc$'
         self.assertListEqual(mock_set.mock_calls,
                              [mock.call(os.getcwd(), pattern)])
         self.assertIn('Failed to copy', func.capture('err'))
@@ -911,8 +1117,11 @@ class ArchiveTests(unittest.TestCase):
         self.model.naml.processing.chunking_arguments = 'chunks'
 
         self.model.compress_file = mock.Mock(return_value=0)
+        self.model.is_compressed = mock.Mock(side_effect=[False, False, True])
 
-        mock_utils.add_path.return_value = ['f1', 'f2_COMPRESS_FAILED']
+        mock_utils.add_path.return_value = ['f1', 'f2_COMPRESS_FAILED', 'f3']
+        mock_utils.max_subprocesses.return_value = 4
+        mock_utils.map_concurrent.side_effect = utils.map_concurrent
 
         with mock.patch('modeltemplate.ModelTemplate.model_realm',
                         return_value='x'):
@@ -922,6 +1131,8 @@ class ArchiveTests(unittest.TestCase):
                 self.model.compress_netcdf_files('1x', 'grid')
 
         mock_rename.assert_called_once_with('f2_COMPRESS_FAILED', 'f2')
+        self.assertListEqual(self.model.is_compressed.mock_calls,
+                             [mock.call(f, 5) for f in ['f1', 'f2', 'f3']])
 
         pattern = r'component_runidx_1x_\d{4}\d{2}\d{2}-' + \
             r'\d{4}\d{2}\d{2}_grid.nc(_COMPRESS_FAILED)?$'
@@ -931,8 +1142,10 @@ class ArchiveTests(unittest.TestCase):
         call_compress = []
         for fname in ['f1', 'f2']:
             call_compress.append(mock.call(fname, 'comp_util',
+                                           check_compressed=False,
                                            compression=5, chunking='chunks'))
-        self.assertListEqual(self.model.compress_file.mock_calls, call_compress)
+        self.assertListEqual(sorted(self.model.compress_file.mock_calls),
+                             call_compress)
 
     @mock.patch('modeltemplate.utils')
     @mock.patch('modeltemplate.os.rename')
@@ -945,8 +1158,11 @@ class ArchiveTests(unittest.TestCase):
         self.model.naml.processing.chunking_arguments = 'chunks'
 
         self.model.compress_file = mock.Mock(return_value=1)
+        self.model.is_compressed = mock.Mock(return_value=False)
 
         mock_utils.add_path.return_value = ['f1']
+        mock_utils.max_subprocesses.return_value = 4
+        mock_utils.map_concurrent.side_effect = utils.map_concurrent
 
         with mock.patch('modeltemplate.ModelTemplate.model_realm',
                         return_value='x'):
@@ -964,8 +1180,75 @@ class ArchiveTests(unittest.TestCase):
 
         self.assertListEqual(self.model.compress_file.mock_calls,
                              [mock.call('f1', 'comp_util',
+                                        check_compressed=False,
                                         compression=5, chunking='chunks')])
 
+    def test_compress_concurrent(self):
+        '''Test concurrent compression of netCDF files'''
+        func.logtest('Assert concurrent compression of netCDF files:')
+        tmpdir = tempfile.mkdtemp()
+        fnames = [os.path.join(tmpdir, 'file' + str(i)) for i in range(3)]
+        for fname in fnames:
+            with open(fname, 'w') as fhandle:
+                fhandle.write('x' * 1024)
+        running = {'now': 0, 'max': 0}
+        lock = threading.Lock()
+
+        def compress(fname, *args, **kwargs):
+            ''' Halve the file size '''
+            with lock:
+                running['now'] += 1
+                running['max'] = max(running['max'], running['now'])
+            time.sleep(0.1)
+            with open(fname, 'w') as fhandle:
+                fhandle.write('x' * 512)
+            with lock:
+                running['now'] -= 1
+            return 1 if fname.endswith('2') else 0
+        self.model.compress_file = mock.Mock(side_effect=compress)
+
+        try:
+            rtn = self.model.compress_concurrent(fnames, 'nccopy', 2,
+                                                 compression=5)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        self.assertListEqual(rtn, list(zip(fnames, [0, 0, 1])))
+        self.assertEqual(running['max'], 2)
+        self.model.compress_file.assert_called_with(
+            fnames[-1], 'nccopy', check_compressed=False, compression=5
+            )
+        self.assertIn('file0 compressed in', func.capture())
+        self.assertIn('(50.0% reduction)', func.capture())
+        self.assertNotIn('file2 compressed', func.capture())
+
+    def test_compress_concurrent_fail(self):
+        '''Test concurrent compression of netCDF files - failure'''
+        func.logtest('Assert failure of concurrent compression:')
+        def compress(fname, *args, **kwargs):
+            ''' Fail f2 while f1 is in progress '''
+            if fname == 'f2':
+                raise SystemExit(99)
+            time.sleep(0.1)
+            return 0
+        self.model.compress_file = mock.Mock(side_effect=compress)
+        with self.assertRaises(SystemExit):
+            self.model.compress_concurrent(['f1', 'f2', 'f3'], 'nccopy', 2,
+                                           compression=5)
+        # f1 in progress completes, f3 is not started
+        self.assertListEqual(
+            sorted(c[1][0] for c in self.model.compress_file.mock_calls),
+            ['f1', 'f2']
+            )
+
+        self.model.compress_file = mock.Mock(side_effect=[SystemExit(99), 0])
+        with self.assertRaises(SystemExit):
+            self.model.compress_concurrent(['f1', 'f2'], 'netcdf4', 1,
+                                           compression=5)
+        self.model.compress_file.assert_called_once_with(
+            'f1', 'netcdf4', check_compressed=False, compression=5
+            )
+
     @mock.patch('modeltemplate.utils.get_subset')
     @mock.patch('modeltemplate.utils.add_path')
     @mock.patch('modeltemplate.ModelTemplate.archive_files')
@@ -1233,31 +1516,72 @@ class PreprocessTests(unittest.TestCase):
     def test_compress_file_nccopy(self):
         '''Test call to file compression method - nccopy'''
         func.logtest('Assert call to file compression method nccopy:')
-        _ = self.model.compress_file('meanfile', 'nccopy',
-                                     compression=5,
-                                     chunking=['a/1', 'b/2', 'c/3'])
+        with mock.patch('modeltemplate.netcdf_utils.deflate_level',
+                        return_value=0) as mock_dl:
+            _ = self.model.compress_file('meanfile', 'nccopy',
+                                         compression=5,
+                                         chunking=['a/1', 'b/2', 'c/3'])
 
-        self.assertListEqual(
-            self.model.suite.preprocess_file.mock_calls,
-            [mock.call('ncdump', 'meanfile', hs='', printout=False),
-             mock.ANY,      # Mock call to __contains__
-             mock.call('nccopy', 'meanfile', compression=5,
-                       chunking=['a/1', 'b/2', 'c/3'])]
-        )
+        mock_dl.assert_called_once_with('meanfile')
+        self.model.suite.preprocess_file.assert_called_once_with(
+            'nccopy', 'meanfile', compression=5,
+            chunking=['a/1', 'b/2', 'c/3']
+            )
 
     def test_compress_file_nccopy_done(self):
         '''Test call to file compression method - nccopy - already compressed'''
         func.logtest('Assert call to file compression method nccopy - no need:')
-        self.model.suite.preprocess_file.side_effect = [
-            'ncdump_rtn: time_instant:_DeflateLevel = 5 ;',
-            'nccopy_rtnval'
-            ]
-        _ = self.model.compress_file('meanfile', 'nccopy',
-                                     compression=5,
-                                     chunking=['a/1', 'b/2', 'c/3'])
+        with mock.patch('modeltemplate.netcdf_utils.deflate_level',
+                        return_value=5):
+            _ = self.model.compress_file('meanfile', 'nccopy',
+                                         compression=5,
+                                         chunking=['a/1', 'b/2', 'c/3'])
+        self.assertListEqual(self.model.suite.preprocess_file.mock_calls, [])
+        self.assertIn('already compressed', func.capture())
+
+    def test_compress_file_unreadable(self):
+        '''Test call to file compression method - unreadable file'''
+        func.logtest('Assert call to file compression method - unreadable:')
+        with mock.patch('modeltemplate.netcdf_utils.deflate_level',
+                        side_effect=IOError('No such file')):
+            _ = self.model.compress_file('meanfile', 'nccopy',
+                                         compression=5, chunking=['a/1'])
+        self.model.suite.preprocess_file.assert_called_once_with(
+            'nccopy', 'meanfile', compression=5, chunking=['a/1']
+            )
+
+    def test_compress_file_no_check(self):
+        '''Test call to file compression method - no compression check'''
+        func.logtest('Assert call to file compression method - no check:')
+        with mock.patch('modeltemplate.netcdf_utils.deflate_level') as mock_dl:
+            _ = self.model.compress_file('meanfile', 'nccopy',
+                                         check_compressed=False,
+                                         compression=5, chunking=['a/1'])
+        self.assertListEqual(mock_dl.mock_calls, [])
         self.model.suite.preprocess_file.assert_called_once_with(
-            'ncdump', 'meanfile', hs='', printout=False
+            'nccopy', 'meanfile', compression=5, chunking=['a/1']
             )
+
+    def test_compress_file_netcdf4(self):
+        '''Test call to file compression method - netcdf4'''
+        func.logtest('Assert call to file compression method netcdf4:')
+        with mock.patch('modeltemplate.netcdf_utils.deflate_level',
+                        return_value=0):
+            _ = self.model.compress_file('meanfile', 'netcdf4',
+                                         compression=5, chunking=['a/1'])
+        self.model.suite.preprocess_file.assert_called_once_with(
+            'netcdf4', 'meanfile', compression=5, chunking=['a/1']
+            )
+
+    def test_compress_file_netcdf4_done(self):
+        '''Test call to file compression method - netcdf4 - compressed'''
+        func.logtest('Assert call to file compression method netcdf4 - '
+                     'no need:')
+        with mock.patch('modeltemplate.netcdf_utils.deflate_level',
+                        return_value=5):
+            _ = self.model.compress_file('meanfile', 'netcdf4',
+                                         compression=5, chunking=['a/1'])
+        self.assertListEqual(self.model.suite.preprocess_file.mock_calls, [])
         self.assertIn('already compressed', func.capture())
 
     def test_compress_file_nccopy_noarg(self):